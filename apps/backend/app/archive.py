@@ -0,0 +1,200 @@
+"""Monthly partitions of ``submissions`` and archival of old months.
+
+``submissions`` is range-partitioned on ``created_at``, one partition per month
+(``submissions_YYYY_MM``) plus a default partition that only catches rows when
+no month partition exists yet. Months older than the retention period are
+rolled up into ``submission_monthly_stats``, exported as zstd-compressed NDJSON
+and then detached and dropped. The export carries the full code and output, also
+for rows whose text lives in the blob store, and blobs no remaining row
+references are deleted afterwards.
+"""
+
+import json
+import logging
+import os
+import re
+from datetime import date, datetime
+from pathlib import Path
+
+import zstandard
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .blobs import BlobStore, get_blob_store
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "submissions"
+PARTITION_NAME = re.compile(rf"^{PARENT_TABLE}_(\d{{4}})_(\d{{2}})$")
+EXPORT_BATCH_SIZE = 1000
+BLOB_FIELDS = ("code", "stdout", "stderr")
+# Blobs stored or reused this recently may belong to a submission that is still being written.
+BLOB_GC_MIN_AGE_SECONDS = 3600
+
+
+def month_start(value: date | datetime) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_{month:%Y_%m}"
+
+
+def existing_partitions(session: Session) -> dict[date, str]:
+    rows = session.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "WHERE parent.relname = :parent"
+        ),
+        {"parent": PARENT_TABLE},
+    ).scalars()
+    partitions = {}
+    for name in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def ensure_partitions(session: Session, today: date | None = None) -> list[str]:
+    """Create partitions for the current month and the configured months ahead."""
+
+    current = month_start(today or datetime.utcnow())
+    existing = existing_partitions(session)
+    created = []
+    for offset in range(get_settings().submission_partition_months_ahead + 1):
+        month = add_months(current, offset)
+        if month in existing:
+            continue
+        # Both bounds are generated dates, so formatting them into the DDL is safe.
+        session.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARENT_TABLE} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+            )
+        )
+        created.append(partition_name(month))
+    session.commit()
+    return created
+
+
+def _rollup(session: Session, name: str, month: date) -> None:
+    session.execute(
+        text(
+            f"""
+            INSERT INTO submission_monthly_stats (
+                exercise_id, month, kind, attempts, passes, avg_score,
+                median_duration_ms, p95_duration_ms
+            )
+            SELECT
+                exercise_id,
+                :month,
+                kind,
+                count(*),
+                count(*) FILTER (WHERE status = 'passed'),
+                avg(score),
+                percentile_cont(0.5) WITHIN GROUP (ORDER BY duration_ms),
+                percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms)
+            FROM {name}
+            GROUP BY exercise_id, kind
+            ON CONFLICT (exercise_id, month, kind) DO UPDATE SET
+                attempts = EXCLUDED.attempts,
+                passes = EXCLUDED.passes,
+                avg_score = EXCLUDED.avg_score,
+                median_duration_ms = EXCLUDED.median_duration_ms,
+                p95_duration_ms = EXCLUDED.p95_duration_ms
+            """
+        ),
+        {"month": month},
+    )
+
+
+def _inline_blobs(row: dict, store: BlobStore, digests: set[str]) -> None:
+    for field in BLOB_FIELDS:
+        digest = row.get(f"{field}_blob")
+        if not digest:
+            continue
+        digests.add(digest)
+        try:
+            row[field] = store.get(digest).decode()
+        except FileNotFoundError:
+            logger.warning("Blob %s of submission %s is missing; archiving its preview", digest, row.get("id"))
+
+
+def _export(session: Session, name: str, destination: Path, digests: set[str]) -> int:
+    """Write every row of partition ``name`` to ``destination`` as zstd NDJSON.
+
+    Text moved to the blob store is written in full; the digests are added to ``digests``.
+    """
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = destination.with_suffix(".tmp")
+    rows = session.execute(
+        text(f"SELECT row_to_json(archived)::text FROM {name} AS archived"),
+        execution_options={"stream_results": True, "yield_per": EXPORT_BATCH_SIZE},
+    ).scalars()
+    store = get_blob_store()
+    count = 0
+    with open(tmp_path, "wb") as handle:
+        compressor = zstandard.ZstdCompressor(level=get_settings().blob_compression_level)
+        with compressor.stream_writer(handle) as writer:
+            for line in rows:
+                row = json.loads(line)
+                _inline_blobs(row, store, digests)
+                writer.write(json.dumps(row).encode() + b"\n")
+                count += 1
+    os.replace(tmp_path, destination)
+    return count
+
+
+def _delete_unreferenced_blobs(session: Session, digests: set[str]) -> int:
+    """Delete the blobs among ``digests`` that no remaining submission references."""
+
+    if not digests:
+        return 0
+    referenced = set(
+        session.execute(
+            text(
+                f"SELECT code_blob FROM {PARENT_TABLE} WHERE code_blob = ANY(:digests) "
+                f"UNION SELECT stdout_blob FROM {PARENT_TABLE} WHERE stdout_blob = ANY(:digests) "
+                f"UNION SELECT stderr_blob FROM {PARENT_TABLE} WHERE stderr_blob = ANY(:digests)"
+            ),
+            {"digests": list(digests)},
+        ).scalars()
+    )
+    session.commit()
+    store = get_blob_store()
+    return sum(store.delete(digest, BLOB_GC_MIN_AGE_SECONDS) for digest in digests - referenced)
+
+
+def archive_partition(session: Session, month: date) -> int:
+    """Roll up, export, detach and drop one month; returns the number of rows archived."""
+
+    name = partition_name(month)
+    destination = Path(get_settings().submission_archive_path) / f"{name}.ndjson.zst"
+    digests: set[str] = set()
+    exported = _export(session, name, destination, digests)
+    _rollup(session, name, month)
+    session.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+    session.execute(text(f"DROP TABLE {name}"))
+    session.commit()
+    deleted = _delete_unreferenced_blobs(session, digests)
+    logger.info("Archived %s rows from %s to %s; deleted %s blobs", exported, name, destination, deleted)
+    return exported
+
+
+def archive_expired_partitions(session: Session, today: date | None = None) -> dict[str, int]:
+    cutoff = add_months(month_start(today or datetime.utcnow()), -get_settings().submission_retention_months)
+    return {
+        name: archive_partition(session, month)
+        for month, name in sorted(existing_partitions(session).items())
+        if month < cutoff
+    }
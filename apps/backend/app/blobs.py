@@ -0,0 +1,90 @@
+"""Content-addressed store for large submission code and output.
+
+Blobs are zstd-compressed files under ``BLOB_STORE_PATH`` named by the SHA-256
+of their uncompressed content, so identical code or output is stored once. The
+directory must be shared by the API and the Celery workers.
+
+Blobs are deleted when the submission partitions referencing them are archived
+(see :mod:`app.archive`). Storing content that is already present refreshes the
+file's mtime, and deletion skips recently touched files, so a blob that a new
+submission is about to reference is not removed from under it.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import zstandard
+
+from .config import Settings, changed_fields, get_settings, on_settings_reload
+
+
+class BlobStore:
+    def __init__(self, root: str | Path, compression_level: int = 3):
+        self.root = Path(root)
+        self.compression_level = compression_level
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / f"{digest}.zst"
+
+    def put(self, data: bytes) -> str:
+        """Store ``data`` unless it is already present; returns its SHA-256."""
+
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if path.exists():
+            try:
+                os.utime(path)
+                return digest
+            except FileNotFoundError:
+                pass
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        compressed = zstandard.ZstdCompressor(level=self.compression_level).compress(data)
+        # Written aside and renamed so concurrent writers and readers never see a partial blob.
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(compressed)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        """Return the content stored under ``digest``; raises ``FileNotFoundError`` if missing."""
+
+        return zstandard.ZstdDecompressor().decompress(self._path(digest).read_bytes())
+
+    def delete(self, digest: str, min_age_seconds: float = 0) -> bool:
+        """Remove the blob unless it was stored or reused within ``min_age_seconds``."""
+
+        path = self._path(digest)
+        try:
+            if time.time() - path.stat().st_mtime < min_age_seconds:
+                return False
+            path.unlink()
+        except FileNotFoundError:
+            return False
+        return True
+
+
+_store: BlobStore | None = None
+
+
+def get_blob_store() -> BlobStore:
+    global _store
+    if _store is None:
+        settings = get_settings()
+        _store = BlobStore(settings.blob_store_path, settings.blob_compression_level)
+    return _store
+
+
+@on_settings_reload
+def _reset_blob_store(previous: Settings, current: Settings) -> None:
+    global _store
+    if changed_fields(previous, current, "blob_"):
+        _store = None
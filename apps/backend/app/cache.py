@@ -0,0 +1,193 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, TypeVar
+
+import redis
+import redis.asyncio as aioredis
+
+from .config import Settings, changed_fields, get_settings, on_settings_reload
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_async_redis: aioredis.Redis | None = None
+_sync_redis: redis.Redis | None = None
+
+
+class LRUCache(Generic[K, V]):
+    """Thread-safe, size-bounded LRU with a per-entry TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float | None = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[K, tuple[float | None, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V, ttl_seconds: float | None = None) -> None:
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: K) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if str(key).startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def etag_for(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match.
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def get_redis() -> aioredis.Redis:
+    global _async_redis
+    if _async_redis is None:
+        _async_redis = aioredis.from_url(get_settings().redis_url)
+    return _async_redis
+
+
+def get_sync_redis() -> redis.Redis:
+    global _sync_redis
+    if _sync_redis is None:
+        _sync_redis = redis.Redis.from_url(get_settings().redis_url)
+    return _sync_redis
+
+
+async def close_redis() -> None:
+    global _async_redis
+    if _async_redis is not None:
+        client, _async_redis = _async_redis, None
+        await client.aclose()
+
+
+@on_settings_reload
+async def _reconnect_redis(previous: Settings, current: Settings) -> None:
+    global _sync_redis
+    if not changed_fields(previous, current, "redis_url"):
+        return
+    _sync_redis = None
+    await close_redis()
+
+
+class TwoTierCache:
+    """In-process LRU in front of Redis, storing serialized bytes.
+
+    Redis errors are logged and treated as misses so a cache outage never fails
+    the request that is using it.
+    """
+
+    def __init__(
+        self, namespace: str, max_entries: int, ttl_seconds: int, local_ttl_seconds: int | None = None
+    ):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        # Invalidation only reaches this process's LRU; a shorter local TTL bounds staleness elsewhere.
+        self.local: LRUCache[str, bytes] = LRUCache(max_entries, local_ttl_seconds or ttl_seconds)
+
+    def key(self, *parts: Any) -> str:
+        return ":".join([self.namespace, *(str(part) for part in parts)])
+
+    async def get(self, key: str) -> bytes | None:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        try:
+            value = await get_redis().get(key)
+        except redis.RedisError as exc:
+            logger.warning("Redis get failed for %s: %s", key, exc)
+            return None
+        if value is not None:
+            self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value: bytes) -> None:
+        self.local.set(key, value)
+        try:
+            await get_redis().set(key, value, ex=self.ttl_seconds)
+        except redis.RedisError as exc:
+            logger.warning("Redis set failed for %s: %s", key, exc)
+
+    async def delete(self, key: str) -> None:
+        self.local.delete(key)
+        try:
+            await get_redis().delete(key)
+        except redis.RedisError as exc:
+            logger.warning("Redis invalidation failed for %s: %s", key, exc)
+
+    async def delete_prefix(self, prefix: str) -> None:
+        self.local.delete_prefix(prefix)
+        try:
+            client = get_redis()
+            keys = [key async for key in client.scan_iter(match=f"{prefix}*", count=500)]
+            if keys:
+                await client.unlink(*keys)
+        except redis.RedisError as exc:
+            logger.warning("Redis invalidation failed for %s: %s", prefix, exc)
+
+    def get_sync(self, key: str) -> bytes | None:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        try:
+            value = get_sync_redis().get(key)
+        except redis.RedisError as exc:
+            logger.warning("Redis get failed for %s: %s", key, exc)
+            return None
+        if value is not None:
+            self.local.set(key, value)
+        return value
+
+    def set_sync(self, key: str, value: bytes) -> None:
+        self.local.set(key, value)
+        try:
+            get_sync_redis().set(key, value, ex=self.ttl_seconds)
+        except redis.RedisError as exc:
+            logger.warning("Redis set failed for %s: %s", key, exc)
+
+    def delete_sync(self, key: str) -> None:
+        self.local.delete(key)
+        try:
+            get_sync_redis().delete(key)
+        except redis.RedisError as exc:
+            logger.warning("Redis invalidation failed for %s: %s", key, exc)
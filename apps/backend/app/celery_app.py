@@ -11,9 +11,32 @@ celery = Celery(
     "worker",
     broker=broker_url,
     backend=result_backend,
+    include=["app.tasks"],
 )
 
-celery.conf.task_routes = {"app.tasks.*": {"queue": "default"}}
+celery.conf.task_routes = {
+    "app.tasks.run_code": {"queue": "execution"},
+    "app.tasks.submit_code": {"queue": "execution"},
+    "app.tasks.*": {"queue": "default"},
+}
+
+# Execution tasks are CPU-bound and long-running: hand each worker process one
+# task at a time. Late acknowledgement is set on those tasks only (app.tasks).
+celery.conf.worker_prefetch_multiplier = settings.celery_prefetch_multiplier
+celery.conf.task_track_started = True
+celery.conf.result_expires = settings.celery_result_expires_seconds
+celery.conf.beat_schedule = {
+    "refill-exercise-pool": {
+        "task": "app.tasks.refill_exercise_pool",
+        "schedule": settings.exercise_pool_refill_interval_seconds,
+    },
+    "maintain-submission-partitions": {
+        "task": "app.tasks.maintain_submission_partitions",
+        "schedule": settings.submission_maintenance_interval_seconds,
+    },
+}
+if settings.celery_worker_concurrency:
+    celery.conf.worker_concurrency = settings.celery_worker_concurrency
 
 
 @celery.task()
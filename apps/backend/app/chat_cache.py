@@ -0,0 +1,187 @@
+"""Cache of tutor answers so repeated questions on an exercise skip the LLM.
+
+Answers are keyed on the exercise, the normalized system prompt, a hash of the
+history sent with the question and the normalized question itself. The exact
+tier is a :class:`TwoTierCache`. When an embedding deployment is configured, a
+question that misses it is compared with recently answered questions in the
+same exercise/prompt/history scope, and the answer of the closest one above the
+similarity threshold is reused. The similarity index is per process; its
+entries only point at exact keys, so an invalidated answer stops being served
+everywhere once the other processes' local copies expire.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import re
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from .cache import LRUCache, TwoTierCache
+from .config import Settings, changed_fields, get_settings, on_settings_reload
+from .llm import create_embedding
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass(frozen=True)
+class CachedAnswer:
+    response: str
+    tokens_used: int
+
+
+@dataclass(frozen=True)
+class ChatCacheLookup:
+    """Result of :meth:`ChatResponseCache.lookup`, passed back to ``store`` on a miss."""
+
+    key: str
+    scope: str
+    embedding: list[float] | None = None
+    answer: CachedAnswer | None = None
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def normalize_question(text: str) -> str:
+    return normalize_text(text).rstrip("?!. ")
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def _unit(vector: list[float]) -> list[float]:
+    norm = math.sqrt(sum(component * component for component in vector)) or 1.0
+    return [component / norm for component in vector]
+
+
+class ChatResponseCache:
+    def __init__(self, settings: Settings):
+        self.exact = TwoTierCache(
+            "chat",
+            settings.chat_cache_max_entries,
+            settings.chat_cache_ttl_seconds,
+            local_ttl_seconds=settings.chat_cache_local_ttl_seconds,
+        )
+        self.similarity_enabled = bool(settings.azure_openai_embedding_deployment)
+        self.similarity_threshold = settings.chat_cache_similarity_threshold
+        self.similarity_max_entries = settings.chat_cache_similarity_max_entries
+        # scope -> [(unit embedding, exact key)], newest last.
+        self._vectors: LRUCache[str, list[tuple[list[float], str]]] = LRUCache(
+            settings.chat_cache_max_entries, settings.chat_cache_ttl_seconds
+        )
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+
+    def _scope(self, exercise_id: Any, messages: list[dict[str, str]]) -> str:
+        system, *history = messages[:-1]
+        context = {
+            "system": normalize_text(system["content"]),
+            "history": [[item["role"], normalize_text(item["content"])] for item in history],
+        }
+        return self.exact.key(exercise_id or "none", _digest(context))
+
+    async def _embed(self, question: str) -> list[float] | None:
+        try:
+            return _unit(await create_embedding(question))
+        except Exception as exc:  # noqa: BLE001 - the similarity tier is best effort
+            logger.warning("Embedding chat question failed: %s", exc)
+            return None
+
+    def _closest(self, scope: str, embedding: list[float]) -> str | None:
+        best_key, best_score = None, self.similarity_threshold
+        for vector, key in self._vectors.get(scope) or []:
+            score = sum(a * b for a, b in zip(vector, embedding))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    async def _hit(self, key: str) -> CachedAnswer | None:
+        raw = await self.exact.get(key)
+        return CachedAnswer(**json.loads(raw)) if raw else None
+
+    async def lookup(self, exercise_id: Any, messages: list[dict[str, str]]) -> ChatCacheLookup:
+        """Look up the answer to ``messages``, the chat prompt with the question last."""
+
+        question = normalize_question(messages[-1]["content"])
+        scope = self._scope(exercise_id, messages)
+        key = f"{scope}:{_digest(question)}"
+
+        answer = await self._hit(key)
+        if answer:
+            self.exact_hits += 1
+            self.tokens_saved += answer.tokens_used
+            return ChatCacheLookup(key, scope, answer=answer)
+
+        embedding = await self._embed(question) if self.similarity_enabled else None
+        if embedding:
+            similar_key = self._closest(scope, embedding)
+            answer = await self._hit(similar_key) if similar_key else None
+            if answer:
+                self.similar_hits += 1
+                self.tokens_saved += answer.tokens_used
+                return ChatCacheLookup(key, scope, embedding, answer)
+
+        self.misses += 1
+        return ChatCacheLookup(key, scope, embedding)
+
+    async def store(self, lookup: ChatCacheLookup, answer: CachedAnswer) -> None:
+        await self.exact.set(lookup.key, json.dumps(asdict(answer)).encode())
+        if lookup.embedding:
+            vectors = [*(self._vectors.get(lookup.scope) or []), (lookup.embedding, lookup.key)]
+            self._vectors.set(lookup.scope, vectors[-self.similarity_max_entries :])
+
+    async def invalidate(self, exercise_id: Any) -> None:
+        prefix = self.exact.key(exercise_id, "")
+        self._vectors.delete_prefix(prefix)
+        await self.exact.delete_prefix(prefix)
+
+    def stats(self) -> dict[str, Any]:
+        hits = self.exact_hits + self.similar_hits
+        lookups = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "tokens_saved": self.tokens_saved,
+            "local_entries": len(self.exact.local),
+        }
+
+
+_chat_cache: ChatResponseCache | None = None
+
+
+def get_chat_cache() -> ChatResponseCache | None:
+    global _chat_cache
+    settings = get_settings()
+    if not settings.chat_cache_enabled:
+        return None
+    if _chat_cache is None:
+        _chat_cache = ChatResponseCache(settings)
+    return _chat_cache
+
+
+@on_settings_reload
+def _reset_chat_cache(previous: Settings, current: Settings) -> None:
+    global _chat_cache
+    if changed_fields(previous, current, "chat_cache_", "azure_openai_embedding_deployment"):
+        _chat_cache = None
+
+
+async def invalidate_chat_cache(exercise_id: Any) -> None:
+    cache = get_chat_cache()
+    if cache:
+        await cache.invalidate(exercise_id)
+
+
+def chat_cache_stats() -> dict[str, Any] | None:
+    cache = get_chat_cache()
+    return cache.stats() if cache else None
@@ -1,6 +1,24 @@
-from pydantic import Field
+import inspect
+import logging
+from typing import Any, Awaitable, Callable
+
+from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings
 
+logger = logging.getLogger(__name__)
+
+
+class LLMDeployment(BaseModel):
+    """One Azure OpenAI deployment the LLM router can send requests to."""
+
+    name: str
+    endpoint: str
+    api_key: str
+    deployment: str
+    weight: float = Field(default=1.0, gt=0)
+    requests_per_minute: float | None = Field(default=None, description="Defaults to LLM_REQUESTS_PER_MINUTE")
+    tokens_per_minute: float | None = Field(default=None, description="Defaults to LLM_TOKENS_PER_MINUTE")
+
 
 class Settings(BaseSettings):
     app_name: str = Field(default="Learn Code Fast API")
@@ -8,19 +26,212 @@ class Settings(BaseSettings):
     backend_port: int = Field(default=8000)
 
     database_url: str = Field(default="postgresql+psycopg2://postgres:postgres@db:5432/app")
+    async_database_url: str | None = Field(default=None)
+    db_pool_size: int = Field(default=10)
+    db_max_overflow: int = Field(default=20)
+    db_pool_timeout_seconds: float = Field(default=30.0)
+    db_pool_recycle_seconds: int = Field(default=1800)
+    db_pool_pre_ping: bool = Field(default=True)
+    db_statement_timeout_ms: int = Field(default=15000)
     redis_url: str = Field(default="redis://redis:6379/0")
     celery_broker_url: str | None = Field(default=None)
     celery_result_backend: str | None = Field(default=None)
+    celery_prefetch_multiplier: int = Field(default=1)
+    celery_worker_concurrency: int | None = Field(default=None)
+    celery_result_expires_seconds: int = Field(default=3600)
+    job_poll_interval_seconds: float = Field(default=0.5)
+    job_pending_timeout_seconds: float = Field(
+        default=600,
+        description="Job event streams give up on a job that has stayed PENDING this long (unknown or expired id)",
+    )
+
+    chat_history_token_budget: int = Field(default=3000)
+    chat_tokenizer_encoding: str = Field(default="cl100k_base")
+    chat_summary_max_tokens: int = Field(default=250)
+    chat_summary_trigger_messages: int = Field(
+        default=6, description="Unsummarized messages outside the budget before the summary is refreshed"
+    )
+
+    exercise_pool_enabled: bool = Field(default=True)
+    exercise_pool_buckets: list[str] = Field(
+        default_factory=lambda: ["python:easy", "python:medium", "python:hard"],
+        description="Pre-generated buckets as language:difficulty[:topic]",
+    )
+    exercise_pool_target_depth: int = Field(default=10)
+    exercise_pool_low_water: int = Field(default=3)
+    exercise_pool_refill_interval_seconds: float = Field(default=300.0)
+    exercise_pool_refill_concurrency: int = Field(default=4)
+
+    metrics_enabled: bool = Field(
+        default=True, description="Server-Timing headers, query timing hooks and /metrics; read at startup"
+    )
+
+    readiness_timeout_seconds: float = Field(default=2.0, description="Budget for the database check in /ready")
+
+    batch_max_concurrency: int = Field(
+        default=8, description="Items of a batch endpoint generated or graded at the same time"
+    )
+
+    chat_cache_enabled: bool = Field(default=True)
+    chat_cache_max_entries: int = Field(default=4096)
+    chat_cache_ttl_seconds: int = Field(default=86400)
+    chat_cache_local_ttl_seconds: int = Field(
+        default=30, description="Bounds how long another process can serve an answer after it was invalidated"
+    )
+    chat_cache_similarity_threshold: float = Field(default=0.95)
+    chat_cache_similarity_max_entries: int = Field(
+        default=256, description="Embedded questions kept per exercise for the similarity tier"
+    )
+
+    blob_store_path: str = Field(
+        default="/var/lib/learn-code-fast/blobs", description="Shared by the API and the Celery workers"
+    )
+    blob_compression_level: int = Field(default=3)
+    submission_inline_bytes: int = Field(
+        default=2048, description="Larger code/output is moved to the blob store, keeping a preview inline"
+    )
+
+    submission_archive_path: str = Field(default="/var/lib/learn-code-fast/archive")
+    submission_retention_months: int = Field(
+        default=6, description="Older monthly partitions are archived and dropped"
+    )
+    submission_partition_months_ahead: int = Field(default=2)
+    submission_maintenance_interval_seconds: float = Field(default=86400.0)
+
+    exercise_cache_enabled: bool = Field(default=True)
+    exercise_cache_max_entries: int = Field(default=1024)
+    exercise_cache_ttl_seconds: int = Field(default=86400)
+    exercise_cache_local_ttl_seconds: int = Field(
+        default=30, description="Bounds how long another process can serve an exercise after it changed"
+    )
+
+    user_context_cache_enabled: bool = Field(default=True)
+    user_context_cache_max_entries: int = Field(default=4096)
+    user_context_cache_ttl_seconds: int = Field(default=3600)
+    user_context_cache_local_ttl_seconds: int = Field(
+        default=10, description="Bounds how long another process can serve a context after it changed"
+    )
+
+    result_cache_enabled: bool = Field(default=True)
+    result_cache_max_entries: int = Field(default=2048)
+    result_cache_ttl_seconds: int = Field(default=3600)
 
     azure_openai_endpoint: str | None = None
     azure_openai_api_key: str | None = None
     azure_openai_deployment: str | None = None
-    azure_openai_api_version: str | None = Field(default="2024-02-15-preview")
+    azure_openai_api_version: str | None = Field(
+        default="2024-10-21", description="Streamed usage (stream_options) needs 2024-09-01-preview or later"
+    )
+    azure_openai_embedding_deployment: str | None = Field(
+        default=None, description="Enables the similarity tier of the chat response cache"
+    )
+    azure_openai_deployments: list[LLMDeployment] = Field(
+        default_factory=list,
+        description="Deployments to route between; when empty the single AZURE_OPENAI_* deployment is used",
+    )
+
+    llm_max_connections: int = Field(default=100)
+    llm_max_keepalive_connections: int = Field(default=20)
+    llm_keepalive_expiry_seconds: float = Field(default=30.0)
+    llm_timeout_seconds: float = Field(default=60.0)
+    llm_connect_timeout_seconds: float = Field(default=5.0)
+    llm_max_retries: int = Field(default=2)
+    llm_retry_initial_delay_seconds: float = Field(default=0.5)
+    llm_retry_max_delay_seconds: float = Field(default=8.0)
+    llm_requests_per_minute: float = Field(
+        default=0, description="Per process (each API and Celery worker); 0 disables the request budget"
+    )
+    llm_tokens_per_minute: float = Field(
+        default=0, description="Per process (each API and Celery worker); 0 disables the token budget"
+    )
+    llm_deployment_limits: dict[str, dict[str, float]] = Field(
+        default_factory=dict,
+        description="Per-deployment overrides, e.g. {\"gpt-4o\": {\"requests_per_minute\": 300}}",
+    )
+    llm_max_queue_wait_seconds: float = Field(default=20.0)
+    llm_latency_ewma_alpha: float = Field(default=0.2, gt=0, le=1)
+    llm_hedge_after_seconds: float = Field(
+        default=0, description="Send a duplicate request to another deployment after this long; 0 disables"
+    )
+    llm_circuit_failure_threshold: int = Field(default=5)
+    llm_circuit_open_seconds: float = Field(default=30.0)
+
+    sandbox_pool_size: int | None = Field(default=None, description="Warm workers per language; defaults to CPU count")
+    sandbox_cpu_seconds: float = Field(default=5.0)
+    sandbox_memory_mb: int = Field(default=256)
+    sandbox_output_bytes: int = Field(default=65536)
+    sandbox_wall_timeout_seconds: float = Field(default=10.0)
+    sandbox_max_processes: int = Field(default=16)
+    sandbox_acquire_timeout_seconds: float = Field(default=30.0)
+    sandbox_interactive_timeout_seconds: float = Field(
+        default=120.0, description="Wall-clock limit for live runs, which may wait on the learner's input"
+    )
+    sandbox_uid: int | None = Field(
+        default=None, description="Unprivileged uid learner code runs as; required when the API runs as root"
+    )
+    sandbox_commands: dict[str, list[str]] = Field(
+        default_factory=dict,
+        description="Languages other than python, mapped to the command that runs {file}, "
+        "e.g. {\"javascript\": [\"node\", \"{file}\"]}; the runtime must be installed in the image",
+    )
+    sandbox_language_limits: dict[str, dict[str, float]] = Field(
+        default_factory=dict,
+        description="Per-language overrides of the sandbox limits, e.g. {\"python\": {\"pool_size\": 4}}",
+    )
 
     class Config:
         env_file = ".env"
         case_sensitive = False
 
 
+ReloadHook = Callable[[Settings, Settings], Awaitable[None] | None]
+
+_settings: Settings | None = None
+_reload_hooks: list[ReloadHook] = []
+
+
 def get_settings() -> Settings:
-    return Settings()
+    """Return the process-wide settings, read from the environment and ``.env`` once."""
+
+    global _settings
+    if _settings is None:
+        _settings = Settings()
+    return _settings
+
+
+def on_settings_reload(hook: ReloadHook) -> ReloadHook:
+    """Register ``hook(previous, current)`` to rebuild whatever depends on changed settings."""
+
+    _reload_hooks.append(hook)
+    return hook
+
+
+def changed_fields(previous: Settings, current: Settings, *prefixes: str) -> set[str]:
+    """Names of fields that differ, optionally limited to those starting with ``prefixes``."""
+
+    return {
+        name
+        for name in Settings.model_fields
+        if name.startswith(prefixes or "") and getattr(previous, name) != getattr(current, name)
+    }
+
+
+async def reload_settings() -> Settings:
+    """Re-read the environment and ``.env`` (e.g. on SIGHUP after rotating keys)."""
+
+    global _settings
+    previous, current = get_settings(), Settings()
+    _settings = current
+    changed = changed_fields(previous, current)
+    logger.info("Settings reloaded; changed: %s", ", ".join(sorted(changed)) or "nothing")
+    if not changed:
+        return current
+
+    for hook in _reload_hooks:
+        try:
+            result: Any = hook(previous, current)
+            if inspect.isawaitable(result):
+                await result
+        except Exception:  # noqa: BLE001 - one failing hook must not block the others
+            logger.exception("Settings reload hook %s failed", getattr(hook, "__qualname__", hook))
+    return current
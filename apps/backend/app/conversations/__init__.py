@@ -0,0 +1,5 @@
+"""Server-side tutor conversations with token-budgeted history."""
+
+from .router import router
+
+__all__ = ["router"]
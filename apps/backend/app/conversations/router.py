@@ -0,0 +1,49 @@
+import uuid
+
+from fastapi import APIRouter, Depends, Path, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..db import get_async_session
+from .schemas import ConversationCreate, ConversationResponse
+from .service import (
+    conversation_response,
+    create_conversation,
+    delete_conversation,
+    get_conversation_or_404,
+)
+
+router = APIRouter(prefix="/chat/conversations", tags=["chat"])
+
+
+@router.post(
+    "",
+    summary="Start a server-side conversation",
+    response_model=ConversationResponse,
+    status_code=status.HTTP_201_CREATED,
+)
+async def start_conversation(
+    payload: ConversationCreate, session: AsyncSession = Depends(get_async_session)
+) -> ConversationResponse:
+    conversation = await create_conversation(session, payload)
+    return conversation_response(conversation)
+
+
+@router.get("/{conversation_id}", summary="Get a conversation", response_model=ConversationResponse)
+async def read_conversation(
+    conversation_id: uuid.UUID = Path(..., description="Conversation identifier"),
+    session: AsyncSession = Depends(get_async_session),
+) -> ConversationResponse:
+    conversation = await get_conversation_or_404(session, conversation_id)
+    return conversation_response(conversation)
+
+
+@router.delete(
+    "/{conversation_id}", summary="Delete a conversation", status_code=status.HTTP_204_NO_CONTENT
+)
+async def remove_conversation(
+    conversation_id: uuid.UUID = Path(..., description="Conversation identifier"),
+    session: AsyncSession = Depends(get_async_session),
+) -> Response:
+    conversation = await get_conversation_or_404(session, conversation_id)
+    await delete_conversation(session, conversation)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
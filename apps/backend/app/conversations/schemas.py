@@ -0,0 +1,19 @@
+import uuid
+from datetime import datetime
+
+from pydantic import BaseModel, Field
+
+from ..schemas import ConversationMessage
+
+
+class ConversationCreate(BaseModel):
+    exercise_id: uuid.UUID | None = Field(default=None, description="Exercise the conversation is about")
+
+
+class ConversationResponse(BaseModel):
+    id: uuid.UUID
+    exercise_id: uuid.UUID | None = None
+    summary: str | None = Field(default=None, description="Rolling summary of turns no longer sent in full")
+    messages: list[ConversationMessage] = Field(default_factory=list)
+    created_at: datetime
+    updated_at: datetime
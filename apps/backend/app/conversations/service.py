@@ -0,0 +1,182 @@
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+
+from ..config import get_settings
+from ..db import async_session_scope
+from ..models import ChatMessage, Conversation, Exercise
+from ..schemas import ConversationMessage
+from ..tokens import count_message_tokens, count_tokens
+from .schemas import ConversationCreate, ConversationResponse
+
+HISTORY_ROLES = {"user", "assistant", "system"}
+
+Summarizer = Callable[[str | None, list[dict[str, str]]], str]
+
+
+@dataclass(frozen=True)
+class PromptHistory:
+    """History to send with the next turn.
+
+    ``overflow`` counts unsummarized messages that no longer fit the budget and
+    were dropped from the prompt; they are folded into the summary later.
+    """
+
+    messages: list[dict[str, str]] = field(default_factory=list)
+    summary: str | None = None
+    overflow: int = 0
+
+
+def fit_history(token_counts: list[int], budget: int) -> int:
+    """Return the index of the oldest message that fits when keeping the newest ones."""
+
+    used = 0
+    start = len(token_counts)
+    for index in range(len(token_counts) - 1, -1, -1):
+        if used + token_counts[index] > budget:
+            break
+        used += token_counts[index]
+        start = index
+    return start
+
+
+def _history_budget(message: str, summary_tokens: int = 0) -> int:
+    settings = get_settings()
+    return settings.chat_history_token_budget - count_message_tokens(message) - summary_tokens
+
+
+def trim_history(history: Iterable[ConversationMessage], message: str) -> PromptHistory:
+    """Fit client-supplied history into the token budget, keeping the newest turns."""
+
+    items = [item for item in history if item.role in HISTORY_ROLES]
+    start = fit_history([count_message_tokens(item.content) for item in items], _history_budget(message))
+    return PromptHistory(
+        messages=[{"role": item.role, "content": item.content} for item in items[start:]],
+        overflow=start,
+    )
+
+
+def prompt_history(conversation: Conversation, message: str) -> PromptHistory:
+    pending = conversation.messages[conversation.summarized_count :]
+    budget = _history_budget(message, conversation.summary_tokens)
+    start = fit_history([item.token_count for item in pending], budget)
+    return PromptHistory(
+        messages=[{"role": item.role, "content": item.content} for item in pending[start:]],
+        summary=conversation.summary,
+        overflow=start,
+    )
+
+
+def conversation_response(conversation: Conversation) -> ConversationResponse:
+    return ConversationResponse(
+        id=conversation.id,
+        exercise_id=conversation.exercise_id,
+        summary=conversation.summary,
+        messages=[
+            ConversationMessage(role=item.role, content=item.content) for item in conversation.messages
+        ],
+        created_at=conversation.created_at,
+        updated_at=conversation.updated_at,
+    )
+
+
+async def create_conversation(session: AsyncSession, payload: ConversationCreate) -> Conversation:
+    if payload.exercise_id and not await session.get(Exercise, payload.exercise_id):
+        raise HTTPException(status_code=404, detail="Exercise not found")
+    conversation = Conversation(exercise_id=payload.exercise_id, messages=[])
+    session.add(conversation)
+    await session.commit()
+    return conversation
+
+
+async def get_conversation_or_404(session: AsyncSession, conversation_id: uuid.UUID) -> Conversation:
+    conversation = await session.get(
+        Conversation, conversation_id, options=[selectinload(Conversation.messages)]
+    )
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return conversation
+
+
+async def delete_conversation(session: AsyncSession, conversation: Conversation) -> None:
+    await session.delete(conversation)
+    await session.commit()
+
+
+async def _append_message(
+    session: AsyncSession, conversation_id: uuid.UUID, role: str, content: str
+) -> None:
+    # Serializes concurrent turns on the conversation until commit, so each gets its own position.
+    await session.execute(select(Conversation.id).where(Conversation.id == conversation_id).with_for_update())
+    position = await session.scalar(
+        select(func.coalesce(func.max(ChatMessage.position) + 1, 0)).where(
+            ChatMessage.conversation_id == conversation_id
+        )
+    )
+    session.add(
+        ChatMessage(
+            conversation_id=conversation_id,
+            position=position,
+            role=role,
+            content=content,
+            token_count=count_message_tokens(content),
+        )
+    )
+
+
+async def start_turn(
+    session: AsyncSession, conversation: Conversation, message: str
+) -> tuple[PromptHistory, Callable[[str], Awaitable[None]]]:
+    """Record the learner's message and return the prompt history plus a reply recorder.
+
+    The recorder opens its own session because it runs after the response has
+    started streaming, when the request's session is already closed.
+    """
+
+    history = prompt_history(conversation, message)
+    await _append_message(session, conversation.id, "user", message)
+    await session.commit()
+    conversation_id = conversation.id
+
+    async def record_reply(content: str) -> None:
+        if not content:
+            return
+        async with async_session_scope() as reply_session:
+            await _append_message(reply_session, conversation_id, "assistant", content)
+        if history.overflow >= get_settings().chat_summary_trigger_messages:
+            from ..tasks import summarize_conversation_task
+
+            summarize_conversation_task.delay(str(conversation_id))
+
+    return history, record_reply
+
+
+def summarize_conversation_sync(
+    session: Session, conversation_id: uuid.UUID, summarize: Summarizer
+) -> int:
+    """Fold messages that no longer fit the budget into the rolling summary.
+
+    Returns the number of messages folded.
+    """
+
+    conversation = session.get(Conversation, conversation_id)
+    if conversation is None:
+        return 0
+    pending = conversation.messages[conversation.summarized_count :]
+    budget = get_settings().chat_history_token_budget - conversation.summary_tokens
+    start = fit_history([item.token_count for item in pending], budget)
+    if start == 0:
+        return 0
+
+    folded = [{"role": item.role, "content": item.content} for item in pending[:start]]
+    summary = summarize(conversation.summary, folded)
+    conversation.summary = summary
+    conversation.summary_tokens = count_tokens(summary)
+    conversation.summarized_count += start
+    session.commit()
+    return start
@@ -1,15 +1,70 @@
 import contextlib
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
-from .config import get_settings
+from .config import Settings, changed_fields, get_settings, on_settings_reload
 
-settings = get_settings()
 
-engine = create_engine(settings.database_url, future=True)
+def _pool_options(settings: Settings) -> dict:
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def async_database_url(settings: Settings) -> str:
+    if settings.async_database_url:
+        return settings.async_database_url
+    url = make_url(settings.database_url)
+    return url.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+def _build_engine(settings: Settings):
+    return create_engine(
+        settings.database_url,
+        future=True,
+        connect_args={"options": f"-c statement_timeout={settings.db_statement_timeout_ms}"},
+        **_pool_options(settings),
+    )
+
+
+def _build_async_engine(settings: Settings):
+    return create_async_engine(
+        async_database_url(settings),
+        connect_args={"server_settings": {"statement_timeout": str(settings.db_statement_timeout_ms)}},
+        **_pool_options(settings),
+    )
+
+
+engine = _build_engine(get_settings())
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
+async_engine = _build_async_engine(get_settings())
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+
+@on_settings_reload
+async def _rebuild_engines(previous: Settings, current: Settings) -> None:
+    global engine, async_engine
+    if not changed_fields(previous, current, "database_url", "async_database_url", "db_"):
+        return
+    old_engine, old_async_engine = engine, async_engine
+    engine, async_engine = _build_engine(current), _build_async_engine(current)
+    SessionLocal.configure(bind=engine)
+    AsyncSessionLocal.configure(bind=async_engine)
+    # Checked-out connections are not closed; they are discarded when returned.
+    old_engine.dispose()
+    await old_async_engine.dispose()
+
+
 Base = declarative_base()
 
 
@@ -21,6 +76,11 @@ def get_session():
         session.close()
 
 
+async def get_async_session():
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
 @contextlib.contextmanager
 def session_scope():
     session = SessionLocal()
@@ -32,3 +92,14 @@ def session_scope():
         raise
     finally:
         session.close()
+
+
+@contextlib.asynccontextmanager
+async def async_session_scope():
+    async with AsyncSessionLocal() as session:
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
@@ -0,0 +1,176 @@
+"""Stock of pre-generated exercises so /exercises/generate rarely waits on the LLM.
+
+Each configured ``language:difficulty[:topic]`` bucket is a Redis list of
+validated exercise payloads. The API pops from it in O(1) and asks a Celery
+worker to top it up when it drops below the low-water mark; Celery beat also
+refills every bucket periodically.
+"""
+
+import json
+import logging
+import time
+
+import redis
+from starlette.concurrency import run_in_threadpool
+
+from .cache import get_redis, get_sync_redis
+from .config import get_settings
+from .schemas import ExerciseRequest
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "exercise_pool"
+STATS_KEY = f"{KEY_PREFIX}:stats"
+REFILL_LOCK_SECONDS = 300
+
+
+def _normalize_topic(topic: str | None) -> str:
+    return (topic or "").strip().lower()
+
+
+def bucket_name(language: str, difficulty: str, topic: str | None) -> str:
+    parts = [language.strip().lower(), difficulty]
+    if _normalize_topic(topic):
+        parts.append(_normalize_topic(topic))
+    return ":".join(parts)
+
+
+def configured_buckets() -> list[str]:
+    return [bucket.strip().lower() for bucket in get_settings().exercise_pool_buckets]
+
+
+def bucket_request(bucket: str) -> ExerciseRequest:
+    language, difficulty, *topic = bucket.split(":", 2)
+    return ExerciseRequest(language=language, difficulty=difficulty, topic=topic[0] if topic else None)
+
+
+def _list_key(bucket: str) -> str:
+    return f"{KEY_PREFIX}:{bucket}"
+
+
+def _lock_key(bucket: str) -> str:
+    return f"{KEY_PREFIX}:refilling:{bucket}"
+
+
+def is_valid_exercise(payload: dict, request: ExerciseRequest) -> bool:
+    """Whether a generated exercise is complete and matches the bucket it would be served from."""
+
+    required = ("title", "prompt_markdown", "starter_code")
+    if any(not isinstance(payload.get(field), str) or not payload[field].strip() for field in required):
+        return False
+    if payload.get("difficulty") != request.difficulty:
+        return False
+    topic = _normalize_topic(request.topic)
+    if topic and _normalize_topic(str(payload.get("topic") or "")) != topic:
+        return False
+    return str(payload.get("language", "")).lower() == request.language.lower()
+
+
+async def take_exercise(request: ExerciseRequest) -> dict | None:
+    """Pop a stocked exercise for the request's bucket, or ``None`` when it is empty."""
+
+    settings = get_settings()
+    bucket = bucket_name(request.language, request.difficulty, request.topic)
+    if not settings.exercise_pool_enabled or bucket not in configured_buckets():
+        return None
+
+    client = get_redis()
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.lpop(_list_key(bucket))
+            pipe.llen(_list_key(bucket))
+            raw, remaining = await pipe.execute()
+        await client.hincrby(STATS_KEY, "hits" if raw else "misses", 1)
+        if remaining < settings.exercise_pool_low_water:
+            await _request_refill(client, bucket)
+    except redis.RedisError as exc:
+        logger.warning("Exercise pool unavailable: %s", exc)
+        return None
+
+    return json.loads(raw) if raw else None
+
+
+async def _request_refill(client, bucket: str) -> None:
+    # The lock doubles as a de-duplication flag so a burst of pops enqueues one refill.
+    if await client.set(_lock_key(bucket), "queued", nx=True, ex=REFILL_LOCK_SECONDS):
+        from .tasks import refill_exercise_bucket
+
+        # Publishing to the broker is a blocking call.
+        await run_in_threadpool(refill_exercise_bucket.delay, bucket)
+
+
+def refill_bucket(bucket: str, generate) -> int:
+    """Top ``bucket`` up to the target depth; returns how many exercises were added.
+
+    ``generate(request, count)`` must return a list of exercise payloads (or
+    exceptions for failed generations).
+    """
+
+    settings = get_settings()
+    client = get_sync_redis()
+    request = bucket_request(bucket)
+    if client.set(_lock_key(bucket), "running", ex=REFILL_LOCK_SECONDS, get=True) == b"running":
+        return 0
+    try:
+        missing = settings.exercise_pool_target_depth - client.llen(_list_key(bucket))
+        if missing <= 0:
+            return 0
+
+        start = time.perf_counter()
+        added = 0
+        while missing > 0:
+            batch = min(missing, settings.exercise_pool_refill_concurrency)
+            results = generate(request, batch)
+            valid = [
+                json.dumps(payload)
+                for payload in results
+                if isinstance(payload, dict) and is_valid_exercise(payload, request)
+            ]
+            if valid:
+                client.rpush(_list_key(bucket), *valid)
+            added += len(valid)
+            missing -= batch
+            if len(valid) < batch:
+                logger.warning("Discarded %s invalid exercises for %s", batch - len(valid), bucket)
+
+        elapsed_ms = int((time.perf_counter() - start) * 1000)
+        with client.pipeline(transaction=False) as pipe:
+            pipe.hincrby(STATS_KEY, "refills", 1)
+            pipe.hincrby(STATS_KEY, "refilled_exercises", added)
+            pipe.hincrby(STATS_KEY, "refill_ms_total", elapsed_ms)
+            pipe.hset(STATS_KEY, "last_refill_ms", elapsed_ms)
+            pipe.execute()
+        return added
+    finally:
+        client.delete(_lock_key(bucket))
+
+
+async def pool_stats() -> dict:
+    client = get_redis()
+    buckets = configured_buckets()
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            for bucket in buckets:
+                pipe.llen(_list_key(bucket))
+            pipe.hgetall(STATS_KEY)
+            *depths, raw_stats = await pipe.execute()
+    except redis.RedisError as exc:
+        logger.warning("Exercise pool unavailable: %s", exc)
+        return {"available": False, "target_depth": get_settings().exercise_pool_target_depth}
+
+    stats = {key.decode(): int(value) for key, value in raw_stats.items()}
+    hits = stats.get("hits", 0)
+    misses = stats.get("misses", 0)
+    refills = stats.get("refills", 0)
+    return {
+        "available": True,
+        "depth": dict(zip(buckets, depths)),
+        "target_depth": get_settings().exercise_pool_target_depth,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+        "refills": refills,
+        "refilled_exercises": stats.get("refilled_exercises", 0),
+        "avg_refill_ms": stats["refill_ms_total"] // refills if refills else None,
+        "last_refill_ms": stats.get("last_refill_ms"),
+    }
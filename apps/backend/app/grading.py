@@ -0,0 +1,162 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable
+
+from .config import get_settings
+from .metrics import record
+from .sandbox import ExecutionResult, get_sandbox_pool
+from .sandbox.pool import language_limits
+from .schemas import ExerciseTestCase, RunResult, SubmissionDetails, TestCaseResult
+
+ProgressCallback = Callable[..., None]
+
+MESSAGE_PREVIEW_CHARS = 200
+
+# Used when an exercise has no tests: the submission only needs to run cleanly.
+IMPLICIT_TEST = ExerciseTestCase(name="runs without errors")
+
+
+@dataclass(frozen=True)
+class GradeReport:
+    status: str
+    score: float
+    details: SubmissionDetails
+    run_result: RunResult
+
+
+def _normalize_output(text: str) -> str:
+    return "\n".join(line.rstrip() for line in text.strip().splitlines())
+
+
+def _preview(text: str) -> str:
+    if len(text) > MESSAGE_PREVIEW_CHARS:
+        return repr(text[:MESSAGE_PREVIEW_CHARS] + "...")
+    return repr(text)
+
+
+def _evaluate(index: int, case: ExerciseTestCase, execution: ExecutionResult) -> TestCaseResult:
+    name = case.name or f"test {index + 1}"
+    if not execution.succeeded:
+        message = f"Program ended with {execution.outcome} (exit code {execution.exit_code})"
+        return TestCaseResult(
+            name=name,
+            status="failed",
+            duration_ms=execution.duration_ms,
+            outcome=execution.outcome,
+            message=message,
+        )
+
+    if case.expected_stdout is None or _normalize_output(execution.stdout) == _normalize_output(
+        case.expected_stdout
+    ):
+        return TestCaseResult(
+            name=name, status="passed", duration_ms=execution.duration_ms, outcome=execution.outcome
+        )
+
+    message = "Output did not match the expected output"
+    if not case.hidden:
+        message = f"Expected {_preview(case.expected_stdout)}, got {_preview(execution.stdout)}"
+    return TestCaseResult(
+        name=name,
+        status="failed",
+        duration_ms=execution.duration_ms,
+        outcome=execution.outcome,
+        message=message,
+    )
+
+
+def grade_submission(
+    language: str,
+    code: str,
+    tests: list[ExerciseTestCase],
+    fail_fast: bool = False,
+    progress: ProgressCallback | None = None,
+) -> GradeReport:
+    """Run every test case concurrently across the sandbox pool and score the submission.
+
+    Wall-clock time is bounded by the slowest test rather than the sum, as long as
+    the language pool has a worker per test. With ``fail_fast`` the first failing
+    test stops any case that has not started yet; those are reported as skipped.
+    """
+
+    cases = tests or [IMPLICIT_TEST]
+    pool = get_sandbox_pool()
+    stop = threading.Event()
+    executions: list[ExecutionResult | None] = [None] * len(cases)
+    results: list[TestCaseResult | None] = [None] * len(cases)
+
+    def run_case(index: int) -> ExecutionResult | None:
+        if stop.is_set():
+            return None
+        return pool.execute(language, code, cases[index].stdin)
+
+    max_workers = min(len(cases), language_limits(get_settings(), language.lower()).pool_size)
+    start = time.perf_counter()
+    completed = 0
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="grader") as executor:
+        futures = {executor.submit(run_case, index): index for index in range(len(cases))}
+        try:
+            for future in as_completed(futures):
+                execution = future.result()
+                if execution is None:
+                    continue
+                index = futures[future]
+                executions[index] = execution
+                results[index] = _evaluate(index, cases[index], execution)
+                completed += 1
+                if progress:
+                    progress("testing", current=completed, total=len(cases))
+                if fail_fast and results[index].status == "failed":
+                    stop.set()
+        except BaseException:
+            stop.set()
+            raise
+    elapsed = time.perf_counter() - start
+    record("sandbox", elapsed)
+    duration_ms = int(elapsed * 1000)
+
+    test_results = [
+        result or TestCaseResult(name=case.name or f"test {index + 1}", status="skipped")
+        for index, (case, result) in enumerate(zip(cases, results))
+    ]
+    passed = sum(result.status == "passed" for result in test_results)
+    failed = sum(result.status == "failed" for result in test_results)
+    skipped = len(test_results) - passed - failed
+    details = SubmissionDetails(
+        tests_run=passed + failed,
+        tests_failed=failed,
+        tests_skipped=skipped,
+        tests=test_results,
+    )
+
+    ran = [execution for execution in executions if execution is not None]
+    failures = [executions[index] for index, result in enumerate(test_results) if result.status == "failed"]
+    # Output from hidden tests is never echoed back to the learner.
+    visible = [
+        (executions[index], result.status)
+        for index, result in enumerate(test_results)
+        if executions[index] is not None and not cases[index].hidden
+    ]
+    shown = next((execution for execution, status in visible if status == "failed"), None)
+    if shown is None and visible:
+        shown = visible[0][0]
+    representative = failures[0] if failures else ran[0]
+    run_result = RunResult(
+        stdout=shown.stdout if shown else "",
+        stderr=shown.stderr if shown else "",
+        duration_ms=duration_ms,
+        exit_code=representative.exit_code,
+        outcome=representative.outcome,
+        peak_memory_kb=max(execution.peak_memory_kb for execution in ran),
+        truncated=any(execution.truncated for execution in ran),
+    )
+
+    status = "passed" if passed == len(test_results) else "failed"
+    return GradeReport(
+        status=status,
+        score=round(passed / len(test_results), 2),
+        details=details,
+        run_result=run_result,
+    )
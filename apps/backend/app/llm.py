@@ -0,0 +1,491 @@
+import asyncio
+import random
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Hashable
+
+from .config import LLMDeployment, Settings, changed_fields, get_settings, on_settings_reload
+from .llm_router import DeploymentRouter, DeploymentState, LLMUnavailable
+from .metrics import llm_call, record
+
+if TYPE_CHECKING:
+    # Imported on first use: the SDK and httpx take longer to import than the rest of the app.
+    from openai import AsyncAzureOpenAI
+
+# Deployment name -> client; each deployment may live on its own resource.
+_clients: dict[str, "AsyncAzureOpenAI"] = {}
+_router: DeploymentRouter | None = None
+_closing: set[asyncio.Task] = set()
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+CHARS_PER_TOKEN = 4
+
+
+class LLMQueueTimeout(RuntimeError):
+    """Raised when a request waited longer than allowed for rate-limit capacity."""
+
+    def __init__(self, deployment: str, waited_seconds: float):
+        super().__init__(f"LLM deployment {deployment} is saturated")
+        self.deployment = deployment
+        self.waited_seconds = waited_seconds
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute token buckets for one deployment.
+
+    Callers queue in FIFO order for up to ``max_wait_seconds`` instead of being
+    rejected. Token usage is reserved up front from an estimate and reconciled
+    with the real usage once the response is known. The budgets are per process
+    and outlive the event loop, so Celery tasks that each run their own loop
+    still share them.
+    """
+
+    def __init__(
+        self,
+        deployment: str,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_wait_seconds: float,
+    ):
+        self.deployment = deployment
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait_seconds = max_wait_seconds
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.waiting = 0
+        self.admitted = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(
+                self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60
+            )
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _delay_for(self, tokens: int) -> float:
+        delay = 0.0
+        if self.requests_per_minute and self._requests < 1:
+            delay = max(delay, (1 - self._requests) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute:
+            # A single request larger than the whole budget only waits for a full bucket.
+            needed = min(tokens, self.tokens_per_minute)
+            if self._tokens < needed:
+                delay = max(delay, (needed - self._tokens) * 60 / self.tokens_per_minute)
+        return delay
+
+    async def acquire(self, tokens: int) -> float:
+        """Wait until the request fits in both budgets; returns the seconds spent waiting."""
+
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # The lock binds to the loop it first waits on; each asyncio.run gets a new one.
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    self._refill()
+                    delay = self._delay_for(tokens)
+                    if delay == 0:
+                        break
+                    if time.monotonic() - start + delay > self.max_wait_seconds:
+                        self.timeouts += 1
+                        raise LLMQueueTimeout(self.deployment, time.monotonic() - start)
+                    await asyncio.sleep(delay)
+                if self.requests_per_minute:
+                    self._requests -= 1
+                if self.tokens_per_minute:
+                    self._tokens -= tokens
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - start
+        self.admitted += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        return waited
+
+    def has_capacity(self, tokens: int) -> bool:
+        """Whether a request of ``tokens`` would be admitted right now without queueing."""
+
+        self._refill()
+        return not self.waiting and self._delay_for(tokens) == 0
+
+    def reconcile(self, reserved_tokens: int, used_tokens: int) -> None:
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + reserved_tokens - used_tokens)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "deployment": self.deployment,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 3),
+            "wait_seconds_avg": round(self.wait_seconds_total / self.admitted, 4) if self.admitted else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 3),
+        }
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key."""
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared += 1
+            # Shielded so one caller disconnecting does not cancel the call for the others.
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(fn())
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+
+_limiters: dict[str, RateLimiter] = {}
+
+
+def is_configured(settings: Settings) -> bool:
+    return bool(
+        settings.azure_openai_deployments
+        or (
+            settings.azure_openai_endpoint
+            and settings.azure_openai_api_key
+            and settings.azure_openai_deployment
+        )
+    )
+
+
+def configured_deployments(settings: Settings) -> list[LLMDeployment]:
+    """``AZURE_OPENAI_DEPLOYMENTS``, or the single deployment from the ``AZURE_OPENAI_*`` settings."""
+
+    if settings.azure_openai_deployments:
+        return settings.azure_openai_deployments
+    if not is_configured(settings):
+        return []
+    return [
+        LLMDeployment(
+            name=settings.azure_openai_deployment,
+            endpoint=settings.azure_openai_endpoint,
+            api_key=settings.azure_openai_api_key,
+            deployment=settings.azure_openai_deployment,
+        )
+    ]
+
+
+def _build_client(settings: Settings, deployment: LLMDeployment) -> "AsyncAzureOpenAI":
+    import httpx
+    from openai import AsyncAzureOpenAI
+
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.llm_max_connections,
+            max_keepalive_connections=settings.llm_max_keepalive_connections,
+            keepalive_expiry=settings.llm_keepalive_expiry_seconds,
+        ),
+        timeout=httpx.Timeout(
+            settings.llm_timeout_seconds,
+            connect=settings.llm_connect_timeout_seconds,
+        ),
+    )
+    return AsyncAzureOpenAI(
+        api_key=deployment.api_key,
+        api_version=settings.azure_openai_api_version,
+        azure_endpoint=deployment.endpoint,
+        http_client=http_client,
+        # Retries are handled by ``chat_completion`` so the backoff policy is configurable.
+        max_retries=0,
+    )
+
+
+def get_llm_client(deployment: LLMDeployment | None = None) -> "AsyncAzureOpenAI":
+    """Return the process-wide client for ``deployment`` (the first configured one
+    by default), creating it on first use."""
+
+    settings = get_settings()
+    if deployment is None:
+        deployment = configured_deployments(settings)[0]
+    client = _clients.get(deployment.name)
+    if client is None:
+        client = _clients[deployment.name] = _build_client(settings, deployment)
+    return client
+
+
+def get_router() -> DeploymentRouter:
+    global _router
+    if _router is None:
+        settings = get_settings()
+        _router = DeploymentRouter(
+            configured_deployments(settings),
+            alpha=settings.llm_latency_ewma_alpha,
+            failure_threshold=settings.llm_circuit_failure_threshold,
+            open_seconds=settings.llm_circuit_open_seconds,
+        )
+    return _router
+
+
+async def start_llm_client() -> None:
+    for deployment in configured_deployments(get_settings()):
+        get_llm_client(deployment)
+
+
+def get_rate_limiter(deployment: str) -> RateLimiter:
+    limiter = _limiters.get(deployment)
+    if limiter is None:
+        settings = get_settings()
+        limits = {
+            "requests_per_minute": settings.llm_requests_per_minute,
+            "tokens_per_minute": settings.llm_tokens_per_minute,
+            **settings.llm_deployment_limits.get(deployment, {}),
+        }
+        for configured in settings.azure_openai_deployments:
+            if configured.name == deployment:
+                # Quotas given with the deployment itself win over LLM_DEPLOYMENT_LIMITS.
+                if configured.requests_per_minute is not None:
+                    limits["requests_per_minute"] = configured.requests_per_minute
+                if configured.tokens_per_minute is not None:
+                    limits["tokens_per_minute"] = configured.tokens_per_minute
+        limiter = RateLimiter(
+            deployment,
+            requests_per_minute=limits["requests_per_minute"],
+            tokens_per_minute=limits["tokens_per_minute"],
+            max_wait_seconds=settings.llm_max_queue_wait_seconds,
+        )
+        _limiters[deployment] = limiter
+    return limiter
+
+
+def rate_limiter_stats() -> list[dict[str, Any]]:
+    return [limiter.stats() for limiter in _limiters.values()]
+
+
+def router_stats() -> dict[str, Any] | None:
+    return _router.stats() if _router is not None else None
+
+
+def _estimate_tokens(kwargs: dict[str, Any]) -> int:
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in kwargs.get("messages", []))
+    return prompt_chars // CHARS_PER_TOKEN + int(kwargs.get("max_tokens") or 0)
+
+
+async def close_llm_client() -> None:
+    # Limiters are kept: their budgets must carry over to the next event loop.
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.close()
+
+
+async def _close_after(client: "AsyncAzureOpenAI", delay: float) -> None:
+    await asyncio.sleep(delay)
+    await client.close()
+
+
+@on_settings_reload
+def _rebuild_llm_client(previous: Settings, current: Settings) -> None:
+    global _router
+    if not changed_fields(previous, current, "azure_openai_", "llm_"):
+        return
+    _limiters.clear()
+    _router = None
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        # Requests already using the old client get until their own timeout to finish.
+        task = asyncio.get_running_loop().create_task(_close_after(client, previous.llm_timeout_seconds))
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    from openai import APIConnectionError, APIStatusError, RateLimitError
+
+    if isinstance(exc, (APIConnectionError, RateLimitError)):
+        return True
+    return isinstance(exc, APIStatusError) and exc.status_code in RETRYABLE_STATUS_CODES
+
+
+def _retry_delay(settings: Settings, attempt: int, exc: Exception) -> float:
+    from openai import APIStatusError
+
+    if isinstance(exc, APIStatusError):
+        retry_after = exc.response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), settings.llm_retry_max_delay_seconds)
+            except ValueError:
+                pass
+    delay = settings.llm_retry_initial_delay_seconds * (2**attempt)
+    delay = min(delay, settings.llm_retry_max_delay_seconds)
+    return delay * random.uniform(0.5, 1.0)
+
+
+async def chat_completion(**kwargs: Any) -> Any:
+    """Call ``chat.completions.create`` on the best available deployment.
+
+    The deployment is picked by :class:`DeploymentRouter`. A retryable failure
+    fails over to the next-best deployment straight away; backoff only applies
+    once every deployment has been tried. With ``llm_hedge_after_seconds`` set,
+    a request that has not answered by then is also sent to a second deployment
+    and the first success wins. Only the request itself is retried or hedged;
+    once a streaming response has been returned, errors while iterating it are
+    surfaced to the caller. Raises :class:`LLMUnavailable` when every
+    deployment's circuit breaker is open and :class:`LLMQueueTimeout` when the
+    chosen deployment's rate limiter has no capacity in time.
+    """
+
+    settings = get_settings()
+    router = get_router()
+    reserved_tokens = _estimate_tokens(kwargs)
+    tried: set[str] = set()
+    attempt = 0
+    while True:
+        state = _choose(router, tried, reserved_tokens)
+        if state is None:
+            raise LLMUnavailable(router.retry_after())
+        try:
+            return await _hedged(settings, router, state, kwargs, reserved_tokens)
+        except Exception as exc:
+            if attempt >= settings.llm_max_retries or not _is_retryable(exc):
+                raise
+            attempt += 1
+            tried.add(state.name)
+            if _choose(router, tried, reserved_tokens) is None:
+                # Every deployment has failed once; start over after backing off.
+                tried.clear()
+                await asyncio.sleep(_retry_delay(settings, attempt - 1, exc))
+
+
+def _choose(router: DeploymentRouter, exclude: set[str], tokens: int) -> DeploymentState | None:
+    return router.choose(exclude, has_capacity=lambda state: get_rate_limiter(state.name).has_capacity(tokens))
+
+
+async def _hedged(
+    settings: Settings, router: DeploymentRouter, primary: DeploymentState, kwargs: dict[str, Any], tokens: int
+) -> Any:
+    first = _start(primary, kwargs, tokens)
+    attempts = {first: primary}
+    winner: asyncio.Future | None = None
+    try:
+        pending = set(attempts)
+        if settings.llm_hedge_after_seconds > 0:
+            done, pending = await asyncio.wait(pending, timeout=settings.llm_hedge_after_seconds)
+            backup = None if done else router.choose({primary.name})
+            # Hedging onto a deployment that would queue only adds load.
+            if backup is not None and get_rate_limiter(backup.name).has_capacity(tokens):
+                router.hedged += 1
+                attempts[_start(backup, kwargs, tokens)] = backup
+            pending = set(attempts)
+
+        error: BaseException | None = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    if task is not first:
+                        attempts[task].hedges_won += 1
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in attempts:
+            if not task.done():
+                task.cancel()
+            elif task is not winner and not task.cancelled() and task.exception() is None and kwargs.get("stream"):
+                # Both attempts answered at once; release the losing stream's connection.
+                await task.result().close()
+
+
+def _start(state: DeploymentState, kwargs: dict[str, Any], tokens: int) -> asyncio.Task:
+    # Counted as in flight from the moment it is chosen, so a burst spreads over the deployments.
+    state.in_flight += 1
+    state.breaker.begin()
+    task = asyncio.ensure_future(_attempt(state, kwargs, tokens))
+    task.add_done_callback(lambda task: _settle(state, task))
+    return task
+
+
+def _settle(state: DeploymentState, task: asyncio.Task) -> None:
+    state.in_flight -= 1
+    if task.cancelled():
+        state.breaker.release()
+
+
+async def _attempt(state: DeploymentState, kwargs: dict[str, Any], reserved_tokens: int) -> Any:
+    limiter = get_rate_limiter(state.name)
+    ok: bool | None = None
+    try:
+        record("llm_queue", await limiter.acquire(reserved_tokens))
+        start = time.perf_counter()
+        with llm_call("chat") as call:
+            try:
+                response = await get_llm_client(state.config).chat.completions.create(
+                    **{**kwargs, "model": state.config.deployment}
+                )
+            except Exception as exc:
+                # Client errors (bad request, content filter) say nothing about the deployment's health.
+                ok = not _is_retryable(exc)
+                raise
+            ok = True
+            # Streams report usage in their last chunk; the caller counts those tokens.
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                call.tokens = usage.total_tokens
+    finally:
+        if ok is None:
+            state.breaker.release()
+        else:
+            state.observe(time.perf_counter() - start if ok else None, ok)
+    if usage is not None:
+        limiter.reconcile(reserved_tokens, usage.total_tokens)
+    return response
+
+
+async def create_embedding(text: str) -> list[float]:
+    """Embed ``text`` with the embedding deployment, under the same limits and retries."""
+
+    settings = get_settings()
+    client = get_llm_client()
+    deployment = settings.azure_openai_embedding_deployment
+    limiter = get_rate_limiter(deployment)
+    reserved_tokens = len(text) // CHARS_PER_TOKEN + 1
+    record("llm_queue", await limiter.acquire(reserved_tokens))
+
+    with llm_call("embedding") as call:
+        response = await _with_retries(settings, lambda: client.embeddings.create(model=deployment, input=text))
+        call.tokens = response.usage.total_tokens
+    limiter.reconcile(reserved_tokens, response.usage.total_tokens)
+    return response.data[0].embedding
+
+
+async def _with_retries(settings: Settings, call: Callable[[], Awaitable[Any]]) -> Any:
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as exc:
+            if attempt >= settings.llm_max_retries or not _is_retryable(exc):
+                raise
+            await asyncio.sleep(_retry_delay(settings, attempt, exc))
+            attempt += 1
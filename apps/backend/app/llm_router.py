@@ -0,0 +1,169 @@
+"""Choice of Azure OpenAI deployment for each LLM request.
+
+Every deployment keeps an exponentially weighted moving average (EWMA) of its
+latency and error rate and a circuit breaker. A request goes to the deployment
+with the lowest expected latency. That latency is scaled up by recent errors
+and by requests already in flight there, and scaled down by the deployment's
+weight. A deployment that has never answered is assumed to be as fast as the
+fastest one that has, so it gets tried early. The calls themselves, including
+hedging and failover, are made in :mod:`app.llm`.
+"""
+
+import time
+from typing import Any, Callable
+
+from .config import LLMDeployment
+
+# An error rate of 1.0 makes a deployment look this many times slower.
+ERROR_PENALTY = 10.0
+# Assumed latency while no deployment has answered yet.
+DEFAULT_LATENCY_SECONDS = 1.0
+
+
+class LLMUnavailable(RuntimeError):
+    """Raised when every deployment's circuit breaker is open."""
+
+    def __init__(self, retry_after_seconds: float):
+        super().__init__("No LLM deployment is currently available")
+        self.retry_after_seconds = retry_after_seconds
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and stays open for
+    ``open_seconds``. After that, one trial request is let through; its outcome
+    either closes the breaker or opens it again."""
+
+    def __init__(self, failure_threshold: int, open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.open_seconds else "open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.trial_in_flight)
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def begin(self) -> None:
+        if self.state == "half_open":
+            self.trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.trial_in_flight or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+    def release(self) -> None:
+        """The request ended without an outcome (e.g. it lost a hedge and was cancelled)."""
+
+        self.trial_in_flight = False
+
+
+class DeploymentState:
+    def __init__(self, config: LLMDeployment, alpha: float, breaker: CircuitBreaker):
+        self.config = config
+        self.alpha = alpha
+        self.breaker = breaker
+        self.latency_ewma: float | None = None
+        self.error_ewma = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.hedges_won = 0
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    def score(self, default_latency: float) -> float:
+        latency = self.latency_ewma if self.latency_ewma is not None else default_latency
+        return latency * (1 + ERROR_PENALTY * self.error_ewma) * (1 + self.in_flight) / self.config.weight
+
+    def observe(self, seconds: float | None, ok: bool) -> None:
+        """Fold one finished request into the averages; ``seconds`` is None for failures."""
+
+        self.requests += 1
+        self.error_ewma += self.alpha * ((0.0 if ok else 1.0) - self.error_ewma)
+        if ok:
+            self.breaker.record_success()
+            if seconds is not None and self.latency_ewma is None:
+                self.latency_ewma = seconds
+            elif seconds is not None:
+                self.latency_ewma += self.alpha * (seconds - self.latency_ewma)
+        else:
+            self.failures += 1
+            self.breaker.record_failure()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "deployment": self.config.deployment,
+            "weight": self.config.weight,
+            "circuit": self.breaker.state,
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+            "error_rate_ewma": round(self.error_ewma, 4),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "circuit_opened": self.breaker.times_opened,
+            "hedges_won": self.hedges_won,
+        }
+
+
+class DeploymentRouter:
+    def __init__(
+        self,
+        deployments: list[LLMDeployment],
+        alpha: float = 0.2,
+        failure_threshold: int = 5,
+        open_seconds: float = 30.0,
+    ):
+        self.deployments = [
+            DeploymentState(deployment, alpha, CircuitBreaker(failure_threshold, open_seconds))
+            for deployment in deployments
+        ]
+        self.hedged = 0
+
+    def choose(
+        self, exclude: set[str] = frozenset(), has_capacity: Callable[[DeploymentState], bool] | None = None
+    ) -> DeploymentState | None:
+        """Best available deployment not in ``exclude``, or None.
+
+        Deployments with rate-limit capacity right now are preferred over
+        better-scored ones that would make the request queue.
+        """
+
+        candidates = [state for state in self.deployments if state.name not in exclude and state.breaker.available()]
+        if has_capacity:
+            candidates = [state for state in candidates if has_capacity(state)] or candidates
+        if not candidates:
+            return None
+        known = [state.latency_ewma for state in self.deployments if state.latency_ewma is not None]
+        default_latency = min(known, default=DEFAULT_LATENCY_SECONDS)
+        return min(candidates, key=lambda state: state.score(default_latency))
+
+    def retry_after(self) -> float:
+        return min((state.breaker.retry_after() for state in self.deployments), default=0.0)
+
+    def stats(self) -> dict[str, Any]:
+        return {"hedged_requests": self.hedged, "deployments": [state.stats() for state in self.deployments]}
@@ -1,14 +1,27 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import math
+import signal
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 
-from .config import get_settings
-from .db import Base, engine
+from .cache import close_redis
+from . import db
+from .config import get_settings, reload_settings
+from .llm import LLMQueueTimeout, close_llm_client, start_llm_client
+from .llm_router import LLMUnavailable
+from .metrics import TimingMiddleware, install_sqlalchemy_hooks
+from .sandbox import close_sandbox_pool, start_sandbox_pool
+from .conversations import router as conversations_router
 from .routes import router as core_router
 from .user_context import router as user_context_router
 
-settings = get_settings()
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title=settings.app_name)
+app = FastAPI(title=get_settings().app_name)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,38 +29,68 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+if get_settings().metrics_enabled:
+    app.add_middleware(TimingMiddleware)
+    install_sqlalchemy_hooks()
+
+
+@app.exception_handler(LLMQueueTimeout)
+async def llm_queue_timeout_handler(request: Request, exc: LLMQueueTimeout):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "The assistant is busy, please retry shortly."},
+        headers={"Retry-After": str(max(1, int(get_settings().llm_max_queue_wait_seconds)))},
+    )
+
+
+@app.exception_handler(LLMUnavailable)
+async def llm_unavailable_handler(request: Request, exc: LLMUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "The assistant is temporarily unavailable, please retry shortly."},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after_seconds)))},
+    )
+
 
 app.include_router(core_router)
+app.include_router(conversations_router)
 app.include_router(user_context_router)
 
 
-@app.on_event("startup")
-def on_startup() -> None:
-    import time
-    from sqlalchemy.exc import OperationalError
+_reloads: set[asyncio.Task] = set()
+
+
+def _schedule_reload() -> None:
+    task = asyncio.get_running_loop().create_task(reload_settings())
+    _reloads.add(task)
+    task.add_done_callback(_reloads.discard)
 
-    max_retries = 20
-    retry_interval = 1
 
-    for i in range(max_retries):
-        try:
-            # Try to connect to verify database is ready
-            with engine.connect() as connection:
-                print("Database connection successful!")
-                break
-        except OperationalError as e:
-            if i == max_retries - 1:
-                print(f"Failed to connect to database after {max_retries} attempts. Exiting.")
-                raise e
-            print(f"Database not ready ({e}). Retrying in {retry_interval}s... ({i+1}/{max_retries})")
-            time.sleep(retry_interval)
+@app.on_event("startup")
+async def start_clients() -> None:
+    await start_llm_client()
+    await run_in_threadpool(start_sandbox_pool)
+    # SIGHUP re-reads the environment and .env, e.g. after rotating the Azure key.
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, _schedule_reload)
+    except (NotImplementedError, RuntimeError):
+        # Only possible from the main thread; embedded servers and test clients run elsewhere.
+        logger.info("SIGHUP settings reload is unavailable in this process")
+
 
-    Base.metadata.create_all(bind=engine)
+@app.on_event("shutdown")
+async def stop_clients() -> None:
+    await close_llm_client()
+    await db.async_engine.dispose()
+    await close_redis()
+    close_sandbox_pool()
 
 
 @app.get("/config", summary="Return configuration hints")
 async def read_config():
+    settings = get_settings()
     return {
         "app_name": settings.app_name,
         "environment": settings.environment,
@@ -0,0 +1,182 @@
+"""Per-request timing breakdown and Prometheus metrics.
+
+Time spent in Postgres, Azure OpenAI and the sandbox is recorded with
+:func:`record`. It is added to the current request's totals, which
+:class:`TimingMiddleware` sends as a ``Server-Timing`` header, and observed in
+the Prometheus histograms served on ``/metrics``. Recording is a
+``perf_counter`` call and a couple of dict updates, cheap enough to leave on.
+
+Metrics are per process; with several API workers each one must be scraped,
+or ``prometheus_client`` multiprocess mode configured.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+__all__ = ["CONTENT_TYPE_LATEST", "TimingMiddleware", "install_sqlalchemy_hooks", "metrics_body", "record"]
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"]
+)
+DEPENDENCY_SECONDS = Histogram(
+    "dependency_duration_seconds",
+    "Time spent in Postgres (db, db_commit), Azure OpenAI (llm, llm_queue) and the sandbox",
+    ["dependency"],
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds",
+    "Azure OpenAI calls including retries; streamed calls until the response starts",
+    ["operation", "status"],
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by Azure OpenAI", ["operation"])
+SANDBOX_EXECUTION_SECONDS = Histogram(
+    "sandbox_execution_seconds", "Single sandboxed executions", ["language", "outcome"]
+)
+
+# name -> [seconds, count] for the request being served, or None outside a request.
+_timings: ContextVar[dict[str, list[float]] | None] = ContextVar("request_timings", default=None)
+
+
+def record(name: str, seconds: float) -> None:
+    timings = _timings.get()
+    if timings is not None:
+        entry = timings.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    DEPENDENCY_SECONDS.labels(name).observe(seconds)
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+class LLMCall:
+    tokens = 0
+
+
+@contextmanager
+def llm_call(operation: str) -> Iterator[LLMCall]:
+    """Time an Azure OpenAI call; set ``tokens`` on the yielded object when usage is known."""
+
+    call = LLMCall()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield call
+    except BaseException as exc:
+        status = type(exc).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        record("llm", elapsed)
+        LLM_REQUEST_SECONDS.labels(operation, status).observe(elapsed)
+        count_llm_tokens(operation, call.tokens)
+
+
+def count_llm_tokens(operation: str, tokens: int) -> None:
+    if tokens:
+        LLM_TOKENS.labels(operation).inc(tokens)
+
+
+def observe_sandbox_execution(language: str, outcome: str, seconds: float) -> None:
+    SANDBOX_EXECUTION_SECONDS.labels(language, outcome).observe(seconds)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info.pop("query_started", None)
+    if started is not None:
+        record("db", time.perf_counter() - started)
+
+
+def _before_commit(session: Session) -> None:
+    session.info["commit_started"] = time.perf_counter()
+
+
+def _after_flush_postexec(session: Session, flush_context: Any) -> None:
+    # The flush's statements are already counted as "db"; db_commit is the COMMIT itself.
+    if "commit_started" in session.info:
+        session.info["commit_started"] = time.perf_counter()
+
+
+def _after_commit(session: Session) -> None:
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        record("db_commit", time.perf_counter() - started)
+
+
+def install_sqlalchemy_hooks() -> None:
+    """Time every statement and commit, including engines rebuilt on settings reload."""
+
+    if event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Session, "before_commit", _before_commit)
+    event.listen(Session, "after_flush_postexec", _after_flush_postexec)
+    event.listen(Session, "after_commit", _after_commit)
+
+
+def server_timing(timings: dict[str, list[float]], total_seconds: float) -> str:
+    parts = [f'{name};dur={seconds * 1000:.1f};desc="{count}x"' for name, (seconds, count) in timings.items()]
+    parts.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class TimingMiddleware:
+    """Collect the request's timings and add them as ``Server-Timing`` to the response.
+
+    The header is sent with the response start, so for streamed responses it
+    only covers the work done before the first byte.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: dict[str, list[float]] = {}
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append(
+                    "Server-Timing", server_timing(timings, time.perf_counter() - start)
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+            # Route templates, not raw paths, keep the label set bounded.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(time.perf_counter() - start)
+
+
+def metrics_body() -> bytes:
+    return generate_latest()
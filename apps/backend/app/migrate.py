@@ -0,0 +1,181 @@
+"""Schema migrations, run once per deploy instead of at API startup.
+
+    python -m app.migrate              # wait for Postgres, apply pending migrations/*.sql
+    python -m app.migrate --baseline   # record pending files as applied without running them
+
+Applied files are recorded in ``schema_migrations``. An empty database is
+created from the models and baselined, since the models already describe the
+latest schema. A database that has tables but no ``schema_migrations`` predates
+this command: files whose changes its schema already has (see ``APPLIED_IF``)
+are recorded without running, and the others are applied.
+
+Files run with autocommit, so their own BEGIN/COMMIT take effect and a file
+without them still runs as a single implicit transaction. A file using
+CONCURRENTLY cannot run inside any transaction; it is split into statements
+that run one at a time. An advisory lock keeps concurrent deploys from applying
+the same file twice.
+"""
+
+import argparse
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+
+from . import db, models
+from .archive import ensure_partitions
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+# Arbitrary pg_advisory_lock key shared by every process running migrations.
+LOCK_KEY = 7_310_042
+
+
+def _has(table: str, column: str | None = None) -> Callable[[Connection], bool]:
+    def check(connection: Connection) -> bool:
+        inspector = inspect(connection)
+        if not inspector.has_table(table):
+            return False
+        return column is None or column in {item["name"] for item in inspector.get_columns(table)}
+
+    return check
+
+
+def _has_index(name: str) -> Callable[[Connection], bool]:
+    return lambda connection: bool(connection.scalar(text("SELECT to_regclass(:name)"), {"name": name}))
+
+
+def _submissions_partitioned(connection: Connection) -> bool:
+    return bool(
+        connection.scalar(
+            text(
+                "SELECT 1 FROM pg_partitioned_table JOIN pg_class ON pg_class.oid = partrelid "
+                "WHERE relname = 'submissions'"
+            )
+        )
+    )
+
+
+# For databases that predate schema_migrations: a file counts as applied when the schema has what it
+# adds. Columns are the markers where create_all (which ran at API startup before this command) could
+# have created the table without the migration.
+APPLIED_IF: dict[str, Callable[[Connection], bool]] = {
+    "0001_submission_execution_stats.sql": _has("submissions", "peak_memory_kb"),
+    "0002_exercise_tests.sql": _has("exercises", "tests"),
+    "0003_exercise_tests_version.sql": _has("exercises", "tests_version"),
+    "0004_submission_kind.sql": _has("submissions", "kind"),
+    "0005_conversations.sql": _has("chat_messages"),
+    # CREATE INDEX CONCURRENTLY fails once 0008 has partitioned the table.
+    "0006_submission_indexes.sql": _has_index("ix_submissions_status_created_at"),
+    "0007_submission_blobs.sql": _has("submissions", "stderr_bytes"),
+    "0008_partition_submissions.sql": _submissions_partitioned,
+    "0009_submission_stats.sql": _has("submissions", "user_id"),
+    "0010_user_contexts.sql": _has("user_contexts"),
+}
+
+
+def migration_files(directory: Path = MIGRATIONS_DIR) -> list[Path]:
+    return sorted(directory.glob("*.sql"))
+
+
+def latest_migration(directory: Path = MIGRATIONS_DIR) -> str | None:
+    files = migration_files(directory)
+    return files[-1].name if files else None
+
+
+def wait_for_database(timeout_seconds: float) -> None:
+    deadline = time.monotonic() + timeout_seconds
+    while True:
+        try:
+            with db.engine.connect():
+                return
+        except OperationalError as exc:
+            if time.monotonic() >= deadline:
+                raise
+            logger.info("Database not ready, retrying: %s", exc.orig)
+            time.sleep(1)
+
+
+def _statements(sql: str) -> list[str]:
+    # Only CONCURRENTLY files are split; they hold plain DDL without semicolons in strings or bodies.
+    sql = re.sub(r"--[^\n]*", "", sql)
+    return [statement.strip() for statement in sql.split(";") if statement.strip()]
+
+
+def _apply(connection: Connection, path: Path) -> None:
+    sql = path.read_text()
+    # The raw cursor sends the file as is; ``%`` in format() calls must not be read as parameters.
+    cursor = connection.connection.cursor()
+    try:
+        for statement in _statements(sql) if "CONCURRENTLY" in sql else [sql]:
+            cursor.execute(statement)
+    finally:
+        cursor.close()
+
+
+def migrate(directory: Path = MIGRATIONS_DIR, baseline: bool = False) -> list[str]:
+    """Apply (or with ``baseline`` only record) the pending files; returns their names."""
+
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY})
+        try:
+            inspector = inspect(connection)
+            untracked = not inspector.has_table("schema_migrations")
+            if untracked:
+                if not inspector.has_table(models.Exercise.__tablename__):
+                    logger.info("Empty database: creating the schema from the models")
+                    db.Base.metadata.create_all(bind=connection)
+                    baseline = True
+                connection.execute(
+                    text(
+                        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                        "version VARCHAR(255) PRIMARY KEY, applied_at TIMESTAMP NOT NULL DEFAULT now())"
+                    )
+                )
+
+            applied = set(connection.scalars(text("SELECT version FROM schema_migrations")))
+            pending = [path for path in migration_files(directory) if path.name not in applied]
+            for path in pending:
+                if baseline:
+                    logger.info("Recording %s as applied", path.name)
+                elif untracked and path.name in APPLIED_IF and APPLIED_IF[path.name](connection):
+                    logger.info("Recording %s as applied: the schema already has its changes", path.name)
+                else:
+                    logger.info("Applying %s", path.name)
+                    _apply(connection, path)
+                connection.execute(
+                    text("INSERT INTO schema_migrations (version) VALUES (:version)"), {"version": path.name}
+                )
+            return [path.name for path in pending]
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument(
+        "--baseline", action="store_true", help="Record pending files as applied without running them"
+    )
+    parser.add_argument(
+        "--wait-seconds", type=float, default=60.0, help="How long to wait for Postgres to accept connections"
+    )
+    parser.add_argument("--dir", type=Path, default=MIGRATIONS_DIR, help="Directory holding the .sql files")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    wait_for_database(args.wait_seconds)
+    names = migrate(args.dir, args.baseline)
+    # Monthly submission partitions; the beat job keeps creating them afterwards.
+    with db.session_scope() as session:
+        created = ensure_partitions(session)
+    logger.info("Schema up to date: %s file(s) handled, %s partition(s) created", len(names), len(created))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,21 @@
 import uuid
-from datetime import datetime
+from datetime import date, datetime
 
-from sqlalchemy import DateTime, ForeignKey, Integer, Numeric, String, Text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    DDL,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    Numeric,
+    String,
+    Text,
+    event,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .db import Base
@@ -19,15 +32,29 @@ class Exercise(Base):
     language: Mapped[str] = mapped_column(String(64), nullable=False)
     prompt_markdown: Mapped[str] = mapped_column(Text, nullable=False)
     starter_code: Mapped[str] = mapped_column(Text, nullable=False)
+    tests: Mapped[list[dict]] = mapped_column(JSONB, default=list, nullable=False)
+    tests_version: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
 
     submissions: Mapped[list["Submission"]] = relationship(
-        "Submission", back_populates="exercise", cascade="all, delete-orphan"
+        "Submission", back_populates="exercise", cascade="all, delete-orphan", passive_deletes=True
     )
 
 
 class Submission(Base):
     __tablename__ = "submissions"
+    __table_args__ = (
+        # Serves per-exercise history, newest first, including the keyset cursor on (created_at, id).
+        Index(
+            "ix_submissions_exercise_id_created_at",
+            "exercise_id",
+            text("created_at DESC"),
+            text("id DESC"),
+        ),
+        Index("ix_submissions_status_created_at", "status", "created_at"),
+        # Monthly partitions are managed by app.archive; see migrations/0008.
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False
@@ -35,15 +62,138 @@ class Submission(Base):
     exercise_id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), ForeignKey("exercises.id", ondelete="CASCADE"), nullable=False
     )
+    # code/stdout/stderr hold the full text when small, otherwise a preview of the blob they reference.
     code: Mapped[str] = mapped_column(Text, nullable=False)
+    code_blob: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    code_bytes: Mapped[int | None] = mapped_column(Integer, nullable=True)
     language: Mapped[str] = mapped_column(String(64), nullable=False)
+    user_id: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    kind: Mapped[str] = mapped_column(String(16), default="run", nullable=False)
     status: Mapped[str] = mapped_column(String(32), nullable=False)
     stdout: Mapped[str] = mapped_column(Text, default="", nullable=False)
+    stdout_blob: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    stdout_bytes: Mapped[int | None] = mapped_column(Integer, nullable=True)
     stderr: Mapped[str] = mapped_column(Text, default="", nullable=False)
+    stderr_blob: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    stderr_bytes: Mapped[int | None] = mapped_column(Integer, nullable=True)
     duration_ms: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    exit_code: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    outcome: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    peak_memory_kb: Mapped[int | None] = mapped_column(Integer, nullable=True)
     score: Mapped[float | None] = mapped_column(Numeric(4, 2), nullable=True)
     tests_run: Mapped[int | None] = mapped_column(Integer, nullable=True)
     tests_failed: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    # Part of the primary key because Postgres requires the partition key in it.
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, primary_key=True, nullable=False
+    )
 
     exercise: Mapped[Exercise] = relationship("Exercise", back_populates="submissions")
+
+
+event.listen(
+    Submission.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS submissions_default PARTITION OF submissions DEFAULT"),
+)
+
+
+class SubmissionMonthlyStats(Base):
+    """Per-exercise rollup of a month of submissions, kept after the raw rows are archived."""
+
+    __tablename__ = "submission_monthly_stats"
+
+    exercise_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("exercises.id", ondelete="CASCADE"), primary_key=True
+    )
+    month: Mapped[date] = mapped_column(Date, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(16), primary_key=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False)
+    passes: Mapped[int] = mapped_column(Integer, nullable=False)
+    avg_score: Mapped[float | None] = mapped_column(Float, nullable=True)
+    median_duration_ms: Mapped[float | None] = mapped_column(Float, nullable=True)
+    p95_duration_ms: Mapped[float | None] = mapped_column(Float, nullable=True)
+
+
+class Conversation(Base):
+    __tablename__ = "conversations"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False
+    )
+    exercise_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("exercises.id", ondelete="SET NULL"), nullable=True
+    )
+    summary: Mapped[str | None] = mapped_column(Text, nullable=True)
+    summary_tokens: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    summarized_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False
+    )
+
+    messages: Mapped[list["ChatMessage"]] = relationship(
+        "ChatMessage",
+        back_populates="conversation",
+        cascade="all, delete-orphan",
+        order_by="ChatMessage.position",
+    )
+
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False
+    )
+    conversation_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    position: Mapped[int] = mapped_column(Integer, nullable=False)
+    role: Mapped[str] = mapped_column(String(16), nullable=False)
+    content: Mapped[str] = mapped_column(Text, nullable=False)
+    token_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+    conversation: Mapped[Conversation] = relationship("Conversation", back_populates="messages")
+
+
+class ExerciseStats(Base):
+    """Running submit aggregates for one exercise; see app.stats for the bucket layout."""
+
+    __tablename__ = "exercise_stats"
+
+    exercise_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("exercises.id", ondelete="CASCADE"), primary_key=True
+    )
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    passes: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    score_sum: Mapped[float] = mapped_column(Float, default=0, nullable=False)
+    score_histogram: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=False)
+    duration_histogram: Mapped[list[int]] = mapped_column(ARRAY(Integer), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class UserStats(Base):
+    __tablename__ = "user_stats"
+
+    user_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    language: Mapped[str] = mapped_column(String(64), primary_key=True)
+    difficulty: Mapped[str] = mapped_column(String(32), primary_key=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    passes: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    score_sum: Mapped[float] = mapped_column(Float, default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class UserContextRecord(Base):
+    """Persisted learner profile; see app.user_context for the fields kept in ``data``."""
+
+    __tablename__ = "user_contexts"
+
+    user_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    data: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    revision: Mapped[int] = mapped_column(Integer, default=1, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False
+    )
@@ -1,33 +1,69 @@
+import asyncio
 import uuid
 
-from fastapi import APIRouter, Body, Depends, Path
-from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Body, Depends, Header, Path, Query, Response, WebSocket, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
+from .cache import etag_for, etag_matches
 from .celery_app import echo
+from .chat_cache import chat_cache_stats, invalidate_chat_cache
 from .config import get_settings
-from .db import get_session
+from . import db
+from .db import get_async_session
+from .exercise_pool import pool_stats, take_exercise
+from .llm import rate_limiter_stats, router_stats
+from .metrics import CONTENT_TYPE_LATEST, metrics_body
+from .migrate import latest_migration
 from .schemas import (
     ChatBatchResponse,
     ChatRequest,
     CodeExecutionRequest,
+    ExerciseBatchRequest,
     ExerciseRequest,
     ExerciseResponse,
+    ExerciseStatsResponse,
+    ExerciseTestSuite,
+    JobAccepted,
+    JobStatus,
     RunResult,
+    SubmissionBatchRequest,
+    SubmissionPage,
     SubmissionResult,
+    SubmissionTextField,
 )
 from .services import (
     chat_batch_response,
     chat_stream_response,
+    delete_exercise,
+    exercise_flight_stats,
     generate_exercise,
+    generate_exercise_batch,
     get_exercise_or_404,
+    get_job_status,
+    grade_submission_batch,
+    job_event_stream,
+    list_submissions,
+    load_batch_exercises,
+    prepare_chat_turn,
+    read_submission_text,
+    replace_exercise_tests,
     run_code,
+    run_code_live,
     save_exercise,
     submit_code,
 )
+from .stats import get_exercise_stats
+from .tasks import run_code_task, submit_code_task
 
 router = APIRouter()
 
+# The newest migration this build needs; /ready waits until the database has it.
+REQUIRED_MIGRATION = latest_migration()
+
 
 @router.get("/", summary="Hello world")
 async def root():
@@ -44,25 +80,92 @@ async def health():
     return {"status": "ok"}
 
 
+async def _applied_migration() -> str | None:
+    async with db.async_engine.connect() as connection:
+        try:
+            return await connection.scalar(text("SELECT max(version) FROM schema_migrations"))
+        except ProgrammingError:
+            return None
+
+
+@router.get("/ready", summary="Readiness probe: database reachable and migrated")
+async def ready(response: Response):
+    try:
+        applied = await asyncio.wait_for(_applied_migration(), get_settings().readiness_timeout_seconds)
+    except (SQLAlchemyError, OSError, asyncio.TimeoutError):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "unavailable", "detail": "Database unreachable"}
+    if REQUIRED_MIGRATION and (applied is None or applied < REQUIRED_MIGRATION):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "unavailable", "detail": f"Waiting for migration {REQUIRED_MIGRATION}"}
+    return {"status": "ready", "migration": applied}
+
+
 @router.post("/jobs/echo", summary="Submit a hello-world task")
 async def submit_echo(message: str = Body("ping", embed=True)):
     task = echo.delay(message)
     return {"task_id": task.id, "status": task.status}
 
 
+@router.get("/jobs/{job_id}", summary="Get the status of a background job", response_model=JobStatus)
+async def read_job(job_id: str = Path(..., description="Job identifier")):
+    return await run_in_threadpool(get_job_status, job_id)
+
+
+@router.get(
+    "/jobs/{job_id}/events",
+    summary="Stream background job progress (SSE)",
+    response_class=StreamingResponse,
+)
+async def stream_job(job_id: str = Path(..., description="Job identifier")):
+    stream = await job_event_stream(job_id)
+    return StreamingResponse(stream, media_type="text/event-stream")
+
+
+@router.get("/metrics", summary="Prometheus metrics", include_in_schema=False)
+async def prometheus_metrics() -> Response:
+    if not get_settings().metrics_enabled:
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+    return Response(metrics_body(), media_type=CONTENT_TYPE_LATEST)
+
+
+@router.get("/llm/stats", summary="Outbound LLM queueing, routing and coalescing metrics")
+async def llm_stats():
+    return {
+        "deployments": rate_limiter_stats(),
+        "routing": router_stats(),
+        "coalescing": exercise_flight_stats(),
+        "chat_cache": chat_cache_stats(),
+    }
+
+
 @router.post(
     "/exercises/generate",
     summary="Generate a coding exercise",
     response_model=ExerciseResponse,
 )
 async def create_exercise(
-    payload: ExerciseRequest, session: Session = Depends(get_session)
+    payload: ExerciseRequest, session: AsyncSession = Depends(get_async_session)
 ):
-    exercise_payload = await generate_exercise(payload)
-    exercise = save_exercise(session, exercise_payload)
+    exercise_payload = await take_exercise(payload) or await generate_exercise(payload)
+    exercise = await save_exercise(session, exercise_payload)
     return ExerciseResponse.model_validate(exercise)
 
 
+@router.post(
+    "/exercises/generate:batch",
+    summary="Generate several exercises, streamed as NDJSON",
+    response_class=StreamingResponse,
+)
+async def create_exercise_batch(payload: ExerciseBatchRequest):
+    return StreamingResponse(generate_exercise_batch(payload.items), media_type="application/x-ndjson")
+
+
+@router.get("/exercises/pool/stats", summary="Pre-generated exercise pool metrics")
+async def exercise_pool_stats():
+    return await pool_stats()
+
+
 @router.get(
     "/exercises/{exercise_id}",
     summary="Retrieve an existing exercise",
@@ -70,38 +173,158 @@ async def create_exercise(
 )
 async def read_exercise(
     exercise_id: uuid.UUID = Path(..., description="Exercise identifier"),
-    session: Session = Depends(get_session),
+    if_none_match: str | None = Header(default=None),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    exercise = get_exercise_or_404(session, exercise_id)
-    return ExerciseResponse.model_validate(exercise)
+    exercise = await get_exercise_or_404(session, exercise_id)
+    body = exercise.model_dump_json(include=set(ExerciseResponse.model_fields)).encode()
+    headers = {"ETag": etag_for(body), "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+@router.get(
+    "/exercises/{exercise_id}/submissions",
+    summary="List an exercise's submissions, newest first",
+    response_model=SubmissionPage,
+    # Leaves out TEXT columns that were not requested rather than returning them as null.
+    response_model_exclude_unset=True,
+)
+async def read_submissions(
+    exercise_id: uuid.UUID = Path(..., description="Exercise identifier"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    include: list[SubmissionTextField] = Query([], description="TEXT columns to return"),
+    status_filter: str | None = Query(None, alias="status"),
+    session: AsyncSession = Depends(get_async_session),
+):
+    await get_exercise_or_404(session, exercise_id)
+    return await list_submissions(session, exercise_id, limit, cursor, include, status_filter)
+
+
+@router.get(
+    "/exercises/{exercise_id}/stats",
+    summary="Submit statistics for an exercise",
+    response_model=ExerciseStatsResponse,
+)
+async def read_exercise_stats(
+    exercise_id: uuid.UUID = Path(..., description="Exercise identifier"),
+    session: AsyncSession = Depends(get_async_session),
+):
+    await get_exercise_or_404(session, exercise_id)
+    return await get_exercise_stats(session, exercise_id)
+
+
+@router.get(
+    "/submissions/{submission_id}/{field}",
+    summary="Full code or output of a submission",
+    response_class=PlainTextResponse,
+)
+async def read_submission_field(
+    field: SubmissionTextField,
+    submission_id: uuid.UUID = Path(..., description="Submission identifier"),
+    session: AsyncSession = Depends(get_async_session),
+):
+    return PlainTextResponse(await read_submission_text(session, submission_id, field))
+
+
+@router.delete(
+    "/exercises/{exercise_id}",
+    summary="Delete an exercise and its submissions",
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def remove_exercise(
+    exercise_id: uuid.UUID = Path(..., description="Exercise identifier"),
+    session: AsyncSession = Depends(get_async_session),
+) -> Response:
+    await delete_exercise(session, exercise_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.put(
+    "/exercises/{exercise_id}/tests",
+    summary="Replace the test suite used to grade submissions",
+    response_model=ExerciseTestSuite,
+)
+async def update_exercise_tests(
+    suite: ExerciseTestSuite,
+    exercise_id: uuid.UUID = Path(..., description="Exercise identifier"),
+    session: AsyncSession = Depends(get_async_session),
+):
+    return await replace_exercise_tests(session, exercise_id, suite)
+
+
+@router.delete(
+    "/exercises/{exercise_id}/chat-cache",
+    summary="Drop cached tutor answers for an exercise",
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def clear_exercise_chat_cache(
+    exercise_id: uuid.UUID = Path(..., description="Exercise identifier"),
+) -> Response:
+    await invalidate_chat_cache(exercise_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @router.post(
     "/exercises/{exercise_id}/run",
     summary="Execute code for an exercise",
-    response_model=RunResult,
+    response_model=RunResult | JobAccepted,
 )
 async def run_exercise(
     payload: CodeExecutionRequest,
+    response: Response,
     exercise_id: uuid.UUID = Path(..., description="Exercise identifier"),
-    session: Session = Depends(get_session),
+    background: bool = Query(False, description="Enqueue the run and return a job id"),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    exercise = get_exercise_or_404(session, exercise_id)
-    return run_code(session, exercise, payload)
+    exercise = await get_exercise_or_404(session, exercise_id)
+    if background:
+        task = run_code_task.apply_async(args=[str(exercise.id), payload.model_dump()])
+        response.status_code = status.HTTP_202_ACCEPTED
+        return JobAccepted(job_id=task.id)
+    return await run_code(session, exercise, payload)
+
+
+@router.websocket("/exercises/{exercise_id}/run/live")
+async def run_exercise_live(websocket: WebSocket, exercise_id: uuid.UUID):
+    await websocket.accept()
+    await run_code_live(websocket, exercise_id)
 
 
 @router.post(
     "/exercises/{exercise_id}/submit",
     summary="Submit solution for an exercise",
-    response_model=SubmissionResult,
+    response_model=SubmissionResult | JobAccepted,
 )
 async def submit_exercise(
     payload: CodeExecutionRequest,
+    response: Response,
     exercise_id: uuid.UUID = Path(..., description="Exercise identifier"),
-    session: Session = Depends(get_session),
+    background: bool = Query(False, description="Enqueue the submission and return a job id"),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    exercise = get_exercise_or_404(session, exercise_id)
-    return submit_code(session, exercise, payload)
+    exercise = await get_exercise_or_404(session, exercise_id)
+    if background:
+        task = submit_code_task.apply_async(args=[str(exercise.id), payload.model_dump()])
+        response.status_code = status.HTTP_202_ACCEPTED
+        return JobAccepted(job_id=task.id)
+    return await submit_code(session, exercise, payload)
+
+
+@router.post(
+    "/submissions:batch-grade",
+    summary="Grade many submissions, streamed as NDJSON",
+    response_class=StreamingResponse,
+)
+async def grade_submissions_batch(
+    payload: SubmissionBatchRequest, session: AsyncSession = Depends(get_async_session)
+):
+    exercises = await load_batch_exercises(session, payload.items)
+    return StreamingResponse(
+        grade_submission_batch(exercises, payload.items), media_type="application/x-ndjson"
+    )
 
 
 @router.post(
@@ -111,12 +334,10 @@ async def submit_exercise(
 )
 async def chat_ask(
     payload: ChatRequest,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    exercise = (
-        get_exercise_or_404(session, payload.exercise_id) if payload.exercise_id else None
-    )
-    stream = await chat_stream_response(payload, exercise)
+    exercise, history, on_reply = await prepare_chat_turn(session, payload)
+    stream = await chat_stream_response(payload, exercise, history, on_reply)
     return StreamingResponse(stream, media_type="text/event-stream")
 
 
@@ -127,9 +348,7 @@ async def chat_ask(
 )
 async def chat_ask_batch(
     payload: ChatRequest,
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    exercise = (
-        get_exercise_or_404(session, payload.exercise_id) if payload.exercise_id else None
-    )
-    return await chat_batch_response(payload, exercise)
+    exercise, history, on_reply = await prepare_chat_turn(session, payload)
+    return await chat_batch_response(payload, exercise, history, on_reply)
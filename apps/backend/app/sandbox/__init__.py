@@ -0,0 +1,77 @@
+"""Sandboxed code execution backed by a pool of warm worker processes."""
+
+import logging
+
+from starlette.concurrency import run_in_threadpool
+
+from ..config import Settings, changed_fields, get_settings, on_settings_reload
+from .pool import (
+    ExecutionResult,
+    InteractiveRun,
+    LanguageLimits,
+    SandboxError,
+    SandboxPool,
+    UnsupportedLanguageError,
+)
+
+logger = logging.getLogger(__name__)
+
+_pool: SandboxPool | None = None
+
+
+def get_sandbox_pool() -> SandboxPool:
+    global _pool
+    if _pool is None:
+        _pool = SandboxPool(get_settings())
+    return _pool
+
+
+def start_sandbox_pool() -> None:
+    """Warm the workers up front; if isolation is unavailable, executions fail with SandboxError instead."""
+
+    try:
+        get_sandbox_pool().start()
+    except SandboxError as exc:
+        logger.error("Code execution is unavailable: %s", exc)
+
+
+def close_sandbox_pool() -> None:
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        pool.close()
+
+
+@on_settings_reload
+async def _restart_sandbox_pool(previous: Settings, current: Settings) -> None:
+    global _pool
+    if _pool is None or not changed_fields(previous, current, "sandbox_"):
+        return
+    pool = SandboxPool(current)
+    try:
+        await run_in_threadpool(pool.start)
+    except SandboxError as exc:
+        logger.error("Code execution is unavailable: %s", exc)
+    # Busy workers of the old pool are closed as they are released.
+    old, _pool = _pool, pool
+    await run_in_threadpool(old.close)
+
+
+async def open_run(language: str, code: str, stdin: str = "") -> InteractiveRun:
+    """Start an interactive run (waiting for a free worker off the event loop)."""
+
+    return await run_in_threadpool(get_sandbox_pool().open_run, language, code, stdin)
+
+
+__all__ = [
+    "ExecutionResult",
+    "InteractiveRun",
+    "LanguageLimits",
+    "SandboxError",
+    "SandboxPool",
+    "UnsupportedLanguageError",
+    "close_sandbox_pool",
+    "get_sandbox_pool",
+    "open_run",
+    "start_sandbox_pool",
+]
@@ -0,0 +1,350 @@
+import json
+import os
+import queue
+import select
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+from ..config import Settings
+from ..metrics import observe_sandbox_execution
+from . import worker as worker_module
+
+# Extra time granted to a worker on top of the job's wall-clock limit before it is
+# considered hung and replaced.
+WORKER_GRACE_SECONDS = 2.0
+READ_CHUNK = 65536
+PROBE_TIMEOUT_SECONDS = 10.0
+
+
+class SandboxError(RuntimeError):
+    """Raised when the sandbox cannot execute a job."""
+
+
+class UnsupportedLanguageError(SandboxError):
+    pass
+
+
+@dataclass(frozen=True)
+class LanguageLimits:
+    pool_size: int
+    cpu_seconds: float
+    memory_mb: int
+    output_bytes: int
+    wall_timeout_seconds: float
+    max_processes: int
+
+
+@dataclass(frozen=True)
+class ExecutionResult:
+    stdout: str
+    stderr: str
+    exit_code: int
+    outcome: str
+    duration_ms: int
+    peak_memory_kb: int
+    truncated: bool = False
+
+    @property
+    def succeeded(self) -> bool:
+        return self.outcome == "ok"
+
+
+def language_limits(settings: Settings, language: str) -> LanguageLimits:
+    base = {
+        "pool_size": settings.sandbox_pool_size or os.cpu_count() or 1,
+        "cpu_seconds": settings.sandbox_cpu_seconds,
+        "memory_mb": settings.sandbox_memory_mb,
+        "output_bytes": settings.sandbox_output_bytes,
+        "wall_timeout_seconds": settings.sandbox_wall_timeout_seconds,
+        "max_processes": settings.sandbox_max_processes,
+    }
+    base.update(settings.sandbox_language_limits.get(language, {}))
+    return LanguageLimits(
+        pool_size=int(base["pool_size"]),
+        cpu_seconds=float(base["cpu_seconds"]),
+        memory_mb=int(base["memory_mb"]),
+        output_bytes=int(base["output_bytes"]),
+        wall_timeout_seconds=float(base["wall_timeout_seconds"]),
+        max_processes=int(base["max_processes"]),
+    )
+
+
+def _worker_env() -> dict[str, str]:
+    return {"PATH": os.environ.get("PATH", "/usr/bin:/bin")}
+
+
+def verify_isolation(uid: int | None) -> None:
+    """Raise :class:`SandboxError` unless jobs would run as a non-root uid without network."""
+
+    if (os.geteuid() if uid is None else uid) == 0:
+        raise SandboxError("Refusing to run learner code as root; set SANDBOX_UID to an unprivileged uid")
+    command = [sys.executable, "-I", worker_module.__file__, "--probe"]
+    if uid is not None:
+        command.append(str(uid))
+    try:
+        probe = subprocess.run(
+            command, capture_output=True, text=True, cwd="/", env=_worker_env(), timeout=PROBE_TIMEOUT_SECONDS
+        )
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        raise SandboxError(f"Sandbox isolation check failed: {exc}") from exc
+    if probe.returncode != 0:
+        raise SandboxError(f"Sandbox isolation is unavailable: {probe.stderr.strip() or probe.returncode}")
+
+
+class _Worker:
+    def __init__(self, language: str):
+        self.language = language
+        self.process = subprocess.Popen(
+            [sys.executable, "-I", worker_module.__file__],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd="/",
+            env=_worker_env(),
+        )
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def send(self, message: dict) -> None:
+        assert self.process.stdin
+        self.process.stdin.write((json.dumps(message) + "\n").encode())
+        self.process.stdin.flush()
+
+    def execute(self, job: dict, timeout: float) -> dict:
+        assert self.process.stdout
+        self.send(job)
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not ready:
+            raise SandboxError("Sandbox worker did not respond in time")
+        line = self.process.stdout.readline()
+        if not line:
+            raise SandboxError("Sandbox worker exited unexpectedly")
+        return json.loads(line)
+
+    def close(self) -> None:
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+
+class InteractiveRun:
+    """A run whose output is read while it is produced and that takes stdin and a
+    kill request along the way.
+
+    The run holds its worker until :meth:`close`. Output is pulled with
+    :meth:`next_event`. While nobody pulls, the worker stops reading the
+    program's output and the program blocks on its next write.
+    """
+
+    def __init__(self, pool: "SandboxPool", idle: queue.Queue[_Worker], worker: _Worker, language: str, timeout: float):
+        self.pool = pool
+        self.language = language
+        self.result: ExecutionResult | None = None
+        self._idle = idle
+        self._worker = worker
+        self._deadline = time.monotonic() + timeout
+        self._start = time.perf_counter()
+        self._buffer = bytearray()
+        self._send_lock = threading.Lock()
+        self._broken = False
+        self._closed = False
+
+    def _readline(self) -> bytes:
+        # Raw reads: the buffered reader's read-ahead would hide lines from select().
+        fd = self._worker.process.stdout.fileno()
+        while b"\n" not in self._buffer:
+            remaining = self._deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise SandboxError("Sandbox worker did not respond in time")
+            chunk = os.read(fd, READ_CHUNK)
+            if not chunk:
+                raise SandboxError("Sandbox worker exited unexpectedly")
+            self._buffer += chunk
+        line, _, rest = bytes(self._buffer).partition(b"\n")
+        self._buffer = bytearray(rest)
+        return line
+
+    def next_event(self) -> dict | None:
+        """Block for the next ``{"event": "stdout" | "stderr", "data": ...}``; None once
+        the run has finished and :attr:`result` is set."""
+
+        if self.result is not None:
+            return None
+        try:
+            message = json.loads(self._readline())
+        except (SandboxError, OSError, ValueError) as exc:
+            self._broken = True
+            if isinstance(exc, SandboxError):
+                raise
+            raise SandboxError("Sandbox worker failed while executing the job") from exc
+        if "event" in message:
+            return message
+        if "error" in message:
+            raise SandboxError(message["error"])
+        self.result = ExecutionResult(**message)
+        observe_sandbox_execution(self.language, self.result.outcome, time.perf_counter() - self._start)
+        return None
+
+    def _send(self, message: dict) -> None:
+        with self._send_lock:
+            if self.result is not None or self._broken or self._closed:
+                return
+            try:
+                self._worker.send(message)
+            except OSError:
+                self._broken = True
+
+    def write_stdin(self, text: str) -> None:
+        self._send({"stdin": text})
+
+    def close_stdin(self) -> None:
+        self._send({"stdin_eof": True})
+
+    def kill(self) -> None:
+        self._send({"kill": True})
+
+    def close(self) -> None:
+        """Stop the program if it is still running and give the worker back to the pool."""
+
+        if self._closed:
+            return
+        if self.result is None and not self._broken:
+            self.kill()
+            self._deadline = min(self._deadline, time.monotonic() + WORKER_GRACE_SECONDS)
+            try:
+                while self.next_event() is not None:
+                    pass
+            except SandboxError:
+                pass
+        self._closed = True
+        if self._broken:
+            self._worker.close()
+        self.pool._release(self._idle, self._worker)
+
+
+class SandboxPool:
+    """Pool of warm, pre-started sandbox workers per language.
+
+    Workers are plain subprocesses driven over pipes, so the pool is safe to use
+    from the API threadpool as well as from Celery workers. No worker is started
+    unless :func:`verify_isolation` passes.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.commands: dict[str, list[str] | None] = {"python": None, **settings.sandbox_commands}
+        self._idle: dict[str, queue.Queue[_Worker]] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._verified = False
+        self._isolation_error: SandboxError | None = None
+
+    @property
+    def languages(self) -> list[str]:
+        return list(self.commands)
+
+    def _workers_for(self, language: str) -> queue.Queue[_Worker]:
+        if language not in self.commands:
+            raise UnsupportedLanguageError(f"Unsupported language: {language}")
+        with self._lock:
+            if self._closed:
+                raise SandboxError("Sandbox pool is closed")
+            idle = self._idle.get(language)
+            if idle is None:
+                if self._isolation_error:
+                    raise self._isolation_error
+                if not self._verified:
+                    try:
+                        verify_isolation(self.settings.sandbox_uid)
+                    except SandboxError as exc:
+                        # Remembered so every execution fails fast instead of re-running the probe.
+                        self._isolation_error = exc
+                        raise
+                    self._verified = True
+                idle = queue.Queue()
+                for _ in range(language_limits(self.settings, language).pool_size):
+                    idle.put(_Worker(language))
+                self._idle[language] = idle
+        return idle
+
+    def start(self) -> None:
+        for language in self.languages:
+            self._workers_for(language)
+
+    def _job(self, language: str, code: str, stdin: str, wall_timeout_seconds: float) -> dict:
+        limits = language_limits(self.settings, language)
+        return {
+            "code": code,
+            "stdin": stdin,
+            "command": self.commands[language],
+            "limits": {
+                "cpu_seconds": limits.cpu_seconds,
+                "memory_mb": limits.memory_mb,
+                "output_bytes": limits.output_bytes,
+                "wall_timeout_seconds": wall_timeout_seconds,
+                "max_processes": limits.max_processes,
+                "uid": self.settings.sandbox_uid,
+            },
+        }
+
+    def _acquire(self, idle: queue.Queue[_Worker]) -> _Worker:
+        try:
+            return idle.get(timeout=self.settings.sandbox_acquire_timeout_seconds)
+        except queue.Empty as exc:
+            raise SandboxError("No sandbox worker available") from exc
+
+    def _release(self, idle: queue.Queue[_Worker], worker: _Worker) -> None:
+        if self._closed:
+            worker.close()
+        else:
+            idle.put(worker if worker.alive() else _Worker(worker.language))
+
+    def execute(self, language: str, code: str, stdin: str = "") -> ExecutionResult:
+        language = language.lower()
+        idle = self._workers_for(language)
+        wall_timeout_seconds = language_limits(self.settings, language).wall_timeout_seconds
+        job = self._job(language, code, stdin, wall_timeout_seconds)
+        worker = self._acquire(idle)
+
+        start = time.perf_counter()
+        try:
+            response = worker.execute(job, wall_timeout_seconds + WORKER_GRACE_SECONDS)
+        except (SandboxError, OSError, ValueError) as exc:
+            worker.close()
+            raise SandboxError("Sandbox worker failed while executing the job") from exc
+        finally:
+            self._release(idle, worker)
+
+        if "error" in response:
+            raise SandboxError(response["error"])
+        result = ExecutionResult(**response)
+        observe_sandbox_execution(language, result.outcome, time.perf_counter() - start)
+        return result
+
+    def open_run(self, language: str, code: str, stdin: str = "") -> InteractiveRun:
+        """Start ``code`` as an interactive run; the caller must close the returned run."""
+
+        language = language.lower()
+        idle = self._workers_for(language)
+        timeout = self.settings.sandbox_interactive_timeout_seconds
+        job = {**self._job(language, code, stdin, timeout), "interactive": True}
+        worker = self._acquire(idle)
+        try:
+            worker.send(job)
+        except OSError as exc:
+            worker.close()
+            self._release(idle, worker)
+            raise SandboxError("Sandbox worker failed while executing the job") from exc
+        return InteractiveRun(self, idle, worker, language, timeout + WORKER_GRACE_SECONDS)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            pools, self._idle = self._idle, {}
+        for idle in pools.values():
+            while not idle.empty():
+                idle.get_nowait().close()
@@ -0,0 +1,405 @@
+"""Warm sandbox worker.
+
+Started once by :class:`app.sandbox.pool.SandboxPool` and kept alive between
+runs. Each job arrives as one JSON line on stdin; the worker forks a fresh,
+resource-limited child for it and answers with one JSON line on stdout. Forking
+from an already-initialised interpreter avoids paying Python startup per run.
+
+Interactive jobs (``"interactive": true``) also send each chunk of output as
+an ``{"event": "stdout" | "stderr", "data": ...}`` line while the program runs.
+They accept ``{"stdin": ...}``, ``{"stdin_eof": true}`` and ``{"kill": true}``
+lines on stdin until the result line is written. Event lines are written with
+blocking writes, so a reader that falls behind stalls the program on its next
+write instead of letting output pile up here.
+
+Each child enters an empty network namespace and then switches to the sandbox
+uid; a job whose namespace cannot be created is refused. ``--probe [uid]``
+checks both once, so the pool can report a problem before any job runs.
+
+This module must only import the standard library: it is executed with
+``python -I`` outside of the application package.
+"""
+
+import builtins
+import codecs
+import ctypes
+import json
+import os
+import resource
+import selectors
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import traceback
+
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+READ_CHUNK = 65536
+REAP_INTERVAL = 0.005
+TRUNCATION_MARKER = "\n[output truncated at {limit} bytes]\n"
+
+
+def _isolate_network() -> bool:
+    """Move the current process into an empty network namespace if the kernel allows it."""
+
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return False
+    for flags in (CLONE_NEWNET, CLONE_NEWUSER | CLONE_NEWNET):
+        if libc.unshare(flags) == 0:
+            return True
+    return False
+
+
+def _drop_privileges(uid: int | None) -> None:
+    if uid is not None:
+        os.setgroups([])
+        os.setgid(uid)
+        os.setuid(uid)
+
+
+def _apply_limits(limits: dict) -> None:
+    cpu = max(1, int(limits["cpu_seconds"]))
+    memory = int(limits["memory_mb"]) * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (int(limits["output_bytes"]),) * 2)
+    resource.setrlimit(resource.RLIMIT_NPROC, (int(limits["max_processes"]),) * 2)
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def _run_python(code: str) -> int:
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", closefd=False)
+    sys.stderr = open(2, "w", closefd=False)
+
+    exit_code = 0
+    try:
+        exec(compile(code, "main.py", "exec"), {"__name__": "__main__", "__builtins__": builtins})
+    except SystemExit as exc:
+        if isinstance(exc.code, int):
+            exit_code = exc.code
+        elif exc.code is not None:
+            print(exc.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            pass
+    return exit_code
+
+
+def _child(job: dict, workdir: str, stdin_fd: int, stdout_fd: int, stderr_fd: int) -> None:
+    exit_code = 1
+    try:
+        os.setsid()
+        os.dup2(stdin_fd, 0)
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        os.closerange(3, os.sysconf("SC_OPEN_MAX"))
+        os.chdir(workdir)
+
+        # Before dropping privileges: as root, CLONE_NEWNET needs no user namespace.
+        if not _isolate_network():
+            raise RuntimeError("Network isolation is unavailable; refusing to run the job")
+        _drop_privileges(job["limits"].get("uid"))
+        _apply_limits(job["limits"])
+
+        command = job.get("command")
+        if command:
+            argv = [part.replace("{file}", os.path.join(workdir, "main")) for part in command]
+            env = {"PATH": os.environ.get("PATH", "/usr/bin:/bin"), "HOME": workdir}
+            os.execvpe(argv[0], argv, env)
+        exit_code = _run_python(job["code"])
+    except BaseException:
+        try:
+            traceback.print_exc()
+            sys.stderr.flush()
+        except Exception:
+            pass
+        exit_code = 127
+    finally:
+        os._exit(exit_code)
+
+
+class _LineReader:
+    """JSON lines from the parent, read from fd 0 without Python's read-ahead buffering,
+    so the same descriptor can also be watched by a selector during interactive runs."""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.closed = False
+        self._buffer = bytearray()
+
+    def fill(self) -> None:
+        chunk = os.read(self.fd, READ_CHUNK)
+        if not chunk:
+            self.closed = True
+        self._buffer += chunk
+
+    def readline(self) -> bytes | None:
+        while b"\n" not in self._buffer:
+            if self.closed:
+                return None
+            self.fill()
+        line, _, rest = bytes(self._buffer).partition(b"\n")
+        self._buffer = bytearray(rest)
+        return line
+
+    def messages(self) -> list:
+        """Complete lines already read, parsed."""
+
+        messages = []
+        while b"\n" in self._buffer:
+            line = self.readline()
+            if line.strip():
+                messages.append(json.loads(line))
+        return messages
+
+
+def _kill_group(pid: int) -> None:
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def execute(job: dict, control: _LineReader | None = None, emit=None) -> dict:
+    limits = job["limits"]
+    interactive = bool(job.get("interactive")) and control is not None and emit is not None
+    output_cap = int(limits["output_bytes"])
+    workdir = tempfile.mkdtemp(prefix="sandbox-")
+    with open(os.path.join(workdir, "main"), "w") as handle:
+        handle.write(job["code"])
+    uid = limits.get("uid")
+    if uid is not None:
+        os.chown(workdir, uid, uid)
+        os.chown(os.path.join(workdir, "main"), uid, uid)
+
+    in_r, in_w = os.pipe()
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        _child(job, workdir, in_r, out_w, err_w)
+
+    for fd in (in_r, out_w, err_w):
+        os.close(fd)
+
+    deadline = start + float(limits["wall_timeout_seconds"])
+    pending_stdin = job.get("stdin", "").encode()
+    buffers = {out_r: bytearray(), err_r: bytearray()}
+    names = {out_r: "stdout", err_r: "stderr"}
+    decoders = {fd: codecs.getincrementaldecoder("utf-8")(errors="replace") for fd in buffers}
+    timed_out = truncated = killed = False
+    # Interactive runs keep the program's stdin open until the client closes it.
+    stdin_open = interactive
+
+    os.set_blocking(in_w, False)
+    selector = selectors.DefaultSelector()
+    selector.register(out_r, selectors.EVENT_READ)
+    selector.register(err_r, selectors.EVENT_READ)
+    if pending_stdin:
+        selector.register(in_w, selectors.EVENT_WRITE)
+    elif not stdin_open:
+        os.close(in_w)
+    if interactive:
+        selector.register(control.fd, selectors.EVENT_READ)
+
+    def handle_control(messages: list) -> None:
+        nonlocal pending_stdin, stdin_open, killed
+        for message in messages:
+            if message.get("kill"):
+                killed = True
+            elif not stdin_open:
+                continue
+            elif message.get("stdin_eof"):
+                stdin_open = False
+                if not pending_stdin:
+                    os.close(in_w)
+            elif message.get("stdin"):
+                if not pending_stdin:
+                    selector.register(in_w, selectors.EVENT_WRITE)
+                pending_stdin += message["stdin"].encode()
+
+    if interactive:
+        # Controls sent right behind the job may already have been read with it.
+        handle_control(control.messages())
+
+    while (out_r in selector.get_map() or err_r in selector.get_map()) and not (timed_out or truncated or killed):
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            timed_out = True
+            break
+        for key, _ in selector.select(remaining):
+            fd = key.fd
+            if interactive and fd == control.fd:
+                control.fill()
+                # The parent going away ends the run like a kill request.
+                killed = killed or control.closed
+                handle_control(control.messages())
+                continue
+            if fd == in_w:
+                try:
+                    written = os.write(in_w, pending_stdin[:READ_CHUNK])
+                except BrokenPipeError:
+                    written = len(pending_stdin)
+                    stdin_open = False
+                pending_stdin = pending_stdin[written:]
+                if not pending_stdin:
+                    selector.unregister(in_w)
+                    if not stdin_open:
+                        os.close(in_w)
+                continue
+            chunk = os.read(fd, READ_CHUNK)
+            if not chunk:
+                selector.unregister(fd)
+                continue
+            room = output_cap - len(buffers[out_r]) - len(buffers[err_r])
+            buffers[fd] += chunk
+            if len(chunk) > room:
+                truncated = True
+            if interactive:
+                text = decoders[fd].decode(chunk[: max(0, room)], final=truncated)
+                if text:
+                    emit({"event": names[fd], "data": text})
+
+    if interactive:
+        selector.unregister(control.fd)
+    if stdin_open and in_w not in selector.get_map():
+        os.close(in_w)
+
+    for key in list(selector.get_map().values()):
+        selector.unregister(key.fd)
+        os.close(key.fd)
+    selector.close()
+    for fd in (out_r, err_r):
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+    if timed_out or truncated:
+        _kill_group(pid)
+
+    while True:
+        waited_pid, status, usage = os.wait4(pid, os.WNOHANG)
+        if waited_pid:
+            break
+        if time.perf_counter() >= deadline and not timed_out:
+            timed_out = True
+            _kill_group(pid)
+        time.sleep(REAP_INTERVAL)
+
+    duration_ms = int((time.perf_counter() - start) * 1000)
+    _kill_group(pid)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    if os.WIFSIGNALED(status):
+        exit_code = -os.WTERMSIG(status)
+    else:
+        exit_code = os.WEXITSTATUS(status)
+
+    if killed:
+        outcome = "killed"
+    elif timed_out:
+        outcome = "timeout"
+    elif truncated:
+        outcome = "output_limit"
+    elif exit_code in (-signal.SIGXCPU, -signal.SIGKILL):
+        outcome = "cpu_limit"
+    elif exit_code == 0:
+        outcome = "ok"
+    else:
+        outcome = "error"
+
+    stdout = bytes(buffers[out_r])
+    stderr = bytes(buffers[err_r])
+    stdout_marker = stderr_marker = ""
+    if truncated:
+        stdout = stdout[:output_cap]
+        stderr = stderr[: max(0, output_cap - len(stdout))]
+        marker = TRUNCATION_MARKER.format(limit=output_cap)
+        if len(stdout) < len(buffers[out_r]):
+            stdout_marker = marker
+        else:
+            stderr_marker = marker
+        if interactive:
+            emit({"event": "stdout" if stdout_marker else "stderr", "data": marker})
+    elif interactive:
+        for fd, decoder in decoders.items():
+            text = decoder.decode(b"", final=True)
+            if text:
+                emit({"event": names[fd], "data": text})
+
+    return {
+        "stdout": stdout.decode("utf-8", errors="replace") + stdout_marker,
+        "stderr": stderr.decode("utf-8", errors="replace") + stderr_marker,
+        "exit_code": exit_code,
+        "outcome": outcome,
+        "duration_ms": duration_ms,
+        "peak_memory_kb": usage.ru_maxrss,
+        "truncated": truncated,
+    }
+
+
+def probe(uid: int | None) -> int:
+    """Check that jobs can be isolated: exit status 0, or 1 with the reason on stderr."""
+
+    if not _isolate_network():
+        print("Cannot create a network namespace (unshare needs CAP_SYS_ADMIN or user namespaces)", file=sys.stderr)
+        return 1
+    try:
+        _drop_privileges(uid)
+    except OSError as exc:
+        print(f"Cannot switch to uid {uid}: {exc}", file=sys.stderr)
+        return 1
+    if os.geteuid() == 0:
+        print("Learner code would run as root", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main() -> None:
+    if sys.argv[1:2] == ["--probe"]:
+        sys.exit(probe(int(sys.argv[2]) if len(sys.argv) > 2 else None))
+
+    # Keep the protocol channel private; anything else printed goes to stderr.
+    protocol = os.fdopen(os.dup(1), "w")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    def emit(message: dict) -> None:
+        protocol.write(json.dumps(message) + "\n")
+        protocol.flush()
+
+    control = _LineReader(0)
+    while True:
+        line = control.readline()
+        if line is None:
+            break
+        if not line.strip():
+            continue
+        try:
+            job = json.loads(line)
+            if "code" not in job:
+                # A control line that arrived after its interactive run had finished.
+                continue
+            response = execute(job, control, emit)
+        except Exception as exc:
+            response = {"error": f"{exc.__class__.__name__}: {exc}"}
+        emit(response)
+
+
+if __name__ == "__main__":
+    main()
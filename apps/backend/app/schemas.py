@@ -1,9 +1,11 @@
 import uuid
+from datetime import datetime
 from typing import Literal
 
 from pydantic import BaseModel, Field
 
 Difficulty = Literal["easy", "medium", "hard"]
+ExecutionOutcome = Literal["ok", "error", "timeout", "cpu_limit", "output_limit", "killed"]
 
 
 class ExerciseRequest(BaseModel):
@@ -24,20 +26,104 @@ class ExerciseResponse(BaseModel):
         from_attributes = True
 
 
+MAX_BATCH_ITEMS = 100
+
+
+class ExerciseBatchRequest(BaseModel):
+    items: list[ExerciseRequest] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+
+class ExerciseBatchLine(BaseModel):
+    """One NDJSON line of ``/exercises/generate:batch``, sent as soon as the item is ready."""
+
+    index: int
+    exercise: ExerciseResponse | None = None
+    error: str | None = None
+
+
+class BatchDone(BaseModel):
+    """Last NDJSON line of a batch; items are only stored once ``committed`` is true."""
+
+    done: Literal[True] = True
+    succeeded: int
+    failed: int
+    committed: bool
+
+
+class ExerciseTestCase(BaseModel):
+    name: str | None = None
+    stdin: str = ""
+    expected_stdout: str | None = Field(
+        default=None, description="Expected program output; when omitted the test only requires a clean exit"
+    )
+    hidden: bool = Field(default=False, description="Hide input and expected output from learners")
+
+
+class ExerciseRecord(ExerciseResponse):
+    """Exercise as used by run, submit and chat; carries hidden tests, so never returned as is."""
+
+    tests: list[ExerciseTestCase] = Field(default_factory=list)
+    tests_version: int = 1
+
+
+class ExerciseTestSuite(BaseModel):
+    tests: list[ExerciseTestCase] = Field(default_factory=list)
+
+
+MAX_CODE_CHARS = 100_000
+
+
 class CodeExecutionRequest(BaseModel):
-    code: str
+    code: str = Field(max_length=MAX_CODE_CHARS)
     language: str
+    user_id: str | None = Field(
+        default=None, max_length=128, description="Learner to credit in per-user statistics"
+    )
+    fail_fast: bool = Field(default=False, description="Stop grading at the first failing test (submit only)")
 
 
 class RunResult(BaseModel):
     stdout: str
     stderr: str
     duration_ms: int = Field(ge=0)
+    exit_code: int | None = None
+    outcome: ExecutionOutcome | None = None
+    peak_memory_kb: int | None = Field(default=None, ge=0)
+    truncated: bool = False
+    cached: bool = Field(default=False, description="Served from the result cache without re-running the code")
+
+
+MAX_STDIN_CHARS = 65_536
+
+
+class LiveRunStart(CodeExecutionRequest):
+    """First message on the live run WebSocket."""
+
+    stdin: str = Field(
+        default="", max_length=MAX_STDIN_CHARS, description="Fed to the program before any input sent later"
+    )
+
+
+class LiveRunInput(BaseModel):
+    """Later client messages: more input, end of input, or a request to stop the program."""
+
+    type: Literal["stdin", "stdin_eof", "kill"]
+    data: str = Field(default="", max_length=MAX_STDIN_CHARS)
+
+
+class TestCaseResult(BaseModel):
+    name: str
+    status: Literal["passed", "failed", "skipped"]
+    duration_ms: int = Field(default=0, ge=0)
+    outcome: ExecutionOutcome | None = None
+    message: str | None = None
 
 
 class SubmissionDetails(BaseModel):
     tests_run: int = 0
     tests_failed: int = 0
+    tests_skipped: int = 0
+    tests: list[TestCaseResult] = Field(default_factory=list)
 
 
 class SubmissionResult(RunResult):
@@ -46,6 +132,83 @@ class SubmissionResult(RunResult):
     details: SubmissionDetails
 
 
+class SubmissionBatchItem(CodeExecutionRequest):
+    exercise_id: uuid.UUID
+
+
+class SubmissionBatchRequest(BaseModel):
+    items: list[SubmissionBatchItem] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+
+class SubmissionBatchLine(BaseModel):
+    """One NDJSON line of ``/submissions:batch-grade``, sent as soon as the item is graded."""
+
+    index: int
+    exercise_id: uuid.UUID
+    result: SubmissionResult | None = None
+    error: str | None = None
+
+
+SubmissionTextField = Literal["code", "stdout", "stderr"]
+
+
+class SubmissionSummary(BaseModel):
+    id: uuid.UUID
+    kind: str
+    language: str
+    status: str
+    duration_ms: int
+    exit_code: int | None = None
+    outcome: str | None = None
+    peak_memory_kb: int | None = None
+    score: float | None = None
+    tests_run: int | None = None
+    tests_failed: int | None = None
+    created_at: datetime
+    code_bytes: int | None = None
+    stdout_bytes: int | None = None
+    stderr_bytes: int | None = None
+    code: str | None = Field(default=None, description="Only present when requested with include=code")
+    stdout: str | None = Field(default=None, description="Only present when requested with include=stdout")
+    stderr: str | None = Field(default=None, description="Only present when requested with include=stderr")
+
+
+class SubmissionPage(BaseModel):
+    items: list[SubmissionSummary]
+    next_cursor: str | None = Field(default=None, description="Pass as cursor to fetch the next page")
+
+
+class ExerciseStatsResponse(BaseModel):
+    exercise_id: uuid.UUID
+    attempts: int = 0
+    passes: int = 0
+    pass_rate: float | None = None
+    average_score: float | None = None
+    score_histogram: list[int] = Field(
+        default_factory=list, description="Submit counts per score bucket 0.0, 0.1, ... 1.0"
+    )
+    p50_duration_ms: float | None = None
+    p95_duration_ms: float | None = None
+
+
+JobState = Literal["queued", "running", "done", "failed"]
+
+
+class JobAccepted(BaseModel):
+    job_id: str
+    status: JobState = "queued"
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: JobState
+    stage: str | None = None
+    current: int | None = None
+    total: int | None = None
+    result: dict | None = None
+    error: str | None = None
+
+
 Role = Literal["system", "user", "assistant"]
 
 
@@ -57,9 +220,13 @@ class ConversationMessage(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     exercise_id: uuid.UUID | None = None
+    conversation_id: uuid.UUID | None = Field(
+        default=None, description="Server-side conversation; when set, conversation_history is ignored"
+    )
     conversation_history: list[ConversationMessage] = Field(default_factory=list)
 
 
 class ChatBatchResponse(BaseModel):
     response: str
     tokens_used: int = 0
+    cached: bool = False
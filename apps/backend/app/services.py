@@ -1,24 +1,73 @@
+import asyncio
+import base64
+import copy
+import hashlib
 import json
-import time
+import logging
 import uuid
-from typing import Any
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, TypeVar
 
-from fastapi import HTTPException
-from openai import AsyncAzureOpenAI
+import anyio
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect, status
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.websockets import WebSocketState
 
-from .config import get_settings
+from .blobs import get_blob_store
+from .cache import TwoTierCache
+from .chat_cache import CachedAnswer, get_chat_cache, invalidate_chat_cache
+from .celery_app import celery
+from .config import Settings, changed_fields, get_settings, on_settings_reload
+from .conversations.service import PromptHistory, get_conversation_or_404, start_turn, trim_history
+from .db import async_session_scope
+from .exercise_pool import take_exercise
+from .grading import GradeReport, ProgressCallback, grade_submission
+from .llm import SingleFlight, chat_completion, is_configured
+from .metrics import count_llm_tokens, timed
 from .models import Exercise, Submission
+from .sandbox import (
+    ExecutionResult,
+    InteractiveRun,
+    SandboxError,
+    UnsupportedLanguageError,
+    get_sandbox_pool,
+    open_run,
+)
 from .schemas import (
+    BatchDone,
     ChatBatchResponse,
     ChatRequest,
     ConversationMessage,
     CodeExecutionRequest,
+    ExerciseBatchLine,
+    ExerciseRecord,
     ExerciseRequest,
+    ExerciseResponse,
+    ExerciseTestCase,
+    ExerciseTestSuite,
+    JobStatus,
+    LiveRunInput,
+    LiveRunStart,
     RunResult,
-    SubmissionDetails,
+    SubmissionBatchItem,
+    SubmissionBatchLine,
+    SubmissionPage,
     SubmissionResult,
+    SubmissionSummary,
+    SubmissionTextField,
 )
+from .stats import record_submit, record_submit_sync
+from .user_context.service import invalidate_user_context, invalidate_user_context_sync
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+ResultT = TypeVar("ResultT", bound=RunResult)
 
 
 def _fallback_exercise(payload: ExerciseRequest) -> dict[str, Any]:
@@ -52,43 +101,72 @@ def _fallback_exercise(payload: ExerciseRequest) -> dict[str, Any]:
     }
 
 
-async def generate_exercise(payload: ExerciseRequest) -> dict:
-    settings = get_settings()
+def _parse_generated_tests(raw_tests: Any) -> list[dict[str, Any]]:
+    if not isinstance(raw_tests, list):
+        return []
+    tests = []
+    for raw in raw_tests:
+        try:
+            tests.append(ExerciseTestCase.model_validate(raw).model_dump())
+        except ValidationError:
+            continue
+    return tests
+
+
+_exercise_flights = SingleFlight()
+
 
-    if not settings.azure_openai_endpoint or not settings.azure_openai_api_key or not settings.azure_openai_deployment:
+async def generate_exercise(payload: ExerciseRequest, coalesce: bool = True) -> dict:
+    """Generate an exercise with the LLM, or locally when Azure is not configured.
+
+    Concurrent topic-less requests for the same language and difficulty share a
+    single upstream call unless ``coalesce`` is disabled (e.g. when stocking the
+    exercise pool, where distinct exercises are wanted).
+    """
+
+    if not is_configured(get_settings()):
         return _fallback_exercise(payload)
+    if payload.topic or not coalesce:
+        return await _request_exercise(payload)
+
+    key = (payload.language.lower(), payload.difficulty)
+    data = await _exercise_flights.do(key, lambda: _request_exercise(payload))
+    return copy.deepcopy(data)
 
-    client = AsyncAzureOpenAI(
-        api_key=settings.azure_openai_api_key,
-        api_version=settings.azure_openai_api_version,
-        azure_endpoint=settings.azure_openai_endpoint,
-    )
 
+def exercise_flight_stats() -> dict[str, int]:
+    return {"in_flight": len(_exercise_flights), "shared_calls": _exercise_flights.shared}
+
+
+async def _request_exercise(payload: ExerciseRequest) -> dict:
     messages = [
         {
             "role": "system",
             "content": (
                 "You create concise coding exercises that can be solved in about 5 minutes. "
                 "Return JSON with fields: title (string), language (string), difficulty (easy|medium|hard), "
-                "prompt_markdown (string), starter_code (a minimal code snippet with TODOs). "
+                "topic (the requested topic, verbatim, or null), "
+                "prompt_markdown (string), starter_code (a minimal code snippet with TODOs), "
+                "tests (3 to 5 objects with stdin and expected_stdout strings). "
+                "The program reads its input from standard input and prints its answer to standard output. "
                 "Do not include the full solution."
             ),
         },
         {
             "role": "user",
             "content": (
-                f"Create one coding exercise in {payload.language} at {payload.difficulty} difficulty. "
-                "Provide only the requested JSON fields."
+                f"Create one coding exercise in {payload.language} at {payload.difficulty} difficulty"
+                + (f" on the topic: {payload.topic}. " if payload.topic else ". ")
+                + "Provide only the requested JSON fields."
             ),
         },
     ]
 
-    completion = await client.chat.completions.create(
-        model=settings.azure_openai_deployment,
+    completion = await chat_completion(
         messages=messages,
         temperature=0.6,
         response_format={"type": "json_object"},
-        max_tokens=350,
+        max_tokens=700,
     )
 
     raw_content = completion.choices[0].message.content or "{}"
@@ -99,87 +177,723 @@ async def generate_exercise(payload: ExerciseRequest) -> dict:
         data.setdefault("title", payload.topic or "Generated exercise")
         data.setdefault("prompt_markdown", "### Exercise\nFill in the solution.")
         data.setdefault("starter_code", "# TODO: implement solution\n")
+        data["tests"] = _parse_generated_tests(data.get("tests"))
         return data
     except json.JSONDecodeError as exc:
         raise HTTPException(status_code=500, detail="Failed to parse exercise response.") from exc
 
 
-def save_exercise(session: Session, exercise_payload: dict) -> Exercise:
-    exercise = Exercise(
+def _new_exercise(exercise_payload: dict) -> Exercise:
+    # The id is assigned up front so batch generation can report it before the INSERT.
+    return Exercise(
+        id=uuid.uuid4(),
         title=exercise_payload["title"],
         difficulty=exercise_payload["difficulty"],
         language=exercise_payload["language"],
         prompt_markdown=exercise_payload["prompt_markdown"],
         starter_code=exercise_payload["starter_code"],
+        tests=exercise_payload.get("tests", []),
     )
+
+
+async def save_exercise(session: AsyncSession, exercise_payload: dict) -> Exercise:
+    exercise = _new_exercise(exercise_payload)
     session.add(exercise)
-    session.commit()
-    session.refresh(exercise)
+    await session.commit()
+    cache = _get_exercise_cache()
+    if cache:
+        await _cache_exercise(cache, exercise)
     return exercise
 
 
-def get_exercise_or_404(session: Session, exercise_id: uuid.UUID) -> Exercise:
-    exercise = session.get(Exercise, exercise_id)
+_exercise_cache: TwoTierCache | None = None
+
+
+def _get_exercise_cache() -> TwoTierCache | None:
+    global _exercise_cache
+    settings = get_settings()
+    if not settings.exercise_cache_enabled:
+        return None
+    if _exercise_cache is None:
+        _exercise_cache = TwoTierCache(
+            "exercise",
+            settings.exercise_cache_max_entries,
+            settings.exercise_cache_ttl_seconds,
+            local_ttl_seconds=settings.exercise_cache_local_ttl_seconds,
+        )
+    return _exercise_cache
+
+
+async def _cache_exercise(cache: TwoTierCache, exercise: Exercise) -> ExerciseRecord:
+    record = ExerciseRecord.model_validate(exercise)
+    await cache.set(cache.key(exercise.id), record.model_dump_json().encode())
+    return record
+
+
+async def get_exercise_or_404(session: AsyncSession, exercise_id: uuid.UUID) -> ExerciseRecord:
+    """Read-through lookup; exercises only change through the functions below."""
+
+    cache = _get_exercise_cache()
+    raw = await cache.get(cache.key(exercise_id)) if cache else None
+    if raw:
+        return ExerciseRecord.model_validate_json(raw)
+
+    exercise = await session.get(Exercise, exercise_id)
     if not exercise:
         raise HTTPException(status_code=404, detail="Exercise not found")
-    return exercise
+    if cache:
+        return await _cache_exercise(cache, exercise)
+    return ExerciseRecord.model_validate(exercise)
+
+
+async def _invalidate_exercise(exercise_id: uuid.UUID) -> None:
+    cache = _get_exercise_cache()
+    if cache:
+        await cache.delete(cache.key(exercise_id))
+    result_cache = _get_result_cache()
+    if result_cache:
+        await result_cache.delete_prefix(result_cache.key(exercise_id, ""))
+
+
+async def _exercise_deleted(session: AsyncSession, exercise_id: uuid.UUID) -> HTTPException:
+    """The submission's foreign key failed: the exercise was deleted after this process cached it."""
+
+    await session.rollback()
+    await _invalidate_exercise(exercise_id)
+    return HTTPException(status_code=404, detail="Exercise not found")
+
+
+async def replace_exercise_tests(
+    session: AsyncSession, exercise_id: uuid.UUID, suite: ExerciseTestSuite
+) -> ExerciseTestSuite:
+    exercise = await session.get(Exercise, exercise_id)
+    if not exercise:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+    exercise.tests = [test.model_dump() for test in suite.tests]
+    exercise.tests_version = (exercise.tests_version or 1) + 1
+    await session.commit()
+    await _invalidate_exercise(exercise_id)
+    return suite
+
+
+async def delete_exercise(session: AsyncSession, exercise_id: uuid.UUID) -> None:
+    exercise = await session.get(Exercise, exercise_id)
+    if not exercise:
+        raise HTTPException(status_code=404, detail="Exercise not found")
+    await session.delete(exercise)
+    await session.commit()
+    await _invalidate_exercise(exercise_id)
+    await invalidate_chat_cache(exercise_id)
+
+
+def _exercise_tests(exercise: ExerciseRecord) -> list[ExerciseTestCase]:
+    return [ExerciseTestCase.model_validate(test) for test in exercise.tests]
+
+
+_result_cache: TwoTierCache | None = None
+
+
+def _get_result_cache() -> TwoTierCache | None:
+    global _result_cache
+    settings = get_settings()
+    if not settings.result_cache_enabled:
+        return None
+    if _result_cache is None:
+        _result_cache = TwoTierCache(
+            "result", settings.result_cache_max_entries, settings.result_cache_ttl_seconds
+        )
+    return _result_cache
+
+
+@on_settings_reload
+def _reset_caches(previous: Settings, current: Settings) -> None:
+    global _exercise_cache, _result_cache
+    if changed_fields(previous, current, "exercise_cache_"):
+        _exercise_cache = None
+    if changed_fields(previous, current, "result_cache_"):
+        _result_cache = None
+
+
+def _normalize_code(code: str) -> str:
+    # Only changes that cannot alter program behaviour: line endings and trailing whitespace.
+    return code.replace("\r\n", "\n").replace("\r", "\n").rstrip()
+
+
+def _result_cache_key(
+    cache: TwoTierCache, exercise: ExerciseRecord, kind: str, payload: CodeExecutionRequest
+) -> str:
+    digest = hashlib.sha256(_normalize_code(payload.code).encode()).hexdigest()
+    if kind == "submit" and payload.fail_fast:
+        kind = "submit-fail-fast"
+    return cache.key(exercise.id, exercise.tests_version, kind, payload.language.lower(), digest)
 
 
-def run_code(session: Session, exercise: Exercise, payload: CodeExecutionRequest) -> RunResult:
-    start = time.perf_counter()
-    # Placeholder execution hook; this should call a real sandbox in production.
-    stdout = f"echo: received {len(payload.code.splitlines())} lines of {payload.language} code."
-    stderr = ""
-    duration_ms = int((time.perf_counter() - start) * 1000)
+def _cacheable(result: RunResult) -> bool:
+    # A timeout can come from momentary load rather than from the code, so it is re-run next time.
+    outcomes = [result.outcome]
+    if isinstance(result, SubmissionResult):
+        outcomes += [test.outcome for test in result.details.tests]
+    return "timeout" not in outcomes
 
-    submission = Submission(
-        exercise_id=exercise.id,
-        code=payload.code,
+
+def _with_result_cache(
+    exercise: ExerciseRecord,
+    kind: str,
+    payload: CodeExecutionRequest,
+    model: type[ResultT],
+    compute: Callable[[], ResultT],
+) -> ResultT:
+    """Serve the result of ``payload`` from the result cache, or ``compute`` and cache it.
+
+    Blocking; the async routes call it through the threadpool.
+    """
+
+    cache = _get_result_cache()
+    cache_key = _result_cache_key(cache, exercise, kind, payload) if cache else None
+    cached = cache.get_sync(cache_key) if cache else None
+    if cached is not None:
+        return model.model_validate_json(cached).model_copy(update={"cached": True})
+    result = compute()
+    if cache and _cacheable(result):
+        cache.set_sync(cache_key, result.model_dump_json().encode())
+    return result
+
+
+def _run_result(result: ExecutionResult) -> RunResult:
+    return RunResult(
+        stdout=result.stdout,
+        stderr=result.stderr,
+        duration_ms=result.duration_ms,
+        exit_code=result.exit_code,
+        outcome=result.outcome,
+        peak_memory_kb=result.peak_memory_kb,
+        truncated=result.truncated,
+    )
+
+
+def _stored_text(field: str, value: str) -> dict[str, Any]:
+    """Columns for one TEXT field: inline when small, otherwise a blob reference plus a preview."""
+
+    data = value.encode()
+    limit = get_settings().submission_inline_bytes
+    if len(data) <= limit:
+        return {field: value, f"{field}_blob": None, f"{field}_bytes": len(data)}
+    return {
+        field: data[:limit].decode("utf-8", errors="ignore"),
+        f"{field}_blob": get_blob_store().put(data),
+        f"{field}_bytes": len(data),
+    }
+
+
+def _execution_columns(run_result: RunResult) -> dict[str, Any]:
+    return {
+        **_stored_text("stdout", run_result.stdout),
+        **_stored_text("stderr", run_result.stderr),
+        "duration_ms": run_result.duration_ms,
+        "exit_code": run_result.exit_code,
+        "outcome": run_result.outcome,
+        "peak_memory_kb": run_result.peak_memory_kb,
+    }
+
+
+def _ran_submission(
+    exercise_id: uuid.UUID, payload: CodeExecutionRequest, run_result: RunResult
+) -> Submission:
+    return Submission(
+        exercise_id=exercise_id,
+        **_stored_text("code", payload.code),
         language=payload.language,
+        user_id=payload.user_id,
+        kind="run",
         status="ran",
-        stdout=stdout,
-        stderr=stderr,
-        duration_ms=duration_ms,
+        **_execution_columns(run_result),
     )
-    session.add(submission)
-    session.commit()
 
-    return RunResult(stdout=stdout, stderr=stderr, duration_ms=duration_ms)
 
+def _graded_submission(
+    exercise_id: uuid.UUID, payload: CodeExecutionRequest, result: SubmissionResult
+) -> Submission:
+    return Submission(
+        exercise_id=exercise_id,
+        **_stored_text("code", payload.code),
+        language=payload.language,
+        user_id=payload.user_id,
+        kind="submit",
+        status=result.status,
+        score=result.score,
+        tests_run=result.details.tests_run,
+        tests_failed=result.details.tests_failed,
+        **_execution_columns(result),
+    )
 
-def submit_code(session: Session, exercise: Exercise, payload: CodeExecutionRequest) -> SubmissionResult:
-    run_result = run_code(session, exercise, payload)
-    # Simple scoring heuristic; in the absence of real tests we mark everything passed.
-    details = SubmissionDetails(tests_run=1, tests_failed=0)
-    status = "passed" if not run_result.stderr else "failed"
 
-    submission = Submission(
-        exercise_id=exercise.id,
-        code=payload.code,
-        language=payload.language,
-        status=status,
-        stdout=run_result.stdout,
-        stderr=run_result.stderr,
-        duration_ms=run_result.duration_ms,
-        score=1.0 if status == "passed" else 0.0,
-        tests_run=details.tests_run,
-        tests_failed=details.tests_failed,
+_SUMMARY_COLUMNS = (
+    Submission.id,
+    Submission.kind,
+    Submission.language,
+    Submission.status,
+    Submission.duration_ms,
+    Submission.exit_code,
+    Submission.outcome,
+    Submission.peak_memory_kb,
+    Submission.score,
+    Submission.tests_run,
+    Submission.tests_failed,
+    Submission.created_at,
+    Submission.code_bytes,
+    Submission.stdout_bytes,
+    Submission.stderr_bytes,
+)
+
+
+def _encode_cursor(created_at: datetime, submission_id: uuid.UUID) -> str:
+    raw = f"{created_at.isoformat()}|{submission_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, submission_id = raw.split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(submission_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from exc
+
+
+async def list_submissions(
+    session: AsyncSession,
+    exercise_id: uuid.UUID,
+    limit: int,
+    cursor: str | None = None,
+    include: Iterable[SubmissionTextField] = (),
+    status: str | None = None,
+) -> SubmissionPage:
+    """Page through an exercise's submissions, newest first, with a keyset cursor.
+
+    TEXT columns are only selected when listed in ``include``.
+    """
+
+    text_columns = [getattr(Submission, name) for name in dict.fromkeys(include)]
+    query = (
+        select(*_SUMMARY_COLUMNS, *text_columns)
+        .where(Submission.exercise_id == exercise_id)
+        .order_by(Submission.created_at.desc(), Submission.id.desc())
+        .limit(limit + 1)
     )
-    session.add(submission)
-    session.commit()
+    if status:
+        query = query.where(Submission.status == status)
+    if cursor:
+        query = query.where(tuple_(Submission.created_at, Submission.id) < _decode_cursor(cursor))
+
+    rows = (await session.execute(query)).mappings().all()
+    items = [SubmissionSummary.model_validate(dict(row)) for row in rows[:limit]]
+    next_cursor = _encode_cursor(items[-1].created_at, items[-1].id) if len(rows) > limit else None
+    return SubmissionPage(items=items, next_cursor=next_cursor)
+
+
+async def read_submission_text(
+    session: AsyncSession, submission_id: uuid.UUID, field: SubmissionTextField
+) -> str:
+    """Full code or output of a submission, loaded from the blob store when it was moved there."""
+
+    row = (
+        await session.execute(
+            select(getattr(Submission, field), getattr(Submission, f"{field}_blob")).where(
+                Submission.id == submission_id
+            )
+        )
+    ).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    value, digest = row
+    if digest is None:
+        return value
+    try:
+        data = await run_in_threadpool(get_blob_store().get, digest)
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=f"Stored {field} is no longer available") from exc
+    return data.decode("utf-8", errors="replace")
+
 
+def _submission_result(report: GradeReport) -> SubmissionResult:
     return SubmissionResult(
-        status=status,
-        score=float(submission.score or 0.0),
-        stdout=run_result.stdout,
-        stderr=run_result.stderr,
-        duration_ms=run_result.duration_ms,
-        details=details,
+        **report.run_result.model_dump(),
+        status=report.status,
+        score=report.score,
+        details=report.details,
+    )
+
+
+async def run_code(
+    session: AsyncSession, exercise: ExerciseRecord, payload: CodeExecutionRequest
+) -> RunResult:
+    def execute() -> RunResult:
+        with timed("sandbox"):
+            return _run_result(get_sandbox_pool().execute(payload.language, payload.code))
+
+    try:
+        run_result = await run_in_threadpool(_with_result_cache, exercise, "run", payload, RunResult, execute)
+    except UnsupportedLanguageError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except SandboxError as exc:
+        raise HTTPException(status_code=503, detail="Code execution is temporarily unavailable.") from exc
+
+    try:
+        session.add(await run_in_threadpool(_ran_submission, exercise.id, payload, run_result))
+        await session.commit()
+    except IntegrityError as exc:
+        raise await _exercise_deleted(session, exercise.id) from exc
+    return run_result
+
+
+async def _send_live(websocket: WebSocket, message: dict[str, Any]) -> bool:
+    """Send ``message``; False if the client has gone away."""
+
+    if websocket.client_state != WebSocketState.CONNECTED:
+        return False
+    try:
+        await websocket.send_json(message)
+    except (WebSocketDisconnect, OSError, RuntimeError):
+        # Depending on the server, a send racing the client's close raises any of these.
+        return False
+    return True
+
+
+async def _close_live_run(
+    websocket: WebSocket, message: dict[str, Any], code: int = status.WS_1000_NORMAL_CLOSURE
+) -> None:
+    if await _send_live(websocket, message):
+        try:
+            await websocket.close(code=code)
+        except (WebSocketDisconnect, OSError, RuntimeError):
+            pass
+
+
+async def _forward_live_input(websocket: WebSocket, run: InteractiveRun) -> None:
+    try:
+        while True:
+            message = LiveRunInput.model_validate(await websocket.receive_json())
+            if message.type == "stdin":
+                await run_in_threadpool(run.write_stdin, message.data)
+            elif message.type == "stdin_eof":
+                await run_in_threadpool(run.close_stdin)
+            else:
+                await run_in_threadpool(run.kill)
+    except (WebSocketDisconnect, KeyError, ValueError):
+        # The client left or sent something unusable; either way the program is stopped.
+        await run_in_threadpool(run.kill)
+
+
+async def run_code_live(websocket: WebSocket, exercise_id: uuid.UUID) -> None:
+    """Serve one live run on an accepted WebSocket.
+
+    Output chunks are pulled from the sandbox only as fast as they are sent,
+    so a slow client stalls the program instead of its output piling up here.
+    The capped, final output is stored as a ``run`` submission and sent last.
+    Live runs are never served from or stored in the result cache: their
+    output depends on what the learner types.
+    """
+
+    try:
+        payload = LiveRunStart.model_validate(await websocket.receive_json())
+    except WebSocketDisconnect:
+        return
+    except (KeyError, ValueError):
+        detail = "The first message must be a JSON object with code and language."
+        await _close_live_run(websocket, {"type": "error", "detail": detail}, status.WS_1008_POLICY_VIOLATION)
+        return
+
+    async with async_session_scope() as session:
+        try:
+            exercise = await get_exercise_or_404(session, exercise_id)
+        except HTTPException as exc:
+            await _close_live_run(websocket, {"type": "error", "detail": exc.detail}, status.WS_1008_POLICY_VIOLATION)
+            return
+
+    try:
+        run = await open_run(payload.language, payload.code, payload.stdin)
+    except UnsupportedLanguageError as exc:
+        await _close_live_run(websocket, {"type": "error", "detail": str(exc)}, status.WS_1008_POLICY_VIOLATION)
+        return
+    except SandboxError:
+        detail = "Code execution is temporarily unavailable."
+        await _close_live_run(websocket, {"type": "error", "detail": detail}, status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    forward = asyncio.ensure_future(_forward_live_input(websocket, run))
+    try:
+        while (event := await run_in_threadpool(run.next_event)) is not None:
+            if not await _send_live(websocket, {"type": event["event"], "data": event["data"]}):
+                break
+    except SandboxError as exc:
+        logger.warning("Live run failed: %s", exc)
+    finally:
+        forward.cancel()
+        # Stops the program if the loop ended early and waits for its final result.
+        await run_in_threadpool(run.close)
+
+    if run.result is None:
+        error = {"type": "error", "detail": "Code execution failed."}
+        await _close_live_run(websocket, error, status.WS_1011_INTERNAL_ERROR)
+        return
+    run_result = _run_result(run.result)
+    async with async_session_scope() as session:
+        try:
+            session.add(await run_in_threadpool(_ran_submission, exercise.id, payload, run_result))
+            await session.commit()
+        except IntegrityError as exc:
+            error = await _exercise_deleted(session, exercise.id)
+            await _close_live_run(websocket, {"type": "error", "detail": error.detail}, status.WS_1008_POLICY_VIOLATION)
+            return
+    # The client already has the output from the chunks; the summary would only repeat it.
+    summary = run_result.model_dump(mode="json", exclude={"stdout", "stderr"})
+    await _close_live_run(websocket, {"type": "result", "result": summary})
+
+
+async def _grade(exercise: ExerciseRecord, payload: CodeExecutionRequest) -> SubmissionResult:
+    def grade() -> SubmissionResult:
+        return _submission_result(
+            grade_submission(payload.language, payload.code, _exercise_tests(exercise), payload.fail_fast)
+        )
+
+    try:
+        return await run_in_threadpool(_with_result_cache, exercise, "submit", payload, SubmissionResult, grade)
+    except UnsupportedLanguageError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except SandboxError as exc:
+        raise HTTPException(status_code=503, detail="Code execution is temporarily unavailable.") from exc
+
+
+async def submit_code(
+    session: AsyncSession, exercise: ExerciseRecord, payload: CodeExecutionRequest
+) -> SubmissionResult:
+    result = await _grade(exercise, payload)
+    try:
+        session.add(await run_in_threadpool(_graded_submission, exercise.id, payload, result))
+        await record_submit(session, exercise, result, payload.user_id)
+        await session.commit()
+    except IntegrityError as exc:
+        raise await _exercise_deleted(session, exercise.id) from exc
+    if payload.user_id:
+        await invalidate_user_context(payload.user_id)
+    return result
+
+
+def _load_exercise(session: Session, exercise_id: uuid.UUID) -> ExerciseRecord:
+    cache = _get_exercise_cache()
+    raw = cache.get_sync(cache.key(exercise_id)) if cache else None
+    if raw:
+        return ExerciseRecord.model_validate_json(raw)
+
+    exercise = session.get(Exercise, exercise_id)
+    if exercise is None:
+        raise LookupError(f"Exercise {exercise_id} not found")
+    record = ExerciseRecord.model_validate(exercise)
+    if cache:
+        cache.set_sync(cache.key(exercise_id), record.model_dump_json().encode())
+    return record
+
+
+def _exercise_deleted_sync(session: Session, exercise_id: uuid.UUID) -> LookupError:
+    session.rollback()
+    cache = _get_exercise_cache()
+    if cache:
+        cache.delete_sync(cache.key(exercise_id))
+    return LookupError(f"Exercise {exercise_id} not found")
+
+
+def run_code_sync(
+    session: Session,
+    exercise_id: uuid.UUID,
+    payload: CodeExecutionRequest,
+    progress: ProgressCallback | None = None,
+) -> RunResult:
+    """Blocking variant of :func:`run_code` used by Celery workers."""
+
+    exercise = _load_exercise(session, exercise_id)
+
+    def execute() -> RunResult:
+        if progress:
+            progress("running")
+        return _run_result(get_sandbox_pool().execute(payload.language, payload.code))
+
+    run_result = _with_result_cache(exercise, "run", payload, RunResult, execute)
+
+    try:
+        session.add(_ran_submission(exercise_id, payload, run_result))
+        session.commit()
+    except IntegrityError as exc:
+        raise _exercise_deleted_sync(session, exercise_id) from exc
+    return run_result
+
+
+def submit_code_sync(
+    session: Session,
+    exercise_id: uuid.UUID,
+    payload: CodeExecutionRequest,
+    progress: ProgressCallback | None = None,
+) -> SubmissionResult:
+    """Blocking variant of :func:`submit_code` used by Celery workers."""
+
+    exercise = _load_exercise(session, exercise_id)
+
+    def grade() -> SubmissionResult:
+        if progress:
+            progress("running")
+        report = grade_submission(
+            payload.language, payload.code, _exercise_tests(exercise), payload.fail_fast, progress
+        )
+        return _submission_result(report)
+
+    result = _with_result_cache(exercise, "submit", payload, SubmissionResult, grade)
+
+    try:
+        session.add(_graded_submission(exercise_id, payload, result))
+        record_submit_sync(session, exercise, result, payload.user_id)
+        session.commit()
+    except IntegrityError as exc:
+        raise _exercise_deleted_sync(session, exercise_id) from exc
+    if payload.user_id:
+        invalidate_user_context_sync(payload.user_id)
+    return result
+
+
+def _ndjson(line: BaseModel) -> bytes:
+    return line.model_dump_json(exclude_none=True).encode() + b"\n"
+
+
+def _batch_error(exc: Exception) -> str:
+    if isinstance(exc, HTTPException):
+        return str(exc.detail)
+    logger.warning("Batch item failed: %s", exc)
+    return "Internal error"
+
+
+async def _fan_out(
+    items: list[T], work: Callable[[T], Awaitable[Any]]
+) -> AsyncIterator[tuple[int, Any, Exception | None]]:
+    """Run ``work`` on every item with at most ``batch_max_concurrency`` in flight.
+
+    Yields ``(index, value, error)`` in completion order. Pending work is
+    cancelled if the consumer stops early, e.g. when the client disconnects.
+    """
+
+    semaphore = asyncio.Semaphore(get_settings().batch_max_concurrency)
+
+    async def run(index: int, item: T) -> tuple[int, Any, Exception | None]:
+        async with semaphore:
+            try:
+                return index, await work(item), None
+            except Exception as exc:  # noqa: BLE001 - reported on the item's line
+                return index, None, exc
+
+    tasks = [asyncio.create_task(run(index, item)) for index, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def _commit_batch(
+    rows: list[Any], statements: Callable[[AsyncSession], Awaitable[None]] | None = None
+) -> bool:
+    if not rows:
+        return False
+    # A fresh session: the request's own session is closed before a streamed body is sent.
+    async with async_session_scope() as session:
+        try:
+            # One flush: SQLAlchemy sends same-table rows as multi-row INSERTs.
+            session.add_all(rows)
+            if statements:
+                await statements(session)
+            await session.commit()
+        except SQLAlchemyError as exc:
+            await session.rollback()
+            logger.warning("Committing a batch of %s rows failed: %s", len(rows), exc)
+            return False
+    return True
+
+
+async def generate_exercise_batch(items: list[ExerciseRequest]) -> AsyncIterator[bytes]:
+    """Stream one NDJSON line per generated exercise, then store them all in one transaction."""
+
+    async def build(payload: ExerciseRequest) -> Exercise:
+        # Not coalesced: a problem set wants distinct exercises for identical requests.
+        return _new_exercise(await take_exercise(payload) or await generate_exercise(payload, coalesce=False))
+
+    exercises: list[Exercise] = []
+    async for index, exercise, error in _fan_out(items, build):
+        if error:
+            yield _ndjson(ExerciseBatchLine(index=index, error=_batch_error(error)))
+            continue
+        exercises.append(exercise)
+        yield _ndjson(ExerciseBatchLine(index=index, exercise=ExerciseResponse.model_validate(exercise)))
+
+    committed = await _commit_batch(exercises)
+    yield _ndjson(
+        BatchDone(succeeded=len(exercises), failed=len(items) - len(exercises), committed=committed)
     )
 
 
+async def load_batch_exercises(
+    session: AsyncSession, items: list[SubmissionBatchItem]
+) -> dict[uuid.UUID, ExerciseRecord]:
+    exercises = {}
+    for exercise_id in {item.exercise_id for item in items}:
+        try:
+            exercises[exercise_id] = await get_exercise_or_404(session, exercise_id)
+        except HTTPException:
+            continue
+    return exercises
+
+
+async def grade_submission_batch(
+    exercises: dict[uuid.UUID, ExerciseRecord], items: list[SubmissionBatchItem]
+) -> AsyncIterator[bytes]:
+    """Grade every item concurrently, streaming results as they finish.
+
+    ``exercises`` holds the items' exercises that exist (see
+    :func:`load_batch_exercises`). Submissions and their statistics are written
+    together in one transaction after the last item.
+    """
+
+    async def grade(item: SubmissionBatchItem) -> tuple[SubmissionResult, Submission]:
+        exercise = exercises.get(item.exercise_id)
+        if exercise is None:
+            raise HTTPException(status_code=404, detail="Exercise not found")
+        result = await _grade(exercise, item)
+        return result, await run_in_threadpool(_graded_submission, exercise.id, item, result)
+
+    graded: list[tuple[SubmissionBatchItem, SubmissionResult]] = []
+    rows: list[Submission] = []
+    async for index, value, error in _fan_out(items, grade):
+        item = items[index]
+        if error:
+            yield _ndjson(SubmissionBatchLine(index=index, exercise_id=item.exercise_id, error=_batch_error(error)))
+            continue
+        result, row = value
+        graded.append((item, result))
+        rows.append(row)
+        yield _ndjson(SubmissionBatchLine(index=index, exercise_id=item.exercise_id, result=result))
+
+    async def record_stats(session: AsyncSession) -> None:
+        for item, result in graded:
+            await record_submit(session, exercises[item.exercise_id], result, item.user_id)
+
+    committed = await _commit_batch(rows, record_stats)
+    if committed:
+        for user_id in {item.user_id for item, _ in graded if item.user_id}:
+            await invalidate_user_context(user_id)
+    yield _ndjson(BatchDone(succeeded=len(rows), failed=len(items) - len(rows), committed=committed))
+
+
+ReplyRecorder = Callable[[str], Awaitable[None]]
+
+
 def _build_chat_messages(
-    payload: ChatRequest, exercise: Exercise | None
+    payload: ChatRequest, exercise: ExerciseRecord | None, history: PromptHistory | None = None
 ) -> list[dict[str, str]]:
     system_parts: list[str] = [
         "You are a helpful coding tutor guiding a learner through a short exercise.",
@@ -191,47 +905,45 @@ def _build_chat_messages(
         )
         system_parts.append(f"Prompt: {exercise.prompt_markdown}")
 
+    if history is None:
+        history = trim_history(payload.conversation_history, payload.message)
+    if history.summary:
+        system_parts.append(f"Summary of the earlier conversation: {history.summary}")
+
     messages: list[dict[str, str]] = [
         {"role": "system", "content": " ".join(system_parts)},
+        *history.messages,
     ]
-
-    for item in payload.conversation_history:
-        if item.role in {"user", "assistant", "system"}:
-            messages.append({"role": item.role, "content": item.content})
-
     messages.append({"role": "user", "content": payload.message})
     return messages
 
 
-def _fallback_chat_response(payload: ChatRequest, exercise: Exercise | None) -> str:
+def _fallback_chat_response(
+    payload: ChatRequest, exercise: ExerciseRecord | None, history: PromptHistory | None = None
+) -> str:
     intro = ""
     if exercise:
         intro = f"I'll help with the exercise '{exercise.title}'. "
-    history_hint = (
-        f"Previously we discussed {len(payload.conversation_history)} messages. "
-        if payload.conversation_history
-        else ""
-    )
+    previous = len(history.messages) + history.overflow if history else len(payload.conversation_history)
+    history_hint = f"Previously we discussed {previous} messages. " if previous else ""
     return f"{intro}{history_hint}Here is a quick hint: try breaking the problem into small steps and test your code frequently."
 
 
 async def _perform_chat_completion(
-    payload: ChatRequest, exercise: Exercise | None
-) -> tuple[str, int]:
+    payload: ChatRequest, exercise: ExerciseRecord | None, history: PromptHistory | None = None
+) -> tuple[str, int, bool]:
     settings = get_settings()
-    if not settings.azure_openai_endpoint or not settings.azure_openai_api_key or not settings.azure_openai_deployment:
-        fallback_text = _fallback_chat_response(payload, exercise)
-        return fallback_text, 0
-
-    client = AsyncAzureOpenAI(
-        api_key=settings.azure_openai_api_key,
-        api_version=settings.azure_openai_api_version,
-        azure_endpoint=settings.azure_openai_endpoint,
-    )
+    if not is_configured(settings):
+        fallback_text = _fallback_chat_response(payload, exercise, history)
+        return fallback_text, 0, False
+
+    messages = _build_chat_messages(payload, exercise, history)
+    cache = get_chat_cache()
+    lookup = await cache.lookup(exercise.id if exercise else None, messages) if cache else None
+    if lookup and lookup.answer:
+        return lookup.answer.response, 0, True
 
-    messages = _build_chat_messages(payload, exercise)
-    completion = await client.chat.completions.create(
-        model=settings.azure_openai_deployment,
+    completion = await chat_completion(
         messages=messages,
         temperature=0.4,
         max_tokens=350,
@@ -239,28 +951,211 @@ async def _perform_chat_completion(
 
     content = completion.choices[0].message.content or ""
     tokens_used = completion.usage.total_tokens if completion.usage else 0
-    return content, tokens_used
+    if lookup and content:
+        await cache.store(lookup, CachedAnswer(content, tokens_used))
+    return content, tokens_used, False
+
 
+async def chat_batch_response(
+    payload: ChatRequest,
+    exercise: ExerciseRecord | None,
+    history: PromptHistory | None = None,
+    on_reply: ReplyRecorder | None = None,
+) -> ChatBatchResponse:
+    content, tokens_used, cached = await _perform_chat_completion(payload, exercise, history)
+    if on_reply:
+        await on_reply(content)
+    return ChatBatchResponse(response=content, tokens_used=tokens_used, cached=cached)
 
-async def chat_batch_response(payload: ChatRequest, exercise: Exercise | None) -> ChatBatchResponse:
-    content, tokens_used = await _perform_chat_completion(payload, exercise)
-    return ChatBatchResponse(response=content, tokens_used=tokens_used)
 
+async def summarize_history(previous_summary: str | None, messages: list[dict[str, str]]) -> str:
+    """Fold ``messages`` into the rolling conversation summary."""
 
-async def chat_stream_response(payload: ChatRequest, exercise: Exercise | None):
-    content, _ = await _perform_chat_completion(payload, exercise)
+    transcript = "\n".join(f"{item['role']}: {item['content']}" for item in messages)
+    prompt = (
+        f"Current summary:\n{previous_summary}\n\nNew messages:\n{transcript}"
+        if previous_summary
+        else f"Messages:\n{transcript}"
+    )
+    completion = await chat_completion(
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "Summarize this tutoring conversation for the tutor's own reference. "
+                    "Keep what the learner has tried, what they are stuck on and hints already given. "
+                    "Be brief and factual."
+                ),
+            },
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.2,
+        max_tokens=get_settings().chat_summary_max_tokens,
+    )
+    return completion.choices[0].message.content or previous_summary or ""
+
+
+async def prepare_chat_turn(
+    session: AsyncSession, payload: ChatRequest
+) -> tuple[ExerciseRecord | None, PromptHistory | None, ReplyRecorder | None]:
+    """Resolve the exercise and, for server-side conversations, the stored history.
+
+    Without a ``conversation_id`` the client-supplied history is used and nothing
+    is persisted.
+    """
+
+    conversation = (
+        await get_conversation_or_404(session, payload.conversation_id) if payload.conversation_id else None
+    )
+    exercise_id = payload.exercise_id or (conversation.exercise_id if conversation else None)
+    exercise = await get_exercise_or_404(session, exercise_id) if exercise_id else None
+    if conversation is None:
+        return exercise, None, None
+    history, on_reply = await start_turn(session, conversation, payload.message)
+    return exercise, history, on_reply
 
+
+def _sse_event(event: dict[str, Any]) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+
+async def _stream_chat_completion(
+    payload: ChatRequest, exercise: ExerciseRecord | None, history: PromptHistory | None = None
+) -> AsyncIterator[tuple[str, int, bool]]:
+    """Yield ``(delta, tokens_used, cached)`` as deltas arrive from Azure.
+
+    ``tokens_used`` is only non-zero on the final usage chunk. A cached answer
+    is yielded as a single delta. The upstream stream is closed in ``finally``
+    so a client disconnect (which closes this generator) also aborts the HTTP
+    request to Azure; an interrupted answer is never cached.
+    """
+
+    settings = get_settings()
+    if not is_configured(settings):
+        yield _fallback_chat_response(payload, exercise, history), 0, False
+        return
+
+    messages = _build_chat_messages(payload, exercise, history)
+    cache = get_chat_cache()
+    lookup = await cache.lookup(exercise.id if exercise else None, messages) if cache else None
+    if lookup and lookup.answer:
+        yield lookup.answer.response, 0, True
+        return
+
+    stream = await chat_completion(
+        messages=messages,
+        temperature=0.4,
+        max_tokens=350,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    parts: list[str] = []
+    total_tokens = 0
+    try:
+        async for chunk in stream:
+            tokens_used = chunk.usage.total_tokens if chunk.usage else 0
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta or tokens_used:
+                parts.append(delta or "")
+                total_tokens = tokens_used or total_tokens
+                yield delta or "", tokens_used, False
+        count_llm_tokens("chat", total_tokens)
+        if lookup and any(parts):
+            await cache.store(lookup, CachedAnswer("".join(parts), total_tokens))
+    finally:
+        # Shielded so the close still runs when the request task is cancelled.
+        with anyio.CancelScope(shield=True):
+            await stream.close()
+
+
+async def chat_stream_response(
+    payload: ChatRequest,
+    exercise: ExerciseRecord | None,
+    history: PromptHistory | None = None,
+    on_reply: ReplyRecorder | None = None,
+):
     async def _gen():
-        if not content:
-            yield "data: {\"type\": \"done\"}\n\n"
+        tokens_used = 0
+        cached = False
+        # The full reply is only kept when it has to be persisted.
+        parts: list[str] | None = [] if on_reply else None
+        try:
+            async for delta, usage, cached in _stream_chat_completion(payload, exercise, history):
+                tokens_used = usage or tokens_used
+                if delta:
+                    if parts is not None:
+                        parts.append(delta)
+                    yield _sse_event({"type": "message", "content": delta})
+        except Exception as exc:  # noqa: BLE001 - surfaced to the client as an SSE event
+            yield _sse_event({"type": "error", "detail": str(exc) or exc.__class__.__name__})
             return
 
-        chunk_size = 400
-        for idx in range(0, len(content), chunk_size):
-            chunk = content[idx : idx + chunk_size]
-            message = json.dumps({"type": "message", "content": chunk})
-            yield f"data: {message}\n\n"
+        if on_reply:
+            await on_reply("".join(parts))
+        yield _sse_event({"type": "done", "tokens_used": tokens_used, "cached": cached})
+
+    return _gen()
+
+
+_JOB_STATES = {
+    "PENDING": "queued",
+    "RECEIVED": "queued",
+    "RETRY": "queued",
+    "STARTED": "running",
+    "PROGRESS": "running",
+    "SUCCESS": "done",
+    "FAILURE": "failed",
+    "REVOKED": "failed",
+}
+
+
+def get_job_status(job_id: str) -> JobStatus:
+    meta = celery.backend.get_task_meta(job_id)
+    state = meta.get("status", "PENDING")
+    info = meta.get("result")
+    job = JobStatus(job_id=job_id, status=_JOB_STATES.get(state, "running"))
 
-        yield "data: {\"type\": \"done\"}\n\n"
+    if state == "PROGRESS" and isinstance(info, dict):
+        job.stage = info.get("stage")
+        job.current = info.get("current")
+        job.total = info.get("total")
+    elif job.status == "running":
+        job.stage = "running"
+    elif job.status == "done" and isinstance(info, dict):
+        job.result = info
+    elif job.status == "failed":
+        job.error = str(info) if info else state.lower()
+    return job
+
+
+async def job_event_stream(job_id: str):
+    """Poll the Celery result backend and emit an SSE event whenever the job changes."""
+
+    settings = get_settings()
+    interval = settings.job_poll_interval_seconds
+    # Celery reports an unknown or expired id as PENDING forever, just like a queued job.
+    max_pending_polls = max(1, int(settings.job_pending_timeout_seconds / interval))
+
+    async def _gen():
+        last: JobStatus | None = None
+        pending_polls = 0
+        while True:
+            job = await run_in_threadpool(get_job_status, job_id)
+            pending_polls = pending_polls + 1 if job.status == "queued" else 0
+            if pending_polls > max_pending_polls:
+                job.status = "failed"
+                job.error = "Unknown or expired job"
+                yield _sse_event({"type": "error", **job.model_dump()})
+                return
+            if job.status == "done":
+                yield _sse_event({"type": "done", **job.model_dump()})
+                return
+            if job.status == "failed":
+                yield _sse_event({"type": "error", **job.model_dump()})
+                return
+            if job != last:
+                yield _sse_event({"type": "progress", **job.model_dump()})
+                last = job
+            await asyncio.sleep(interval)
 
     return _gen()
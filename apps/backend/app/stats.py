@@ -0,0 +1,176 @@
+"""Incrementally maintained submission statistics.
+
+Every submit upserts one ``exercise_stats`` row and, when the request names a
+user, one ``user_stats`` row, in the same transaction as the submission
+itself. Reads are a primary-key lookup instead of a scan of ``submissions``.
+
+Scores go into 11 buckets (0.0, 0.1, ... 1.0). Durations go into a log-scale
+sketch: bucket ``i`` covers ``[2**((i-1)/4), 2**(i/4))`` ms, so quantiles read
+from it are within ~10% of the exact value.
+"""
+
+import math
+import uuid
+from typing import Any
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .models import ExerciseStats, UserStats
+from .schemas import ExerciseRecord, ExerciseStatsResponse, SubmissionResult
+
+SCORE_BUCKETS = 11
+DURATION_BUCKETS = 64
+DURATION_BUCKETS_PER_DOUBLING = 4
+
+# Arrays are 1-based in Postgres; the bucket index is passed already shifted.
+_UPSERT_EXERCISE_STATS = text(
+    f"""
+    INSERT INTO exercise_stats (
+        exercise_id, attempts, passes, score_sum, score_histogram, duration_histogram, updated_at
+    )
+    VALUES (
+        :exercise_id, 1, :passed, :score,
+        array_fill(0, ARRAY[{SCORE_BUCKETS}]), array_fill(0, ARRAY[{DURATION_BUCKETS}]), now()
+    )
+    ON CONFLICT (exercise_id) DO UPDATE SET
+        attempts = exercise_stats.attempts + 1,
+        passes = exercise_stats.passes + EXCLUDED.passes,
+        score_sum = exercise_stats.score_sum + EXCLUDED.score_sum,
+        updated_at = EXCLUDED.updated_at
+    """
+)
+_BUMP_HISTOGRAMS = text(
+    """
+    UPDATE exercise_stats SET
+        score_histogram[:score_bucket] = score_histogram[:score_bucket] + 1,
+        duration_histogram[:duration_bucket] = duration_histogram[:duration_bucket] + 1
+    WHERE exercise_id = :exercise_id
+    """
+)
+_UPSERT_USER_STATS = text(
+    """
+    INSERT INTO user_stats (user_id, language, difficulty, attempts, passes, score_sum, updated_at)
+    VALUES (:user_id, :language, :difficulty, 1, :passed, :score, now())
+    ON CONFLICT (user_id, language, difficulty) DO UPDATE SET
+        attempts = user_stats.attempts + 1,
+        passes = user_stats.passes + EXCLUDED.passes,
+        score_sum = user_stats.score_sum + EXCLUDED.score_sum,
+        updated_at = EXCLUDED.updated_at
+    """
+)
+
+
+def score_bucket(score: float) -> int:
+    return min(SCORE_BUCKETS - 1, max(0, round(score * (SCORE_BUCKETS - 1))))
+
+
+def duration_bucket(duration_ms: float) -> int:
+    if duration_ms < 1:
+        return 0
+    return min(DURATION_BUCKETS - 1, int(math.log2(duration_ms) * DURATION_BUCKETS_PER_DOUBLING) + 1)
+
+
+def duration_bucket_bounds(bucket: int) -> tuple[float, float]:
+    if bucket == 0:
+        return 0.0, 1.0
+    return (
+        2 ** ((bucket - 1) / DURATION_BUCKETS_PER_DOUBLING),
+        2 ** (bucket / DURATION_BUCKETS_PER_DOUBLING),
+    )
+
+
+def duration_quantile(histogram: list[int], quantile: float) -> float | None:
+    """Estimate a duration quantile as the geometric midpoint of the bucket holding it."""
+
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = quantile * total
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if count and seen >= rank:
+            low, high = duration_bucket_bounds(bucket)
+            return round(math.sqrt(low * high) if low else high / 2, 1)
+    return None
+
+
+def _statements(
+    exercise: ExerciseRecord, result: SubmissionResult, user_id: str | None
+) -> list[tuple[Any, dict[str, Any]]]:
+    passed = int(result.status == "passed")
+    statements = [
+        (
+            _UPSERT_EXERCISE_STATS,
+            {
+                "exercise_id": exercise.id,
+                "passed": passed,
+                "score": result.score,
+            },
+        ),
+        (
+            _BUMP_HISTOGRAMS,
+            {
+                "exercise_id": exercise.id,
+                "score_bucket": score_bucket(result.score) + 1,
+                "duration_bucket": duration_bucket(result.duration_ms) + 1,
+            },
+        ),
+    ]
+    if user_id:
+        statements.append(
+            (
+                _UPSERT_USER_STATS,
+                {
+                    "user_id": user_id,
+                    "language": exercise.language.lower(),
+                    "difficulty": exercise.difficulty,
+                    "passed": passed,
+                    "score": result.score,
+                },
+            )
+        )
+    return statements
+
+
+async def record_submit(
+    session: AsyncSession, exercise: ExerciseRecord, result: SubmissionResult, user_id: str | None
+) -> None:
+    """Add the submit to the aggregates; committed together with the submission row."""
+
+    for statement, params in _statements(exercise, result, user_id):
+        await session.execute(statement, params)
+
+
+def record_submit_sync(
+    session: Session, exercise: ExerciseRecord, result: SubmissionResult, user_id: str | None
+) -> None:
+    for statement, params in _statements(exercise, result, user_id):
+        session.execute(statement, params)
+
+
+def exercise_stats_response(exercise_id: uuid.UUID, stats: ExerciseStats | None) -> ExerciseStatsResponse:
+    if stats is None:
+        return ExerciseStatsResponse(exercise_id=exercise_id)
+    return ExerciseStatsResponse(
+        exercise_id=exercise_id,
+        attempts=stats.attempts,
+        passes=stats.passes,
+        pass_rate=round(stats.passes / stats.attempts, 4) if stats.attempts else None,
+        average_score=round(stats.score_sum / stats.attempts, 4) if stats.attempts else None,
+        score_histogram=stats.score_histogram,
+        p50_duration_ms=duration_quantile(stats.duration_histogram, 0.5),
+        p95_duration_ms=duration_quantile(stats.duration_histogram, 0.95),
+    )
+
+
+async def get_exercise_stats(session: AsyncSession, exercise_id: uuid.UUID) -> ExerciseStatsResponse:
+    return exercise_stats_response(exercise_id, await session.get(ExerciseStats, exercise_id))
+
+
+async def get_user_stats(session: AsyncSession, user_id: str) -> list[UserStats]:
+    """All of a user's (language, difficulty) aggregates: one primary-key range read."""
+
+    return list((await session.scalars(select(UserStats).where(UserStats.user_id == user_id))).all())
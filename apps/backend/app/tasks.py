@@ -0,0 +1,93 @@
+import asyncio
+import uuid
+
+from .archive import archive_expired_partitions, ensure_partitions
+from .celery_app import celery
+from .config import get_settings
+from .conversations.service import summarize_conversation_sync
+from .db import session_scope
+from .exercise_pool import configured_buckets, refill_bucket
+from .llm import close_llm_client, is_configured
+from .schemas import CodeExecutionRequest, ExerciseRequest
+from .services import generate_exercise, run_code_sync, submit_code_sync, summarize_history
+
+
+def _progress_reporter(task):
+    def report(stage: str, **info) -> None:
+        task.update_state(state="PROGRESS", meta={"stage": stage, **info})
+
+    return report
+
+
+# A code run is safe to repeat, so only acknowledge it once it has finished and
+# requeue it if the worker process dies mid-run.
+EXECUTION_TASK_OPTIONS = {"acks_late": True, "reject_on_worker_lost": True}
+
+
+@celery.task(bind=True, name="app.tasks.run_code", **EXECUTION_TASK_OPTIONS)
+def run_code_task(self, exercise_id: str, payload: dict) -> dict:
+    request = CodeExecutionRequest.model_validate(payload)
+    with session_scope() as session:
+        result = run_code_sync(session, uuid.UUID(exercise_id), request, _progress_reporter(self))
+    return result.model_dump()
+
+
+@celery.task(bind=True, name="app.tasks.submit_code", **EXECUTION_TASK_OPTIONS)
+def submit_code_task(self, exercise_id: str, payload: dict) -> dict:
+    request = CodeExecutionRequest.model_validate(payload)
+    with session_scope() as session:
+        result = submit_code_sync(session, uuid.UUID(exercise_id), request, _progress_reporter(self))
+    return result.model_dump()
+
+
+def _run_llm(coro_factory):
+    async def run():
+        try:
+            return await coro_factory()
+        finally:
+            # The shared client is bound to this short-lived event loop.
+            await close_llm_client()
+
+    return asyncio.run(run())
+
+
+def _generate_exercises(request: ExerciseRequest, count: int) -> list:
+    return _run_llm(
+        lambda: asyncio.gather(
+            *(generate_exercise(request, coalesce=False) for _ in range(count)), return_exceptions=True
+        )
+    )
+
+
+@celery.task(name="app.tasks.refill_exercise_bucket")
+def refill_exercise_bucket(bucket: str) -> int:
+    if not is_configured(get_settings()):
+        return 0
+    return refill_bucket(bucket, _generate_exercises)
+
+
+@celery.task(name="app.tasks.refill_exercise_pool")
+def refill_exercise_pool() -> dict[str, int]:
+    if not get_settings().exercise_pool_enabled or not is_configured(get_settings()):
+        return {}
+    return {bucket: refill_bucket(bucket, _generate_exercises) for bucket in configured_buckets()}
+
+
+@celery.task(name="app.tasks.summarize_conversation")
+def summarize_conversation_task(conversation_id: str) -> int:
+    if not is_configured(get_settings()):
+        return 0
+    with session_scope() as session:
+        return summarize_conversation_sync(
+            session,
+            uuid.UUID(conversation_id),
+            lambda summary, messages: _run_llm(lambda: summarize_history(summary, messages)),
+        )
+
+
+@celery.task(name="app.tasks.maintain_submission_partitions")
+def maintain_submission_partitions() -> dict:
+    with session_scope() as session:
+        created = ensure_partitions(session)
+        archived = archive_expired_partitions(session)
+    return {"created": created, "archived": archived}
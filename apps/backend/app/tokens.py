@@ -0,0 +1,32 @@
+import functools
+import logging
+
+from .config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Per-message framing overhead used by chat models (role, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+CHARS_PER_TOKEN = 4
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(get_settings().chat_tokenizer_encoding)
+    except Exception as exc:
+        logger.warning("Tokenizer unavailable, estimating token counts: %s", exc)
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(content: str) -> int:
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
@@ -1,23 +1,48 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Depends, Header, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .schemas import UserContext
-from .service import build_user_context
+from ..cache import etag_for, etag_matches
+from ..db import get_async_session
+from .schemas import UserContext, UserContextUpdate
+from .service import update_user_context, user_context_body
 
 router = APIRouter(prefix="/user-context", tags=["user-context"])
 
+USER_ID_QUERY = Query(
+    default="demo-user",
+    max_length=128,
+    description="Backend user identifier; future versions will map this to authenticated users",
+)
+
+
+def _context_response(body: bytes, if_none_match: str | None = None) -> Response:
+    headers = {"ETag": etag_for(body), "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
 
 @router.get("", summary="Get backend-managed user context", response_model=UserContext)
 async def get_user_context(
-    user_id: str = Query(
-        default="demo-user",
-        description="Backend user identifier; future versions will map this to authenticated users",
-    )
-) -> UserContext:
+    user_id: str = USER_ID_QUERY,
+    if_none_match: str | None = Header(default=None),
+    session: AsyncSession = Depends(get_async_session),
+) -> Response:
     """Retrieve the backend user context snapshot.
 
     The backend maintains a long-lived understanding of the learner. The frontend
     can merge this payload with transient context such as chat history, current
-    code, or terminal output before calling downstream services.
+    code, or terminal output before calling downstream services. Send the
+    ``ETag`` back in ``If-None-Match`` to get ``304`` while it is unchanged.
     """
 
-    return build_user_context(user_id)
+    return _context_response(await user_context_body(session, user_id), if_none_match)
+
+
+@router.patch("", summary="Update part of the user context", response_model=UserContext)
+async def patch_user_context(
+    update: UserContextUpdate,
+    user_id: str = USER_ID_QUERY,
+    session: AsyncSession = Depends(get_async_session),
+) -> Response:
+    return _context_response(await update_user_context(session, user_id, update))
@@ -58,3 +58,12 @@ class UserContext(BaseModel):
     )
     last_updated: datetime = Field(description="Last update timestamp of the backend context")
     version: str = Field(description="User context schema version")
+    revision: int = Field(default=0, description="Incremented on every update; 0 until the context is first saved")
+
+
+class UserContextUpdate(BaseModel):
+    """Partial update: omitted fields are kept, and ``profile`` is merged field by field."""
+
+    profile: UserProfile | None = None
+    languages: list[LanguageProficiency] | None = None
+    learning_goals: list[str] | None = None
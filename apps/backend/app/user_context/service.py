@@ -1,6 +1,24 @@
+"""Learner contexts: persisted in ``user_contexts``, served as cached JSON bytes.
+
+``GET /user-context`` is called before every LLM request, so the serialized
+response is kept in a :class:`TwoTierCache` and returned as-is on a hit. Entries
+are keyed on the schema version, so a schema change never serves old bytes, and
+are dropped whenever the context or the user's submit statistics change.
+"""
+
+from collections.abc import Sequence
 from datetime import datetime
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .schemas import LanguageProficiency, LearningPreference, UserContext, UserProfile
+from ..cache import TwoTierCache
+from ..config import Settings, changed_fields, get_settings, on_settings_reload
+from ..models import UserContextRecord, UserStats
+from ..stats import get_user_stats
+from .schemas import LanguageProficiency, LearningPreference, UserContext, UserContextUpdate, UserProfile
+
+SCHEMA_VERSION = "v1"
 
 
 def _default_languages() -> list[LanguageProficiency]:
@@ -37,24 +55,142 @@ def _default_profile() -> UserProfile:
     )
 
 
-def build_user_context(user_id: str) -> UserContext:
-    """Return a backend-managed context snapshot for the given user.
+# A (language, difficulty) pair needs this many graded submits before it counts either way.
+MIN_ATTEMPTS = 3
+STRENGTH_PASS_RATE = 0.8
+OPPORTUNITY_PASS_RATE = 0.5
+
+
+def _stats_label(stats: UserStats) -> str:
+    return f"{stats.language} ({stats.difficulty} exercises)"
 
-    This is a placeholder implementation. Future iterations will load the
-    context from persistent storage and merge updates from analytical pipelines.
-    """
 
-    return UserContext(
-        user_id=user_id,
-        profile=_default_profile(),
-        languages=_default_languages(),
-        learning_goals=[
+def _strengths_and_opportunities(stats: Sequence[UserStats]) -> tuple[list[str], list[str]]:
+    """Split the user's submit aggregates into strong and weak areas, best first."""
+
+    rated = sorted(
+        (row for row in stats if row.attempts >= MIN_ATTEMPTS),
+        key=lambda row: (row.passes / row.attempts, row.attempts),
+        reverse=True,
+    )
+    strengths = [_stats_label(row) for row in rated if row.passes / row.attempts >= STRENGTH_PASS_RATE]
+    opportunities = [
+        _stats_label(row) for row in reversed(rated) if row.passes / row.attempts < OPPORTUNITY_PASS_RATE
+    ]
+    return strengths, opportunities
+
+
+def _default_data() -> dict[str, Any]:
+    """The stored part of a context for users who never saved one."""
+
+    return {
+        "profile": _default_profile().model_dump(mode="json"),
+        "languages": [language.model_dump(mode="json") for language in _default_languages()],
+        "learning_goals": [
             "Strengthen debugging workflows",
             "Prepare for technical interviews focused on system design",
             "Improve code readability and documentation habits",
         ],
-        strengths=["Problem decomposition", "Python tooling", "Testing mindset"],
-        opportunities=["Low-level systems knowledge", "Advanced TypeScript patterns"],
-        last_updated=datetime.utcnow(),
-        version="v1",
+    }
+
+
+def build_user_context(
+    user_id: str, record: UserContextRecord | None = None, stats: Sequence[UserStats] = ()
+) -> UserContext:
+    """Return a backend-managed context snapshot for the given user.
+
+    Profile, languages and goals come from the persisted record, or placeholders
+    when there is none. Strengths and opportunities come from the user's
+    incrementally maintained submit statistics when there are enough of them.
+    """
+
+    strengths, opportunities = _strengths_and_opportunities(stats)
+    timestamps = [row.updated_at for row in stats] + ([record.updated_at] if record else [])
+    return UserContext.model_validate(
+        {
+            **(record.data if record else _default_data()),
+            "user_id": user_id,
+            "strengths": strengths or ["Problem decomposition", "Python tooling", "Testing mindset"],
+            "opportunities": opportunities or ["Low-level systems knowledge", "Advanced TypeScript patterns"],
+            "last_updated": max(timestamps, default=None) or datetime.utcnow(),
+            "version": SCHEMA_VERSION,
+            "revision": record.revision if record else 0,
+        }
     )
+
+
+_cache: TwoTierCache | None = None
+
+
+def _get_cache() -> TwoTierCache | None:
+    global _cache
+    settings = get_settings()
+    if not settings.user_context_cache_enabled:
+        return None
+    if _cache is None:
+        _cache = TwoTierCache(
+            "user_context",
+            settings.user_context_cache_max_entries,
+            settings.user_context_cache_ttl_seconds,
+            local_ttl_seconds=settings.user_context_cache_local_ttl_seconds,
+        )
+    return _cache
+
+
+@on_settings_reload
+def _reset_user_context_cache(previous: Settings, current: Settings) -> None:
+    global _cache
+    if changed_fields(previous, current, "user_context_cache_"):
+        _cache = None
+
+
+async def _render(session: AsyncSession, user_id: str, record: UserContextRecord | None) -> bytes:
+    context = build_user_context(user_id, record, await get_user_stats(session, user_id))
+    body = context.model_dump_json().encode()
+    cache = _get_cache()
+    if cache:
+        await cache.set(cache.key(SCHEMA_VERSION, user_id), body)
+    return body
+
+
+async def user_context_body(session: AsyncSession, user_id: str) -> bytes:
+    """Serialized context for ``user_id``; a cache hit skips validation and serialization."""
+
+    cache = _get_cache()
+    body = await cache.get(cache.key(SCHEMA_VERSION, user_id)) if cache else None
+    if body is not None:
+        return body
+    return await _render(session, user_id, await session.get(UserContextRecord, user_id))
+
+
+async def update_user_context(session: AsyncSession, user_id: str, update: UserContextUpdate) -> bytes:
+    changes = update.model_dump(mode="json", exclude_unset=True, exclude_none=True)
+    record = await session.get(UserContextRecord, user_id, with_for_update=True)
+    data = dict(record.data) if record else _default_data()
+    if "profile" in changes:
+        changes["profile"] = {**data.get("profile", {}), **changes["profile"]}
+    data.update(changes)
+    # Validated again as a whole so a partial profile cannot store an invalid merge.
+    data = UserContextUpdate.model_validate(data).model_dump(mode="json")
+
+    if record is None:
+        record = UserContextRecord(user_id=user_id, data=data, revision=1)
+        session.add(record)
+    else:
+        record.data = data
+        record.revision += 1
+    await session.commit()
+    # Overwrites the cached bytes here and in Redis; other processes catch up within the local TTL.
+    return await _render(session, user_id, record)
+
+
+async def invalidate_user_context(user_id: str) -> None:
+    cache = _get_cache()
+    if cache:
+        await cache.delete(cache.key(SCHEMA_VERSION, user_id))
+
+
+def invalidate_user_context_sync(user_id: str) -> None:
+    cache = _get_cache()
+    if cache:
+        cache.delete_sync(cache.key(SCHEMA_VERSION, user_id))
@@ -0,0 +1,79 @@
+"""Compare two ``benchmarks.load`` reports, e.g. before and after a change.
+
+Run from apps/backend:
+
+    python -m benchmarks.compare before.json after.json
+
+For every concurrency level and operation present in both reports, prints
+throughput and p50/p95/p99 latency side by side with the relative change.
+Latency increases and throughput drops beyond ``--threshold`` percent are
+flagged; the exit status is 1 when any is, so the comparison can gate CI.
+"""
+
+import argparse
+import json
+from pathlib import Path
+from typing import Any
+
+# (label, path in the operation's report, whether higher is better)
+METRICS = [
+    ("rps", ("rps",), True),
+    *((f"{q}_ms", ("latency_ms", q), False) for q in ("p50", "p95", "p99")),
+    ("ttfb_p95", ("ttfb_ms", "p95"), False),
+]
+
+
+def _get(operation: dict[str, Any], path: tuple[str, ...]) -> float | None:
+    value: Any = operation
+    for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def _change(before: float | None, after: float | None) -> float | None:
+    if before is None or after is None or before == 0:
+        return None
+    return (after - before) / before * 100
+
+
+def compare(before: dict[str, Any], after: dict[str, Any], threshold: float) -> tuple[list[str], int]:
+    lines = [f"before {before['meta'].get('commit')}  after {after['meta'].get('commit')}"]
+    regressions = 0
+    after_levels = {level["concurrency"]: level for level in after["levels"]}
+    for level in before["levels"]:
+        other = after_levels.get(level["concurrency"])
+        if other is None:
+            continue
+        lines.append(f"\nconcurrency {level['concurrency']}  errors {level['errors']} -> {other['errors']}")
+        for name, operation in level["operations"].items():
+            if name not in other["operations"]:
+                continue
+            for label, path, higher_is_better in METRICS:
+                old, new = _get(operation, path), _get(other["operations"][name], path)
+                if old is None and new is None:
+                    continue
+                change = _change(old, new)
+                worse = change is not None and (-change if higher_is_better else change) > threshold
+                regressions += worse
+                shown = f"{change:+7.1f}%" if change is not None else "      -"
+                lines.append(f"  {name:<11} {label:<7} {old!s:>10} -> {new!s:>10}  {shown}{'  !' if worse else ''}")
+    return lines, regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent change flagged as a regression")
+    args = parser.parse_args()
+
+    before, after = json.loads(args.before.read_text()), json.loads(args.after.read_text())
+    lines, regressions = compare(before, after, args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n{regressions} regression(s) beyond {args.threshold:g}%")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""Stand-in for the Azure OpenAI deployments API, for load tests.
+
+Run from apps/backend:
+
+    python -m benchmarks.fake_openai --port 8100 --latency-ms 400 --tokens-per-second 60
+
+and point the API at it with ``AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8100``
+and any API key and deployment name. Chat completions (streamed or not) and
+embeddings are served. Replies take ``--latency-ms`` before the first token
+and then arrive at ``--tokens-per-second``. ``--rate-limit-ratio`` of requests
+are answered with 429 and ``Retry-After``. Exercise-generation prompts get a
+valid exercise whose tests expect the reversed input line.
+"""
+
+import argparse
+import array
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+EMBEDDING_DIMENSIONS = 256
+WORDS = (
+    "Try printing the intermediate values so you can see where the loop diverges from what you expect. "
+    "Remember that input() keeps the text as a string, and slicing with a negative step walks it backwards."
+).split()
+
+
+@dataclass
+class FakeConfig:
+    latency_ms: float = 300.0
+    jitter_ms: float = 50.0
+    tokens_per_second: float = 80.0
+    completion_tokens: int = 120
+    rate_limit_ratio: float = 0.0
+    retry_after_seconds: float = 1.0
+
+
+EXERCISE = {
+    "title": "Reverse a line",
+    "language": "python",
+    "difficulty": "easy",
+    "prompt_markdown": "### Goal\nRead one line from standard input and print it reversed.",
+    "starter_code": "line = input()\n# TODO: print the reversed line\n",
+    "tests": [
+        {"stdin": "abc", "expected_stdout": "cba"},
+        {"stdin": "racecar", "expected_stdout": "racecar"},
+        {"stdin": "hello world", "expected_stdout": "dlrow olleh"},
+    ],
+}
+
+
+def _prompt_tokens(messages: list[dict[str, Any]]) -> int:
+    return sum(len(str(message.get("content", ""))) for message in messages) // 4 + 1
+
+
+def _reply_words(messages: list[dict[str, Any]], config: FakeConfig) -> list[str]:
+    system = str(messages[0].get("content", "")) if messages else ""
+    if "Return JSON" in system:
+        exercise = dict(EXERCISE, title=f"Reverse a line #{random.randint(1, 10_000)}")
+        # Sent as one token stream like any other reply; the words rejoin into the JSON text.
+        return json.dumps(exercise).split(" ")
+    return [WORDS[index % len(WORDS)] for index in range(config.completion_tokens)]
+
+
+def _rate_limited(config: FakeConfig) -> JSONResponse | None:
+    if random.random() >= config.rate_limit_ratio:
+        return None
+    return JSONResponse(
+        {"error": {"code": "429", "message": "Rate limit is exceeded (fake)."}},
+        status_code=429,
+        headers={"Retry-After": str(config.retry_after_seconds)},
+    )
+
+
+async def _first_token_delay(config: FakeConfig) -> None:
+    delay_ms = max(0.0, random.gauss(config.latency_ms, config.jitter_ms))
+    await asyncio.sleep(delay_ms / 1000)
+
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> dict[str, int]:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+async def _stream_chunks(
+    completion_id: str, model: str, words: list[str], usage: dict[str, int] | None, config: FakeConfig
+) -> AsyncIterator[bytes]:
+    created = int(time.time())
+    interval = 1 / config.tokens_per_second if config.tokens_per_second else 0
+    for index, word in enumerate(words):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "delta": {"content": word if index == 0 else " " + word},
+                    "finish_reason": "stop" if index == len(words) - 1 else None,
+                }
+            ],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n".encode()
+        await asyncio.sleep(interval)
+    if usage:
+        final = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [],
+            "usage": usage,
+        }
+        yield f"data: {json.dumps(final)}\n\n".encode()
+    yield b"data: [DONE]\n\n"
+
+
+def create_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI(title="Fake Azure OpenAI")
+    app.state.requests = 0
+    app.state.rate_limited = 0
+
+    @app.get("/health")
+    async def health():
+        return {"requests": app.state.requests, "rate_limited": app.state.rate_limited}
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request):
+        app.state.requests += 1
+        limited = _rate_limited(config)
+        if limited:
+            app.state.rate_limited += 1
+            return limited
+
+        body = await request.json()
+        messages = body.get("messages", [])
+        words = _reply_words(messages, config)
+        usage = _usage(_prompt_tokens(messages), len(words))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        await _first_token_delay(config)
+
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+            chunks = _stream_chunks(completion_id, deployment, words, usage if include_usage else None, config)
+            return StreamingResponse(chunks, media_type="text/event-stream")
+
+        if config.tokens_per_second:
+            await asyncio.sleep(len(words) / config.tokens_per_second)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": deployment,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": usage,
+        }
+
+    @app.post("/openai/deployments/{deployment}/embeddings")
+    async def embeddings(deployment: str, request: Request):
+        app.state.requests += 1
+        limited = _rate_limited(config)
+        if limited:
+            app.state.rate_limited += 1
+            return limited
+
+        body = await request.json()
+        text = body["input"] if isinstance(body["input"], str) else " ".join(body["input"])
+        # Deterministic per text, so identical questions embed identically.
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big")
+        rng = random.Random(seed)
+        vector = [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIMENSIONS)]
+        if body.get("encoding_format") == "base64":
+            # What the openai client asks for by default: little-endian float32.
+            vector = base64.b64encode(array.array("f", vector).tobytes()).decode()
+        await _first_token_delay(config)
+        tokens = len(text) // 4 + 1
+        return {
+            "object": "list",
+            "model": deployment,
+            "data": [
+                {
+                    "object": "embedding",
+                    "index": 0,
+                    "embedding": vector,
+                }
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser, prefix: str = "") -> None:
+    """Add the fake's knobs; ``prefix`` namespaces them when embedded in another CLI."""
+
+    defaults = FakeConfig()
+    parser.add_argument(
+        f"--{prefix}latency-ms", type=float, default=defaults.latency_ms, help="Mean time to the first token"
+    )
+    parser.add_argument(f"--{prefix}jitter-ms", type=float, default=defaults.jitter_ms)
+    parser.add_argument(
+        f"--{prefix}tokens-per-second",
+        type=float,
+        default=defaults.tokens_per_second,
+        help="Streaming rate after the first token; 0 sends everything at once",
+    )
+    parser.add_argument(f"--{prefix}completion-tokens", type=int, default=defaults.completion_tokens)
+    parser.add_argument(
+        f"--{prefix}rate-limit-ratio",
+        type=float,
+        default=defaults.rate_limit_ratio,
+        help="Fraction of requests answered with 429",
+    )
+    parser.add_argument(f"--{prefix}retry-after-seconds", type=float, default=defaults.retry_after_seconds)
+
+
+def config_from_args(args: argparse.Namespace, prefix: str = "") -> FakeConfig:
+    attr = prefix.replace("-", "_")
+    return FakeConfig(
+        latency_ms=getattr(args, f"{attr}latency_ms"),
+        jitter_ms=getattr(args, f"{attr}jitter_ms"),
+        tokens_per_second=getattr(args, f"{attr}tokens_per_second"),
+        completion_tokens=getattr(args, f"{attr}completion_tokens"),
+        rate_limit_ratio=getattr(args, f"{attr}rate_limit_ratio"),
+        retry_after_seconds=getattr(args, f"{attr}retry_after_seconds"),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""Load test the API against the fake Azure OpenAI server and report latency as JSON.
+
+Run from apps/backend, with Postgres and Redis reachable through the usual
+settings (e.g. ``docker compose up db redis``):
+
+    python -m benchmarks.load --concurrency 1 8 32 --duration 30 --output before.json
+    git checkout my-branch
+    python -m benchmarks.load --concurrency 1 8 32 --duration 30 --output after.json
+    python -m benchmarks.compare before.json after.json
+
+The harness starts ``benchmarks.fake_openai`` and ``uvicorn app.main:app``
+wired to it, unless ``--base-url`` names an API that is already running. It
+creates a few exercises, then, for each concurrency level, keeps that many
+clients busy for ``--duration`` seconds. Each client picks operations by the
+``--mix`` weights. Per operation the report has p50/p95/p99 latency, TTFB for
+the SSE chat stream, throughput and errors by kind.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from . import fake_openai
+
+DEFAULT_MIX = "generate=1,run=4,submit=3,chat=2,chat_batch=1"
+SOLUTIONS = ["print(input()[::-1])", "print(''.join(reversed(input())))"]
+WRONG_SOLUTIONS = ["print(input())", "print(input().upper())", "raise SystemExit(1)"]
+QUESTIONS = [
+    "How do I reverse a string?",
+    "Why does my output not match the expected output?",
+    "What does input() return?",
+    "Can you give me a hint without the solution?",
+]
+
+
+def percentile(values: list[float], quantile: float) -> float | None:
+    """Nearest-rank percentile of ``values``."""
+
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(quantile * len(ordered))) - 1))
+    return round(ordered[index], 2)
+
+
+def summarize(values: list[float]) -> dict[str, float | None]:
+    return {
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": round(max(values), 2) if values else None,
+    }
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"Unknown operation in --mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class Recorder:
+    def __init__(self):
+        self.latency_ms: dict[str, list[float]] = defaultdict(list)
+        self.ttfb_ms: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, Counter] = defaultdict(Counter)
+
+    def report(self, elapsed: float) -> dict[str, Any]:
+        operations = {}
+        for name in sorted(set(self.latency_ms) | set(self.errors)):
+            latencies = self.latency_ms[name]
+            errors = sum(self.errors[name].values())
+            operations[name] = {
+                "count": len(latencies) + errors,
+                "errors": errors,
+                "error_kinds": dict(self.errors[name]),
+                "rps": round(len(latencies) / elapsed, 2),
+                "latency_ms": summarize(latencies),
+            }
+            if self.ttfb_ms[name]:
+                operations[name]["ttfb_ms"] = summarize(self.ttfb_ms[name])
+        ok = sum(len(values) for values in self.latency_ms.values())
+        errors = sum(sum(counter.values()) for counter in self.errors.values())
+        return {
+            "duration_seconds": round(elapsed, 2),
+            "requests": ok + errors,
+            "errors": errors,
+            "rps": round(ok / elapsed, 2),
+            "operations": operations,
+        }
+
+
+class Workload:
+    """Request builders; each returns the TTFB in ms when it is meaningful."""
+
+    def __init__(self, client: httpx.AsyncClient, exercise_ids: list[str], repeat_ratio: float):
+        self.client = client
+        self.exercise_ids = exercise_ids
+        self.repeat_ratio = repeat_ratio
+
+    def _code(self) -> str:
+        code = random.choice(SOLUTIONS if random.random() < 0.6 else WRONG_SOLUTIONS)
+        if random.random() >= self.repeat_ratio:
+            # A unique comment defeats the result cache, like a learner's edited resubmission.
+            code += f"  # {random.getrandbits(48):x}"
+        return code
+
+    def _question(self) -> str:
+        question = random.choice(QUESTIONS)
+        if random.random() >= self.repeat_ratio:
+            question += f" (attempt {random.getrandbits(32):x})"
+        return question
+
+    async def generate(self) -> None:
+        response = await self.client.post(
+            "/exercises/generate", json={"language": "python", "difficulty": random.choice(["easy", "medium"])}
+        )
+        response.raise_for_status()
+
+    async def run(self) -> None:
+        response = await self.client.post(
+            f"/exercises/{random.choice(self.exercise_ids)}/run", json={"code": self._code(), "language": "python"}
+        )
+        response.raise_for_status()
+
+    async def submit(self) -> None:
+        response = await self.client.post(
+            f"/exercises/{random.choice(self.exercise_ids)}/submit",
+            json={"code": self._code(), "language": "python", "user_id": f"bench-{random.randint(1, 50)}"},
+        )
+        response.raise_for_status()
+
+    async def chat(self) -> float | None:
+        start = time.perf_counter()
+        ttfb = None
+        payload = {"message": self._question(), "exercise_id": random.choice(self.exercise_ids)}
+        async with self.client.stream("POST", "/chat/ask", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                if event.get("type") == "message" and ttfb is None:
+                    ttfb = (time.perf_counter() - start) * 1000
+                elif event.get("type") == "error":
+                    raise RuntimeError(event.get("detail") or "stream error")
+        return ttfb
+
+    async def chat_batch(self) -> None:
+        payload = {"message": self._question(), "exercise_id": random.choice(self.exercise_ids)}
+        response = await self.client.post("/chat/ask/batch", json=payload)
+        response.raise_for_status()
+
+
+OPERATIONS = {
+    "generate": Workload.generate,
+    "run": Workload.run,
+    "submit": Workload.submit,
+    "chat": Workload.chat,
+    "chat_batch": Workload.chat_batch,
+}
+
+
+def _error_kind(exc: Exception) -> str:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return f"http_{exc.response.status_code}"
+    return type(exc).__name__
+
+
+async def run_level(workload: Workload, mix: dict[str, float], concurrency: int, duration: float) -> dict[str, Any]:
+    recorder = Recorder()
+    names, weights = list(mix), list(mix.values())
+    deadline = time.perf_counter() + duration
+
+    async def client_loop() -> None:
+        while time.perf_counter() < deadline:
+            name = random.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                ttfb = await OPERATIONS[name](workload)
+            except Exception as exc:  # noqa: BLE001 - counted, the load keeps going
+                recorder.errors[name][_error_kind(exc)] += 1
+                continue
+            recorder.latency_ms[name].append((time.perf_counter() - start) * 1000)
+            if ttfb is not None:
+                recorder.ttfb_ms[name].append(ttfb)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return {"concurrency": concurrency, **recorder.report(time.perf_counter() - start)}
+
+
+async def create_exercises(client: httpx.AsyncClient, count: int) -> list[str]:
+    ids = []
+    for index in range(count):
+        # Distinct topics so the requests are not coalesced into one exercise.
+        response = await client.post("/exercises/generate", json={"language": "python", "topic": f"bench {index}"})
+        response.raise_for_status()
+        ids.append(response.json()["id"])
+    return ids
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{url} exited with code {process.returncode} during startup")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+
+def start_servers(args: argparse.Namespace) -> tuple[str, list[subprocess.Popen]]:
+    backend_dir = Path(__file__).resolve().parent.parent
+    fake_port = _free_port()
+    fake_cmd = [sys.executable, "-m", "benchmarks.fake_openai", "--port", str(fake_port)]
+    for name, value in asdict(fake_openai.config_from_args(args, prefix="llm-")).items():
+        fake_cmd += [f"--{name.replace('_', '-')}", str(value)]
+    processes = [subprocess.Popen(fake_cmd, cwd=backend_dir)]
+    _wait_until_up(f"http://127.0.0.1:{fake_port}/health", processes[0])
+
+    api_port = _free_port()
+    env = {
+        **os.environ,
+        "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{fake_port}",
+        "AZURE_OPENAI_API_KEY": "benchmark",
+        "AZURE_OPENAI_DEPLOYMENT": "bench-chat",
+        "AZURE_OPENAI_EMBEDDING_DEPLOYMENT": "bench-embedding" if args.embeddings else "",
+    }
+    api_cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(api_port)]
+    api_cmd += ["--workers", str(args.workers), "--log-level", "warning"]
+    processes.append(subprocess.Popen(api_cmd, cwd=backend_dir, env=env))
+    _wait_until_up(f"http://127.0.0.1:{api_port}/health", processes[1])
+    return f"http://127.0.0.1:{api_port}", processes
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def benchmark(args: argparse.Namespace, base_url: str) -> dict[str, Any]:
+    mix = parse_mix(args.mix)
+    limits = httpx.Limits(max_connections=max(args.concurrency) + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        workload = Workload(client, await create_exercises(client, args.exercises), args.repeat_ratio)
+        if args.warmup:
+            await run_level(workload, mix, min(args.concurrency), args.warmup)
+        levels = []
+        for concurrency in args.concurrency:
+            level = await run_level(workload, mix, concurrency, args.duration)
+            print(
+                f"concurrency {concurrency:>4}: {level['rps']:8.1f} rps, {level['errors']} errors",
+                file=sys.stderr,
+            )
+            levels.append(level)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "base_url": base_url,
+            "args": {name: value for name, value in vars(args).items() if name != "output"},
+        },
+        "levels": levels,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per concurrency level")
+    parser.add_argument("--warmup", type=float, default=5, help="Unreported seconds before the first level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Operation weights, e.g. run=4,chat=1")
+    parser.add_argument(
+        "--repeat-ratio",
+        type=float,
+        default=0.5,
+        help="Share of code and questions drawn from a small fixed set, and so eligible for cache hits",
+    )
+    parser.add_argument("--exercises", type=int, default=5, help="Exercises created for run/submit/chat")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--base-url", help="Benchmark an API that is already running instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers of the started API")
+    parser.add_argument("--embeddings", action="store_true", help="Enable the chat cache's similarity tier")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    fake_openai.add_arguments(parser, prefix="llm-")
+    args = parser.parse_args()
+
+    processes: list[subprocess.Popen] = []
+    base_url = args.base_url
+    try:
+        if not base_url:
+            base_url, processes = start_servers(args)
+        report = asyncio.run(benchmark(args, base_url))
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=30)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
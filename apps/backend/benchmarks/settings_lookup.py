@@ -0,0 +1,38 @@
+"""Compare building ``Settings()`` per call with the memoized ``get_settings()``.
+
+Run from apps/backend:
+
+    python -m benchmarks.settings_lookup
+
+Requests such as ``/chat/ask`` look settings up several times (services, LLM
+client, caches), so the per-request saving is roughly the per-call saving times
+the number of lookups.
+"""
+
+import argparse
+import timeit
+
+from app.config import Settings, get_settings
+
+
+def measure(label: str, fn, number: int) -> float:
+    per_call = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"{label:<24} {per_call * 1e6:10.2f} us/call")
+    return per_call
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--lookups-per-request", type=int, default=8)
+    args = parser.parse_args()
+
+    get_settings()
+    uncached = measure("Settings()", Settings, args.number)
+    cached = measure("get_settings()", get_settings, args.number * 100)
+    saved = (uncached - cached) * args.lookups_per_request
+    print(f"speedup {uncached / cached:,.0f}x; ~{saved * 1e3:.2f} ms saved per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Measure API cold start: import time, time to /health and time to /ready.
+
+Run from apps/backend, with Postgres reachable through the usual settings:
+
+    python -m benchmarks.startup --runs 5 --output before.json
+    git checkout my-branch
+    python -m benchmarks.startup --runs 5 --output after.json --against before.json
+
+Every run uses a fresh interpreter. ``import_ms`` is the time to import
+``app.main``. ``health_ms`` and ``ready_ms`` are measured from spawning
+``uvicorn app.main:app`` until ``/health`` and ``/ready`` first answer 200.
+Builds without ``/ready`` count as ready once ``/health`` answers. Azure OpenAI
+settings are blanked unless ``--azure-configured`` is given. With
+``--against``, the medians are printed next to an earlier report's.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from .load import _free_port, _git_commit
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+IMPORT_SNIPPET = (
+    "import sys, time; start = time.perf_counter(); import app.main; "
+    "print((time.perf_counter() - start) * 1000, 'openai' in sys.modules)"
+)
+
+
+def _env(args: argparse.Namespace) -> dict[str, str]:
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    if args.azure_configured:
+        env.update(
+            AZURE_OPENAI_ENDPOINT="http://127.0.0.1:9",
+            AZURE_OPENAI_API_KEY="benchmark",
+            AZURE_OPENAI_DEPLOYMENT="bench-chat",
+        )
+    else:
+        for name in ("AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_API_KEY", "AZURE_OPENAI_DEPLOYMENT"):
+            env[name] = ""
+        env["AZURE_OPENAI_DEPLOYMENTS"] = "[]"
+    return env
+
+
+def measure_import(env: dict[str, str]) -> tuple[float, bool]:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout.split()
+    return float(output[-2]), output[-1] == "True"
+
+
+def _status(url: str) -> int | None:
+    try:
+        return httpx.get(url, timeout=1).status_code
+    except httpx.HTTPError:
+        return None
+
+
+def measure_boot(env: dict[str, str], timeout: float) -> dict[str, float]:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    timings: dict[str, float] = {}
+    try:
+        while "ready_ms" not in timings:
+            if process.poll() is not None:
+                raise SystemExit(f"uvicorn exited with code {process.returncode} during startup")
+            if time.perf_counter() - start > timeout:
+                raise SystemExit(f"The API did not become ready within {timeout}s")
+            if "health_ms" not in timings and _status(f"{base_url}/health") == 200:
+                timings["health_ms"] = (time.perf_counter() - start) * 1000
+            if "health_ms" in timings:
+                ready = _status(f"{base_url}/ready")
+                if ready in (200, 404):
+                    timings["ready_ms"] = (time.perf_counter() - start) * 1000 if ready == 200 else timings["health_ms"]
+                    break
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return timings
+
+
+def _summary(values: list[float]) -> dict[str, float]:
+    return {
+        "min": round(min(values), 1),
+        "median": round(statistics.median(values), 1),
+        "max": round(max(values), 1),
+    }
+
+
+def benchmark(args: argparse.Namespace) -> dict[str, Any]:
+    env = _env(args)
+    imports, openai_loaded, boots = [], False, []
+    for run in range(args.runs):
+        import_ms, openai_loaded = measure_import(env)
+        imports.append(import_ms)
+        boots.append(measure_boot(env, args.timeout))
+        print(
+            f"run {run + 1}: import {import_ms:.0f} ms, health {boots[-1]['health_ms']:.0f} ms, "
+            f"ready {boots[-1]['ready_ms']:.0f} ms",
+            file=sys.stderr,
+        )
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "args": {name: value for name, value in vars(args).items() if name not in ("output", "against")},
+        },
+        "openai_imported_by_app_main": openai_loaded,
+        "import_ms": _summary(imports),
+        "health_ms": _summary([boot["health_ms"] for boot in boots]),
+        "ready_ms": _summary([boot["ready_ms"] for boot in boots]),
+    }
+
+
+def print_comparison(before: dict[str, Any], after: dict[str, Any]) -> None:
+    print(f"{'median':<10} {'before':>10} {'after':>10} {'change':>8}")
+    for metric in ("import_ms", "health_ms", "ready_ms"):
+        old, new = before[metric]["median"], after[metric]["median"]
+        change = f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+        print(f"{metric:<10} {old:>10.1f} {new:>10.1f} {change:>8}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for /ready per run")
+    parser.add_argument(
+        "--azure-configured", action="store_true", help="Boot with (dummy) Azure OpenAI credentials set"
+    )
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--against", help="An earlier report to compare the medians with")
+    args = parser.parse_args()
+
+    report = benchmark(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+    if args.against:
+        print_comparison(json.loads(Path(args.against).read_text()), report)
+
+
+if __name__ == "__main__":
+    main()
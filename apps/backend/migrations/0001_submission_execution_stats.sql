@@ -0,0 +1,4 @@
+-- Execution metadata recorded by the sandbox for each run/submit.
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS exit_code INTEGER;
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS outcome VARCHAR(32);
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS peak_memory_kb INTEGER;
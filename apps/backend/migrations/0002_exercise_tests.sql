@@ -0,0 +1,2 @@
+-- Test suite graded by /exercises/{id}/submit.
+ALTER TABLE exercises ADD COLUMN IF NOT EXISTS tests JSONB NOT NULL DEFAULT '[]'::jsonb;
@@ -0,0 +1,2 @@
+-- Bumped whenever an exercise's test suite changes; part of the result cache key.
+ALTER TABLE exercises ADD COLUMN IF NOT EXISTS tests_version INTEGER NOT NULL DEFAULT 1;
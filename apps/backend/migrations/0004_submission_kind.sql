@@ -0,0 +1,30 @@
+-- One row per run/submit, tagged with its kind.
+--
+-- Submissions used to be written twice: a "ran" row from the inner run and a
+-- graded row with the same code and output. Remove the "ran" half of each pair
+-- (only the nearest preceding "ran" row, so separate runs of the same code
+-- survive) and backfill the kind of the remaining rows.
+BEGIN;
+
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS kind VARCHAR(16) NOT NULL DEFAULT 'run';
+
+DELETE FROM submissions
+WHERE id IN (
+    SELECT DISTINCT ON (graded.id) ran.id
+    FROM submissions AS graded
+    JOIN submissions AS ran
+      ON ran.status = 'ran'
+     AND ran.exercise_id = graded.exercise_id
+     AND ran.language = graded.language
+     AND ran.code = graded.code
+     AND ran.stdout = graded.stdout
+     AND ran.stderr = graded.stderr
+     AND ran.created_at <= graded.created_at
+     AND graded.created_at - ran.created_at < INTERVAL '5 seconds'
+    WHERE graded.status IN ('passed', 'failed')
+    ORDER BY graded.id, ran.created_at DESC
+);
+
+UPDATE submissions SET kind = 'submit' WHERE status IN ('passed', 'failed') AND kind <> 'submit';
+
+COMMIT;
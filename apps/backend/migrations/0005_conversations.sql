@@ -0,0 +1,22 @@
+-- Server-side tutor conversations.
+CREATE TABLE IF NOT EXISTS conversations (
+    id UUID PRIMARY KEY,
+    exercise_id UUID REFERENCES exercises (id) ON DELETE SET NULL,
+    summary TEXT,
+    summary_tokens INTEGER NOT NULL DEFAULT 0,
+    summarized_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS chat_messages (
+    id UUID PRIMARY KEY,
+    conversation_id UUID NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    role VARCHAR(16) NOT NULL,
+    content TEXT NOT NULL,
+    token_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_chat_messages_conversation_id ON chat_messages (conversation_id);
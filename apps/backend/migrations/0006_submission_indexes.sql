@@ -0,0 +1,9 @@
+-- Indexes for submission history and status analytics.
+--
+-- CONCURRENTLY avoids locking writes on a large table; it cannot run inside a
+-- transaction block, so apply this file without BEGIN/COMMIT.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_submissions_exercise_id_created_at
+    ON submissions (exercise_id, created_at DESC, id DESC);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_submissions_status_created_at
+    ON submissions (status, created_at);
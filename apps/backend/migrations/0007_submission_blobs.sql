@@ -0,0 +1,8 @@
+-- Large code/output moves to the content-addressed blob store; the row keeps
+-- a preview, the blob's SHA-256 and the full size in bytes.
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS code_blob VARCHAR(64);
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS code_bytes INTEGER;
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS stdout_blob VARCHAR(64);
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS stdout_bytes INTEGER;
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS stderr_blob VARCHAR(64);
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS stderr_bytes INTEGER;
@@ -0,0 +1,64 @@
+-- Partition submissions by month on created_at and keep monthly rollups.
+--
+-- The table is rebuilt as a partitioned table: one partition per month that
+-- already has rows, through two months ahead, plus a default partition. Later
+-- months are created by `python -m app.migrate` and by the
+-- maintain-submission-partitions beat job, which also archives months past
+-- SUBMISSION_RETENTION_MONTHS.
+-- Run during a quiet period: existing rows are copied inside the transaction.
+BEGIN;
+
+ALTER TABLE submissions RENAME TO submissions_unpartitioned;
+ALTER TABLE submissions_unpartitioned RENAME CONSTRAINT submissions_pkey TO submissions_unpartitioned_pkey;
+ALTER TABLE submissions_unpartitioned
+    RENAME CONSTRAINT submissions_exercise_id_fkey TO submissions_unpartitioned_exercise_id_fkey;
+
+CREATE TABLE submissions (
+    LIKE submissions_unpartitioned INCLUDING DEFAULTS,
+    PRIMARY KEY (id, created_at),
+    FOREIGN KEY (exercise_id) REFERENCES exercises (id) ON DELETE CASCADE
+) PARTITION BY RANGE (created_at);
+
+CREATE TABLE submissions_default PARTITION OF submissions DEFAULT;
+
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', COALESCE((SELECT min(created_at) FROM submissions_unpartitioned), now())),
+            date_trunc('month', now()) + INTERVAL '2 months',
+            INTERVAL '1 month'
+        )::date
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF submissions FOR VALUES FROM (%L) TO (%L)',
+            'submissions_' || to_char(month, 'YYYY_MM'),
+            month,
+            (month + INTERVAL '1 month')::date
+        );
+    END LOOP;
+END
+$$;
+
+INSERT INTO submissions SELECT * FROM submissions_unpartitioned;
+DROP TABLE submissions_unpartitioned;
+
+-- Recreated on the partitioned parent; each partition gets its own copy.
+CREATE INDEX ix_submissions_exercise_id_created_at ON submissions (exercise_id, created_at DESC, id DESC);
+CREATE INDEX ix_submissions_status_created_at ON submissions (status, created_at);
+
+CREATE TABLE IF NOT EXISTS submission_monthly_stats (
+    exercise_id UUID NOT NULL REFERENCES exercises (id) ON DELETE CASCADE,
+    month DATE NOT NULL,
+    kind VARCHAR(16) NOT NULL,
+    attempts INTEGER NOT NULL,
+    passes INTEGER NOT NULL,
+    avg_score DOUBLE PRECISION,
+    median_duration_ms DOUBLE PRECISION,
+    p95_duration_ms DOUBLE PRECISION,
+    PRIMARY KEY (exercise_id, month, kind)
+);
+
+COMMIT;
@@ -0,0 +1,86 @@
+-- Incrementally maintained submit statistics (see app/stats.py). Existing
+-- submits are folded into exercise_stats once; user_stats starts empty because
+-- older submissions carry no user_id.
+BEGIN;
+
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS user_id VARCHAR(128);
+
+CREATE TABLE IF NOT EXISTS exercise_stats (
+    exercise_id UUID PRIMARY KEY REFERENCES exercises(id) ON DELETE CASCADE,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    passes INTEGER NOT NULL DEFAULT 0,
+    score_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    score_histogram INTEGER[] NOT NULL,
+    duration_histogram INTEGER[] NOT NULL,
+    updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id VARCHAR(128) NOT NULL,
+    language VARCHAR(64) NOT NULL,
+    difficulty VARCHAR(32) NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    passes INTEGER NOT NULL DEFAULT 0,
+    score_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, language, difficulty)
+);
+
+WITH submits AS (
+    SELECT
+        exercise_id,
+        status,
+        score,
+        LEAST(10, GREATEST(0, round(score * 10)))::int AS score_bucket,
+        CASE
+            WHEN duration_ms < 1 THEN 0
+            ELSE LEAST(63, floor(log(2, duration_ms::numeric) * 4)::int + 1)
+        END AS duration_bucket
+    FROM submissions
+    WHERE kind = 'submit'
+),
+totals AS (
+    SELECT
+        exercise_id,
+        count(*) AS attempts,
+        count(*) FILTER (WHERE status = 'passed') AS passes,
+        coalesce(sum(score), 0) AS score_sum
+    FROM submits
+    GROUP BY exercise_id
+),
+score_buckets AS (
+    SELECT exercise_id, score_bucket AS bucket, count(*) AS n
+    FROM submits
+    GROUP BY 1, 2
+),
+duration_buckets AS (
+    SELECT exercise_id, duration_bucket AS bucket, count(*) AS n
+    FROM submits
+    GROUP BY 1, 2
+),
+score_counts AS (
+    SELECT totals.exercise_id, array_agg(coalesce(score_buckets.n, 0)::int ORDER BY bucket) AS histogram
+    FROM totals
+    CROSS JOIN generate_series(0, 10) AS bucket
+    LEFT JOIN score_buckets USING (exercise_id, bucket)
+    GROUP BY totals.exercise_id
+),
+duration_counts AS (
+    SELECT totals.exercise_id, array_agg(coalesce(duration_buckets.n, 0)::int ORDER BY bucket) AS histogram
+    FROM totals
+    CROSS JOIN generate_series(0, 63) AS bucket
+    LEFT JOIN duration_buckets USING (exercise_id, bucket)
+    GROUP BY totals.exercise_id
+)
+INSERT INTO exercise_stats (
+    exercise_id, attempts, passes, score_sum, score_histogram, duration_histogram, updated_at
+)
+SELECT
+    totals.exercise_id, totals.attempts, totals.passes, totals.score_sum,
+    score_counts.histogram, duration_counts.histogram, now()
+FROM totals
+JOIN score_counts USING (exercise_id)
+JOIN duration_counts USING (exercise_id)
+ON CONFLICT (exercise_id) DO NOTHING;
+
+COMMIT;
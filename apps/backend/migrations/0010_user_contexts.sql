@@ -0,0 +1,7 @@
+-- Persisted learner contexts served by /user-context.
+CREATE TABLE IF NOT EXISTS user_contexts (
+    user_id VARCHAR(128) PRIMARY KEY,
+    data JSONB NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP NOT NULL
+);